@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("uvicorn")
+
+# Tools with side effects on shared files run one after another, in call order
+SERIAL_TOOLS = {"write_file", "delete_file"}
+
+# Gemini round trips and tool calls run here, never on the event loop
+AGENT_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("AGENT_WORKERS", "16")),
+    thread_name_prefix="agent",
+)
+
+def sse(text: str) -> str:
+    """Formats text as one SSE event. Multi-line text becomes multiple data: lines."""
+    return "".join(f"data: {line}\n" for line in text.split("\n")) + "\n"
+
+def _chunk_texts(chunk):
+    try:
+        parts = chunk.candidates[0].content.parts
+    except (AttributeError, IndexError):
+        return
+    for part in parts:
+        if getattr(part, "text", None):
+            yield part.text
+
+def function_calls(response) -> list:
+    """All function_call parts of a (resolved) model response."""
+    try:
+        parts = response.candidates[0].content.parts
+    except (AttributeError, IndexError):
+        return []
+    return [part.function_call for part in parts if getattr(part, "function_call", None)]
+
+async def stream_message(chat_session, content):
+    """
+    Sends `content` with stream=True on a worker thread and forwards the model
+    output as it arrives. Yields ("text", str) for every text chunk, then a
+    final ("response", response) with the fully resolved response.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def emit(kind, value):
+        loop.call_soon_threadsafe(queue.put_nowait, (kind, value))
+
+    def worker():
+        try:
+            response = chat_session.send_message(content, stream=True)
+            for chunk in response:
+                for text in _chunk_texts(chunk):
+                    emit("text", text)
+            emit("response", response)
+        except Exception as e:
+            emit("error", e)
+
+    future = loop.run_in_executor(AGENT_EXECUTOR, worker)
+    while True:
+        kind, value = await queue.get()
+        if kind == "error":
+            raise value
+        yield kind, value
+        if kind == "response":
+            break
+    await future
+
+async def run_tool(tool_map: dict, name: str, args: dict):
+    """Runs one tool from the tool map on the agent executor."""
+    if name not in tool_map:
+        return f"Error: Tool '{name}' not found."
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(AGENT_EXECUTOR, lambda: tool_map[name](**args))
+    except Exception as e:
+        return f"Error executing tool: {e}"
+
+async def run_tools(tool_map: dict, calls: list) -> list:
+    """
+    Runs every (name, args) call of one model turn and returns the results in
+    call order. Independent tools run concurrently; SERIAL_TOOLS keep their
+    relative order in a single chain that runs alongside the others.
+    """
+    results = [None] * len(calls)
+
+    async def run_at(index):
+        name, args = calls[index]
+        results[index] = await run_tool(tool_map, name, args)
+
+    async def run_serial(indexes):
+        for index in indexes:
+            await run_at(index)
+
+    serial = [i for i, (name, _) in enumerate(calls) if name in SERIAL_TOOLS]
+    jobs = [run_at(i) for i in range(len(calls)) if i not in serial]
+    if serial:
+        jobs.append(run_serial(serial))
+    await asyncio.gather(*jobs)
+    return results
@@ -0,0 +1,179 @@
+import json
+import os
+import threading
+import time
+import uuid
+
+from db import connect, DB_FILE
+
+# Executed/denied requests older than this move to the archive table (seconds)
+APPROVAL_TTL = int(os.getenv("APPROVAL_TTL", str(7 * 24 * 3600)))
+# Archived requests are deleted for good after this (seconds)
+ARCHIVE_RETENTION = int(os.getenv("APPROVAL_ARCHIVE_RETENTION", str(90 * 24 * 3600)))
+# Page size limits for GET /approvals
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Job output kept on an executed request
+MAX_RESULT_CHARS = 20000
+
+# Identifies this server process; a pid is not enough (the same pid comes back after a container restart)
+BOOT_ID = uuid.uuid4().hex
+# The process running an approved job refreshes its request this often (seconds)
+HEARTBEAT_INTERVAL = 30
+# An approved request of another process not refreshed for this long lost its job
+ORPHAN_AFTER = 3 * HEARTBEAT_INTERVAL
+
+# Statuses that are final, i.e. eligible for archiving
+FINISHED = ("EXECUTED", "DENIED", "FAILED")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS approvals (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_approvals_status_created ON approvals (status, created_at);
+CREATE INDEX IF NOT EXISTS idx_approvals_created ON approvals (created_at);
+CREATE TABLE IF NOT EXISTS approvals_archive (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_approvals_archive_updated ON approvals_archive (updated_at);
+"""
+
+class ApprovalStore:
+    """
+    Durable approval queue in SQLite. Each request is a JSON document with
+    its status and timestamps pulled out into indexed columns, so pending
+    lookups and paginated listings stay cheap however long the history gets.
+    """
+
+    def __init__(self, path: str = DB_FILE):
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        self._conn.executescript(_SCHEMA)
+
+    @staticmethod
+    def _record(row) -> dict:
+        return json.loads(row["data"])
+
+    def add(self, request: dict) -> dict:
+        """Stores a new request (must carry `id` and `status`)."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO approvals (id, status, created_at, updated_at, data) VALUES (?, ?, ?, ?, ?)",
+                (request["id"], request["status"], now, now, json.dumps(request)),
+            )
+        return request
+
+    def get(self, request_id: str):
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM approvals WHERE id = ?", (request_id,)).fetchone()
+        return self._record(row) if row else None
+
+    def update(self, request_id: str, expected_status: str = None, updated_before: float = None, **fields):
+        """
+        Merges `fields` into a request and returns it, or None if it does not
+        exist (or its status is not `expected_status`, or it was updated after
+        `updated_before`, when given).
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT data, updated_at FROM approvals WHERE id = ?", (request_id,)).fetchone()
+                request = self._record(row) if row else None
+                if request is None or (expected_status and request["status"] != expected_status) \
+                        or (updated_before is not None and row["updated_at"] >= updated_before):
+                    self._conn.execute("ROLLBACK")
+                    return None
+                request.update(fields)
+                self._conn.execute(
+                    "UPDATE approvals SET status = ?, updated_at = ?, data = ? WHERE id = ?",
+                    (request["status"], time.time(), json.dumps(request), request_id),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return request
+
+    def heartbeat(self, worker: str = BOOT_ID) -> int:
+        """Refreshes the APPROVED requests whose job runs in this process. Returns how many."""
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE approvals SET updated_at = ? WHERE status = 'APPROVED' AND json_extract(data, '$.worker') = ?",
+                (time.time(), worker),
+            ).rowcount
+
+    def fail_orphaned(self, worker: str = BOOT_ID, orphan_after: float = ORPHAN_AFTER) -> list:
+        """
+        Marks APPROVED requests whose job ran in another server process that
+        stopped refreshing them (it crashed or was restarted mid-job) as
+        FAILED. Returns them.
+        """
+        stale_before = time.time() - orphan_after
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM approvals WHERE status = 'APPROVED' AND updated_at < ?", (stale_before,)
+            ).fetchall()
+        failed = []
+        for request in map(self._record, rows):
+            if request.get("worker") == worker:
+                continue
+            request = self.update(request["id"], expected_status="APPROVED", updated_before=stale_before, status="FAILED",
+                                  job_status="interrupted", result="Interrupted: the server stopped before the job finished.")
+            if request:
+                failed.append(request)
+        return failed
+
+    def list(self, status: str = None, limit: int = DEFAULT_PAGE_SIZE, offset: int = 0) -> tuple:
+        """One page of requests, newest first. Returns (requests, total matching)."""
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        offset = max(0, offset)
+        where, params = ("WHERE status = ?", (status,)) if status else ("", ())
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM approvals {where}", params).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT data FROM approvals {where} ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                params + (limit, offset),
+            ).fetchall()
+        return [self._record(row) for row in rows], total
+
+    def archive(self, ttl: int = APPROVAL_TTL, retention: int = ARCHIVE_RETENTION) -> int:
+        """
+        Moves finished requests not touched for `ttl` seconds to the archive
+        table and purges archived ones older than `retention`. Returns the
+        number of requests archived.
+        """
+        now = time.time()
+        placeholders = ",".join("?" * len(FINISHED))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    f"INSERT OR REPLACE INTO approvals_archive SELECT * FROM approvals "
+                    f"WHERE status IN ({placeholders}) AND updated_at < ?",
+                    FINISHED + (now - ttl,),
+                )
+                archived = self._conn.execute(
+                    f"DELETE FROM approvals WHERE status IN ({placeholders}) AND updated_at < ?",
+                    FINISHED + (now - ttl,),
+                ).rowcount
+                self._conn.execute("DELETE FROM approvals_archive WHERE updated_at < ?", (now - retention,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return archived
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM approvals GROUP BY status").fetchall())
+            archived = self._conn.execute("SELECT COUNT(*) FROM approvals_archive").fetchone()[0]
+        return {"by_status": counts, "archived": archived}
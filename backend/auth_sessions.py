@@ -0,0 +1,116 @@
+import hashlib
+import os
+import secrets
+import threading
+import time
+
+from db import connect, DB_FILE
+
+# Idle time after which a login expires (seconds); every request slides it
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(12 * 3600)))
+# Expiry is pushed back in the database at most this often per token
+TOUCH_INTERVAL = 60
+# Seconds a worker trusts its cached view of a token before re-reading the
+# database (bounds how long a logout in another worker takes to apply)
+CACHE_SECONDS = 30
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    token_hash TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at);
+"""
+
+def _hash(token: str) -> str:
+    # Only hashes are stored: a leaked database holds no usable tokens
+    return hashlib.sha256(token.encode()).hexdigest()
+
+class SessionStore:
+    """
+    Login sessions with a sliding TTL, kept in SQLite so every uvicorn worker
+    sees the same logins. Each worker caches validated tokens in a dict, so
+    the auth check on the hot path is a dict lookup; the database is read
+    on a cache miss and written only to slide the expiry.
+    """
+
+    def __init__(self, path: str = DB_FILE, ttl: int = SESSION_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        self._conn.executescript(_SCHEMA)
+        self._cache = {}    # token hash -> (expires_at, cached_at)
+
+    def create(self) -> str:
+        token = secrets.token_hex(16)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (token_hash, created_at, expires_at) VALUES (?, ?, ?)",
+                (_hash(token), now, now + self.ttl),
+            )
+            self._cache[_hash(token)] = (now + self.ttl, now)
+        return token
+
+    def cached(self, token: str):
+        """
+        validate()'s answer when it needs no database access (cached, fresh,
+        no expiry to slide yet), else None: then call validate() off the event loop.
+        """
+        if not token:
+            return False
+        now = time.time()
+        cached = self._cache.get(_hash(token))
+        if cached is None or now - cached[1] > CACHE_SECONDS:
+            return None
+        expires_at = cached[0]
+        if expires_at <= now or now + self.ttl - expires_at >= TOUCH_INTERVAL:
+            return None
+        return True
+
+    def validate(self, token: str) -> bool:
+        """True if the token belongs to a live session; slides its expiry."""
+        if not token:
+            return False
+        key = _hash(token)
+        now = time.time()
+        cached = self._cache.get(key)
+        if cached is None or now - cached[1] > CACHE_SECONDS:
+            with self._lock:
+                row = self._conn.execute("SELECT expires_at FROM sessions WHERE token_hash = ?", (key,)).fetchone()
+            if row is None:
+                self._cache.pop(key, None)
+                return False
+            cached = self._cache[key] = (row["expires_at"], now)
+
+        expires_at, cached_at = cached
+        if expires_at <= now:
+            self._cache.pop(key, None)
+            return False
+        if now + self.ttl - expires_at >= TOUCH_INTERVAL:
+            with self._lock:
+                self._conn.execute("UPDATE sessions SET expires_at = ? WHERE token_hash = ?", (now + self.ttl, key))
+            self._cache[key] = (now + self.ttl, cached_at)
+        return True
+
+    def revoke(self, token: str):
+        key = _hash(token)
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE token_hash = ?", (key,))
+        self._cache.pop(key, None)
+
+    def sweep(self) -> int:
+        """Deletes expired sessions and stale cache entries. Returns the number removed."""
+        now = time.time()
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,)).rowcount
+        for key, (expires_at, cached_at) in list(self._cache.items()):
+            if expires_at <= now or now - cached_at > CACHE_SECONDS:
+                self._cache.pop(key, None)
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            active = self._conn.execute("SELECT COUNT(*) FROM sessions WHERE expires_at > ?", (time.time(),)).fetchone()[0]
+        return {"active": active, "cached": len(self._cache), "ttl": self.ttl}
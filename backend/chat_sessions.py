@@ -0,0 +1,129 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Live chat sessions kept in memory (least recently used are evicted first)
+MAX_CHAT_SESSIONS = int(os.getenv("CHAT_SESSION_LIMIT", "50"))
+# Idle seconds after which a conversation is dropped
+CHAT_SESSION_TTL = int(os.getenv("CHAT_SESSION_TTL", "3600"))
+
+# Background incidents get their own conversation, never evicted
+WATCHDOG_KEY = ("watchdog", "incidents")
+
+def session_key(token: str = None, conversation_id: str = None) -> tuple:
+    """Pool key for a dashboard conversation. The auth token is only kept hashed."""
+    owner = hashlib.sha256(token.encode()).hexdigest()[:16] if token else "anonymous"
+    return (owner, conversation_id or "default")
+
+class ChatEntry:
+    def __init__(self, session, generation: int = 0):
+        self.session = session
+        # Model generation the session was started on (see ChatSessionPool.rebind)
+        self.generation = generation
+        # One turn at a time per conversation; other conversations run in parallel
+        self.lock = asyncio.Lock()
+        self.created = time.time()
+        self.last_used = self.created
+        # History size metrics, refreshed after every turn (see history.compact_history)
+        self.history_tokens = 0
+        self.history_messages = 0
+        self.compactions = 0
+
+    def update_history(self, metrics: dict):
+        self.history_tokens = metrics["tokens"]
+        self.history_messages = metrics["messages"]
+        if metrics["folded"]:
+            self.compactions += 1
+
+class ChatSessionPool:
+    """
+    Chat sessions keyed by (owner, conversation id) with LRU + idle-TTL eviction
+    and a cap on live sessions. Sessions busy with a turn are never evicted.
+    """
+
+    def __init__(self, start_chat, max_sessions: int = MAX_CHAT_SESSIONS, ttl: int = CHAT_SESSION_TTL):
+        # start_chat(history=None) -> new chat session on the current model
+        self.start_chat = start_chat
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.evictions = 0
+        self.generation = 0
+
+    def get(self, key: tuple) -> ChatEntry:
+        """Returns the session entry for `key`, creating it if needed."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = ChatEntry(self.start_chat(), self.generation)
+            entry.last_used = time.time()
+            self._entries.move_to_end(key)
+            self._evict()
+            return entry
+
+    def _evict(self):
+        now = time.time()
+        for key, entry in list(self._entries.items()):
+            if key != WATCHDOG_KEY and not entry.lock.locked() and now - entry.last_used > self.ttl:
+                del self._entries[key]
+                self.evictions += 1
+        # Still over the cap: drop least recently used idle sessions
+        for key, entry in list(self._entries.items()):
+            if len(self._entries) <= self.max_sessions:
+                break
+            if key != WATCHDOG_KEY and not entry.lock.locked():
+                del self._entries[key]
+                self.evictions += 1
+
+    def sweep(self):
+        """Drops idle sessions past their TTL."""
+        with self._lock:
+            self._evict()
+
+    def clear(self):
+        """Forgets every session (they restart with the current model)."""
+        with self._lock:
+            self._entries.clear()
+
+    def rebind(self):
+        """
+        Marks every session as started on an outdated model. Each one moves to
+        the new model, keeping its history, the next time it runs a turn.
+        """
+        with self._lock:
+            self.generation += 1
+
+    def session_for(self, entry: ChatEntry):
+        """The entry's chat session on the current model. Call while holding entry.lock."""
+        if entry.generation != self.generation:
+            entry.session = self.start_chat(history=list(entry.session.history))
+            entry.generation = self.generation
+        return entry.session
+
+    def stats(self) -> dict:
+        now = time.time()
+        with self._lock:
+            return {
+                "live": len(self._entries),
+                "max": self.max_sessions,
+                "ttl": self.ttl,
+                "evictions": self.evictions,
+                "history_tokens": sum(entry.history_tokens for entry in self._entries.values()),
+                "sessions": [
+                    {
+                        "owner": key[0],
+                        "conversation_id": key[1],
+                        "busy": entry.lock.locked(),
+                        "age": round(now - entry.created),
+                        "idle": round(now - entry.last_used),
+                        "history_tokens": entry.history_tokens,
+                        "history_messages": entry.history_messages,
+                        "compactions": entry.compactions,
+                    }
+                    for key, entry in self._entries.items()
+                ],
+            }
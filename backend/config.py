@@ -0,0 +1,201 @@
+import copy
+import json
+import logging
+import os
+import shlex
+import threading
+import time
+
+from monitoring import MONITOR_TYPES
+from rules import compile_rules
+
+logger = logging.getLogger("uvicorn")
+
+CONFIG_FILE = "config.json"
+# How often (seconds) the hot path is allowed to stat config.json for changes
+CHECK_INTERVAL = 1.0
+
+_lock = threading.Lock()
+_cache = {
+    "stamp": None,      # (mtime_ns, size) of the parsed file
+    "checked": 0.0,     # monotonic time of the last stat
+    "raw": None,        # migrated config as stored on disk
+    "compiled": None,   # validated config with monitor pipelines pre-parsed
+}
+
+def compile_command(command: str) -> tuple:
+    """
+    Parses a monitor command into an argv pipeline once, e.g.
+    "df -h / | tail -1" -> (("df", "-h", "/"), ("tail", "-1")).
+    Raises ValueError on empty commands or bad quoting.
+    """
+    stages = []
+    for part in command.split("|"):
+        args = shlex.split(part.strip())
+        if args:
+            stages.append(tuple(args))
+    if not stages:
+        raise ValueError("Empty command")
+    return tuple(stages)
+
+def _migrate(config: dict) -> dict:
+    # MIGRATION: Handle old single webhook format
+    if "discord_webhook_url" in config and config["discord_webhook_url"]:
+        if "discord_webhooks" not in config:
+            config["discord_webhooks"] = [config["discord_webhook_url"]]
+        elif config["discord_webhook_url"] not in config["discord_webhooks"]:
+            config["discord_webhooks"].append(config["discord_webhook_url"])
+    config.pop("discord_webhook_url", None)
+
+    # Ensure keys exist
+    config.setdefault("monitors", [])
+    config.setdefault("discord_webhooks", [])
+    config.setdefault("log_files", [])
+    return config
+
+def _compile(raw: dict) -> dict:
+    """
+    Validates the config and pre-parses monitor commands (or checks the settings
+    of native "type" monitors) and extraction/threshold rules. Bad monitors are skipped.
+    A monitor whose rules do not compile keeps running without them and carries
+    the reason in "rules_error" (shown by /monitors/schedule); POST /config
+    rejects such configs up front (see rule_errors).
+    """
+    compiled = copy.deepcopy(raw)
+    monitors = []
+    seen = set()
+    for monitor in raw.get("monitors") or []:
+        if not isinstance(monitor, dict):
+            logger.warning(f"Config: ignoring invalid monitor entry {monitor!r}")
+            continue
+        name, command, kind = monitor.get("name"), monitor.get("command"), monitor.get("type")
+        if not name or not (kind or isinstance(command, str)):
+            logger.warning(f"Config: ignoring monitor without name and type/command: {monitor!r}")
+            continue
+        if name in seen:
+            logger.warning(f"Config: duplicate monitor name '{name}', keeping the first one")
+            continue
+        if kind:
+            # Native check: no pipeline to parse, just validate its settings
+            check = MONITOR_TYPES.get(kind)
+            if check is None:
+                logger.warning(f"Config: monitor '{name}' has unknown type '{kind}' (known: {', '.join(MONITOR_TYPES)})")
+                continue
+            missing = [key for key in check.required if key not in monitor]
+            if check.one_of and not any(monitor.get(key) for key in check.one_of):
+                missing.append(" or ".join(check.one_of))
+            if missing:
+                logger.warning(f"Config: monitor '{name}' ({kind}) is missing {', '.join(missing)}")
+                continue
+            pipeline = None
+        else:
+            try:
+                pipeline = compile_command(command)
+            except ValueError as e:
+                logger.warning(f"Config: cannot parse command of monitor '{name}': {e}")
+                continue
+        try:
+            rules, rules_error = compile_rules(monitor), None
+        except ValueError as e:
+            logger.error(f"Config: monitor '{name}' has invalid rules and runs without any: {e}")
+            rules, rules_error = None, str(e)
+        seen.add(name)
+        monitors.append({**copy.deepcopy(monitor), "pipeline": pipeline, "rules": rules, "rules_error": rules_error})
+    compiled["monitors"] = monitors
+
+    if not isinstance(compiled.get("discord_webhooks"), list):
+        compiled["discord_webhooks"] = []
+
+    # Log files to follow and index: "path" or {"path": ..., "name": ...}
+    log_files, names = [], set()
+    for entry in raw.get("log_files") or []:
+        if isinstance(entry, str):
+            entry = {"path": entry}
+        if not isinstance(entry, dict) or not isinstance(entry.get("path"), str) or not entry["path"]:
+            logger.warning(f"Config: ignoring invalid log_files entry {entry!r}")
+            continue
+        name = entry.get("name") or os.path.basename(entry["path"])
+        if name in names:
+            logger.warning(f"Config: duplicate log file name '{name}', keeping the first one")
+            continue
+        names.add(name)
+        log_files.append({"name": name, "path": os.path.abspath(entry["path"])})
+    compiled["log_files"] = log_files
+    return compiled
+
+def rule_errors(config: dict) -> dict:
+    """{monitor name: error} for every monitor whose extraction/threshold rules do not compile."""
+    errors = {}
+    for monitor in config.get("monitors") or []:
+        if not isinstance(monitor, dict):
+            continue
+        try:
+            compile_rules(monitor)
+        except ValueError as e:
+            errors[monitor.get("name") or "?"] = str(e)
+    return errors
+
+def _refresh(force: bool = False):
+    """Re-parses config.json if its mtime/size changed. Caller holds _lock."""
+    now = time.monotonic()
+    if not force and _cache["compiled"] is not None and now - _cache["checked"] < CHECK_INTERVAL:
+        return
+    _cache["checked"] = now
+
+    try:
+        st = os.stat(CONFIG_FILE)
+        stamp = (st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        stamp = None
+    if not force and _cache["compiled"] is not None and stamp == _cache["stamp"]:
+        return
+
+    if stamp is None:
+        raw = {}
+    else:
+        try:
+            with open(CONFIG_FILE, "r") as f:
+                raw = json.load(f)
+        except (OSError, ValueError) as e:
+            if _cache["compiled"] is not None:
+                logger.error(f"Config: failed to reload {CONFIG_FILE}, keeping previous config: {e}")
+                _cache["stamp"] = stamp
+                return
+            logger.error(f"Config: failed to load {CONFIG_FILE}: {e}")
+            raw = {}
+
+    raw = _migrate(raw)
+    _cache["raw"] = raw
+    _cache["compiled"] = _compile(raw)
+    _cache["stamp"] = stamp
+
+def get_config() -> dict:
+    """
+    The cached, validated config. Command monitors carry a pre-parsed
+    "pipeline"; every monitor carries its compiled "rules" (None when it
+    declares no extraction/conditions).
+    Shared between callers: treat it as read-only.
+    """
+    with _lock:
+        _refresh()
+        return _cache["compiled"]
+
+def get_monitors() -> list:
+    """The valid, pre-compiled monitors from config.json."""
+    return get_config()["monitors"]
+
+def get_log_files() -> list:
+    """The log files to follow, as [{"name", "path"}]."""
+    return get_config()["log_files"]
+
+def load_config() -> dict:
+    """A private, editable copy of the config as stored on disk (after migration)."""
+    with _lock:
+        _refresh()
+        return copy.deepcopy(_cache["raw"])
+
+def save_config(config: dict):
+    with _lock:
+        with open(CONFIG_FILE, "w") as f:
+            json.dump(config, f, indent=4)
+        _refresh(force=True)
@@ -0,0 +1,209 @@
+import fnmatch
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+
+# Files never indexed: the instruction file is already in the system prompt,
+# approved scripts are transient leftovers of the approval workflow.
+EXCLUDED_FILES = ["system_instruction.txt", "approved_script_*.py"]
+# Larger files (logs, dumps) are left to the file tools
+MAX_FILE_BYTES = 2 * 1024 * 1024
+# Target chunk size in characters (chunks are cut on line boundaries)
+CHUNK_CHARS = 1200
+# Chunks injected into each prompt
+TOP_K = int(os.getenv("CONTEXT_TOP_K", "4"))
+
+# First line of every context block (history.py strips these blocks from stored turns)
+CONTEXT_HEADER = "--- RELEVANT WORKSPACE CONTEXT ---"
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9_]{2,}")
+
+def tokenize(text: str) -> list:
+    return _TOKEN_RE.findall(text.lower())
+
+def split_chunks(text: str) -> list:
+    """Splits text into ~CHUNK_CHARS pieces on line boundaries."""
+    chunks, current, size = [], [], 0
+    for line in text.splitlines():
+        if current and size + len(line) > CHUNK_CHARS:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current and "".join(current).strip():
+        chunks.append("\n".join(current))
+    return chunks
+
+class WorkspaceIndex:
+    """
+    Local BM25 full-text index over chunks of the workspace files.
+    Files are re-chunked only when their mtime/size changes, so refreshing
+    before every prompt costs one stat() per file.
+    """
+
+    def __init__(self, workspace_dir: str):
+        self.workspace_dir = workspace_dir
+        self._lock = threading.Lock()
+        self._files = {}                       # filename -> (stamp, [chunk ids])
+        self._chunks = {}                      # chunk id -> (filename, text, length)
+        self._postings = defaultdict(dict)     # term -> {chunk id: term frequency}
+        self._total_length = 0
+        self._next_id = 0
+
+    @staticmethod
+    def is_indexable(filename: str) -> bool:
+        return not any(fnmatch.fnmatch(filename, pattern) for pattern in EXCLUDED_FILES)
+
+    # --- Index maintenance (caller holds _lock) ---
+    def _drop(self, filename: str):
+        _, chunk_ids = self._files.pop(filename, (None, []))
+        for chunk_id in chunk_ids:
+            _, text, length = self._chunks.pop(chunk_id)
+            self._total_length -= length
+            for term in set(tokenize(text)):
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(chunk_id, None)
+                    if not postings:
+                        del self._postings[term]
+
+    def _add(self, filename: str, stamp: tuple, text: str):
+        chunk_ids = []
+        for chunk in split_chunks(text):
+            terms = tokenize(chunk)
+            if not terms:
+                continue
+            chunk_id = self._next_id
+            self._next_id += 1
+            self._chunks[chunk_id] = (filename, chunk, len(terms))
+            self._total_length += len(terms)
+            for term, freq in Counter(terms).items():
+                self._postings[term][chunk_id] = freq
+            chunk_ids.append(chunk_id)
+        self._files[filename] = (stamp, chunk_ids)
+
+    def _read(self, path: str):
+        try:
+            with open(path, "rb") as f:
+                data = f.read(MAX_FILE_BYTES + 1)
+        except OSError:
+            return None
+        if len(data) > MAX_FILE_BYTES or b"\0" in data[:4096]:
+            return None  # too large or binary
+        return data.decode("utf-8", errors="ignore")
+
+    def _update(self, filename: str, stat_result):
+        stamp = (stat_result.st_mtime_ns, stat_result.st_size)
+        known = self._files.get(filename)
+        if known and known[0] == stamp:
+            return False
+        self._drop(filename)
+        text = self._read(os.path.join(self.workspace_dir, filename))
+        # Unreadable files are remembered (without chunks) so they aren't re-read
+        self._add(filename, stamp, text or "")
+        return True
+
+    # --- Public API ---
+    def refresh(self, filenames=None) -> int:
+        """
+        Brings the index up to date. With `filenames`, only those files are
+        checked; otherwise the whole workspace is scanned. Returns the number
+        of files (re)indexed or removed.
+        """
+        changed = 0
+        with self._lock:
+            if filenames is None:
+                seen = set()
+                try:
+                    entries = list(os.scandir(self.workspace_dir))
+                except FileNotFoundError:
+                    entries = []
+                for entry in entries:
+                    if not entry.is_file() or not self.is_indexable(entry.name):
+                        continue
+                    seen.add(entry.name)
+                    changed += self._update(entry.name, entry.stat())
+                for filename in list(self._files):
+                    if filename not in seen:
+                        self._drop(filename)
+                        changed += 1
+            else:
+                for filename in filenames:
+                    path = os.path.join(self.workspace_dir, filename)
+                    if self.is_indexable(filename) and os.path.isfile(path):
+                        changed += self._update(filename, os.stat(path))
+                    elif filename in self._files:
+                        self._drop(filename)
+                        changed += 1
+        return changed
+
+    def search(self, query: str, k: int = TOP_K) -> list:
+        """Top-k chunks for `query` as (filename, text, score), best first."""
+        terms = set(tokenize(query))
+        with self._lock:
+            count = len(self._chunks)
+            if not count or not terms:
+                return []
+            avg_length = self._total_length / count
+            scores = defaultdict(float)
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, freq in postings.items():
+                    length = self._chunks[chunk_id][2]
+                    scores[chunk_id] += idf * freq * (K1 + 1) / (freq + K1 * (1 - B + B * length / avg_length))
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            return [(self._chunks[i][0], self._chunks[i][1], round(score, 3)) for i, score in best]
+
+    def context_for(self, query: str, k: int = TOP_K) -> str:
+        """Formats the top-k chunks for `query` as a context block ("" if none match)."""
+        self.refresh()
+        hits = self.search(query, k)
+        if not hits:
+            return ""
+        blocks = "".join(f"\n--- FILE: {filename} ---\n{text}\n" for filename, text, _ in hits)
+        return f"{CONTEXT_HEADER}{blocks}--- END CONTEXT ---\n\n"
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "files": len(self._files),
+                "chunks": len(self._chunks),
+                "terms": len(self._postings),
+            }
+
+class Debouncer:
+    """
+    Coalesces bursts of triggers: `callback(keys)` runs once on a timer thread,
+    `delay` seconds after the last trigger, with every key triggered meanwhile.
+    """
+
+    def __init__(self, delay: float, callback):
+        self.delay = delay
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._keys = set()
+        self._timer = None
+
+    def trigger(self, key):
+        with self._lock:
+            self._keys.add(key)
+            if self._timer:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.delay, self._fire)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _fire(self):
+        with self._lock:
+            keys, self._keys, self._timer = self._keys, set(), None
+        if keys:
+            self.callback(keys)
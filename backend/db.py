@@ -0,0 +1,20 @@
+import os
+import sqlite3
+
+# SQLite database shared by the durable stores and by every worker process
+DB_FILE = os.getenv("OPS_DB_FILE", "ops_agent.db")
+# Milliseconds a writer waits for another connection's lock before failing
+BUSY_TIMEOUT_MS = 5000
+
+def connect(path: str = DB_FILE) -> sqlite3.Connection:
+    """
+    Opens a connection in WAL mode: readers never block the writer, and
+    commits only fsync the log. Rows come back as sqlite3.Row.
+    The connection may be shared across threads; callers serialize access.
+    """
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    return conn
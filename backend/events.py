@@ -0,0 +1,184 @@
+import asyncio
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+
+from db import connect, DB_FILE
+
+logger = logging.getLogger("uvicorn")
+
+# Events buffered per subscriber; a slow client loses its oldest events first
+SUBSCRIBER_QUEUE_SIZE = 256
+# Seconds between keep-alive comments on idle streams
+KEEPALIVE_INTERVAL = 15
+# Seconds between two polls of the shared outbox (events from other workers)
+RELAY_INTERVAL = 0.5
+# Outbox rows older than this are deleted (seconds)
+OUTBOX_RETENTION = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    origin TEXT NOT NULL,
+    message TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_created ON events (created_at);
+"""
+
+class EventBroker:
+    """
+    Fan-out broker for dashboard push events (monitor results, approvals,
+    workspace files). publish() is thread-safe and never touches SQLite
+    itself: events are delivered to this process's subscribers right away and
+    queued for a writer thread that appends them to a shared outbox table,
+    which relay() tails so dashboards connected to other workers get them too.
+    Workers react to each other's events through on(); internal events
+    (clients=False) reach those handlers but no dashboard.
+    """
+
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE, path: str = DB_FILE):
+        self.queue_size = queue_size
+        self.origin = uuid.uuid4().hex
+        self._loop = None
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._handlers = {}   # event type -> [callback(data)], for events of other workers
+        self._db_lock = threading.Lock()
+        self._conn = connect(path)
+        self._conn.executescript(_SCHEMA)
+        self._outbox = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self._write_outbox, name="event-outbox", daemon=True)
+        self._writer.start()
+
+    def bind(self, loop):
+        """Sets the event loop that owns the subscriber queues."""
+        self._loop = loop
+
+    def subscribe(self) -> asyncio.Queue:
+        self._loop = self._loop or asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        with self._lock:
+            self._subscribers.discard(queue)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def on(self, event_type: str, callback):
+        """Calls callback(data) on the event loop for every `event_type` event published by another worker."""
+        self._handlers.setdefault(event_type, []).append(callback)
+
+    def publish(self, event_type: str, data, clients: bool = True):
+        """
+        Broadcasts one event to every subscriber of every worker, from any
+        thread, without blocking. clients=False only notifies other workers' handlers.
+        """
+        kind = "event" if clients else "internal"
+        message = f"{kind}: {event_type}\ndata: {json.dumps(data, default=str)}\n\n"
+        self._outbox.put((message, time.time()))
+        if clients:
+            self._dispatch(message)
+
+    def _write_outbox(self):
+        """Writer thread: appends queued events to the outbox, one transaction per burst."""
+        while True:
+            rows = [self._outbox.get()]
+            while True:
+                try:
+                    rows.append(self._outbox.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with self._db_lock:
+                    self._conn.execute("BEGIN IMMEDIATE")
+                    try:
+                        self._conn.executemany(
+                            "INSERT INTO events (origin, message, created_at) VALUES (?, ?, ?)",
+                            [(self.origin, message, created_at) for message, created_at in rows],
+                        )
+                        self._conn.execute("COMMIT")
+                    except Exception:
+                        self._conn.execute("ROLLBACK")
+                        raise
+            except Exception as e:
+                logger.error(f"Event outbox write failed, {len(rows)} events not relayed: {e}")
+
+    def _handle_remote(self, message: str):
+        header, _, body = message.partition("\n")
+        kind, _, event_type = header.partition(": ")
+        if kind == "event":
+            self._dispatch(message)
+        for callback in self._handlers.get(event_type, ()):
+            try:
+                callback(json.loads(body[len("data: "):]))
+            except Exception as e:
+                logger.error(f"Event handler for '{event_type}' failed: {e}")
+
+    def _dispatch(self, message: str):
+        if not self._subscribers or self._loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._deliver(message)
+        elif not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._deliver, message)
+
+    def _deliver(self, message: str):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for queue in subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+    def _fetch(self, last_id: int) -> tuple:
+        with self._db_lock:
+            if last_id is None:
+                row = self._conn.execute("SELECT MAX(id) FROM events").fetchone()
+                return [], row[0] or 0
+            rows = self._conn.execute(
+                "SELECT id, origin, message FROM events WHERE id > ? ORDER BY id", (last_id,)
+            ).fetchall()
+        messages = [row["message"] for row in rows if row["origin"] != self.origin]
+        return messages, rows[-1]["id"] if rows else last_id
+
+    def _purge(self):
+        with self._db_lock:
+            self._conn.execute("DELETE FROM events WHERE created_at < ?", (time.time() - OUTBOX_RETENTION,))
+
+    async def relay(self):
+        """Delivers events published by other worker processes (runs for the app's lifetime)."""
+        last_id, last_purge = None, time.monotonic()
+        while True:
+            messages, last_id = await asyncio.to_thread(self._fetch, last_id)
+            for message in messages:
+                self._handle_remote(message)
+            if time.monotonic() - last_purge > OUTBOX_RETENTION:
+                await asyncio.to_thread(self._purge)
+                last_purge = time.monotonic()
+            await asyncio.sleep(RELAY_INTERVAL)
+
+    async def stream(self):
+        """SSE body for one subscriber, with keep-alive comments while idle."""
+        queue = self.subscribe()
+        try:
+            yield ": connected\n\n"
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            self.unsubscribe(queue)
@@ -0,0 +1,171 @@
+import mmap
+import os
+import re
+
+# Most bytes any slice returns (keeps API responses and model context small)
+MAX_SLICE_BYTES = 256 * 1024
+# Longest single line returned; longer lines are cut
+MAX_LINE_CHARS = 2000
+# Caps for line-based reads and searches
+MAX_LINES = 2000
+MAX_MATCHES = 200
+MAX_CONTEXT_LINES = 20
+# Newlines are counted in chunks this size (search line numbers)
+COUNT_CHUNK = 1024 * 1024
+
+class _Mapped:
+    """Read-only mmap of a file; empty files map to b"" (mmap rejects them)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self.data = b""
+
+    def __enter__(self):
+        self._file = open(self.path, "rb")
+        if os.fstat(self._file.fileno()).st_size:
+            self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.data
+
+    def __exit__(self, *exc):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self._file.close()
+
+def _decode(raw: bytes) -> str:
+    text = raw.decode("utf-8", errors="replace").rstrip("\r")
+    return text if len(text) <= MAX_LINE_CHARS else text[:MAX_LINE_CHARS] + " [...]"
+
+def _line_bounds(mm, pos: int) -> tuple:
+    """(start, end) of the line containing byte `pos` (end excludes the newline)."""
+    start = mm.rfind(b"\n", 0, pos) + 1
+    end = mm.find(b"\n", pos)
+    return start, len(mm) if end == -1 else end
+
+def _count_newlines(mm, start: int, end: int) -> int:
+    count = 0
+    for chunk_start in range(start, end, COUNT_CHUNK):
+        count += mm[chunk_start:min(end, chunk_start + COUNT_CHUNK)].count(b"\n")
+    return count
+
+def read_bytes(path: str, offset: int = 0, length: int = 4096) -> dict:
+    """Bytes [offset, offset + length) of a file; a negative offset counts from the end."""
+    length = max(0, min(length, MAX_SLICE_BYTES))
+    with _Mapped(path) as mm:
+        size = len(mm)
+        start = max(0, size + offset) if offset < 0 else min(offset, size)
+        end = min(size, start + length)
+        text = mm[start:end].decode("utf-8", errors="replace")
+    return {"size": size, "offset": start, "length": end - start, "text": text}
+
+def read_lines(path: str, start_line: int = 1, count: int = 100) -> dict:
+    """`count` lines from 1-based `start_line`, scanning forward without loading the file."""
+    start_line, count = max(1, start_line), max(0, min(count, MAX_LINES))
+    lines, budget = [], MAX_SLICE_BYTES
+    with _Mapped(path) as mm:
+        pos, number = 0, 1
+        while number < start_line and pos < len(mm):
+            newline = mm.find(b"\n", pos)
+            pos = len(mm) if newline == -1 else newline + 1
+            number += 1
+        while len(lines) < count and pos < len(mm) and budget > 0:
+            newline = mm.find(b"\n", pos)
+            end = len(mm) if newline == -1 else newline
+            text = _decode(mm[pos:end])
+            lines.append((number, text))
+            budget -= len(text)
+            pos, number = end + 1, number + 1
+        size = len(mm)
+    return {"size": size, "lines": lines, "eof": pos >= size}
+
+def tail_lines(path: str, count: int = 50) -> dict:
+    """The last `count` lines, found by scanning backwards from the end of the file."""
+    count = max(0, min(count, MAX_LINES))
+    lines, budget = [], MAX_SLICE_BYTES
+    with _Mapped(path) as mm:
+        end = len(mm)
+        if end and mm[end - 1:end] == b"\n":
+            end -= 1  # ignore the final newline
+        while len(lines) < count and end > 0 and budget > 0:
+            start = mm.rfind(b"\n", 0, end) + 1
+            text = _decode(mm[start:end])
+            lines.append(text)
+            budget -= len(text)
+            end = start - 1
+        size = len(mm)
+    lines.reverse()
+    return {"size": size, "lines": lines}
+
+def search(path: str, pattern: str, context: int = 2, max_matches: int = 50, ignore_case: bool = False) -> dict:
+    """
+    Lines matching the regex `pattern` (one hit per line) with `context` lines
+    around each, as a list of blocks [(line number, text, is_match)].
+    Raises re.error for invalid patterns.
+    """
+    context = max(0, min(context, MAX_CONTEXT_LINES))
+    max_matches = max(1, min(max_matches, MAX_MATCHES))
+    regex = re.compile(pattern.encode(), re.MULTILINE | (re.IGNORECASE if ignore_case else 0))
+    blocks, matches, budget = [], 0, MAX_SLICE_BYTES
+    truncated = False
+    with _Mapped(path) as mm:
+        size = len(mm)
+        pos, counted_to, line_number = 0, 0, 1
+        shown_until = -1   # last line number already emitted (overlapping context)
+        while pos <= size:
+            found = regex.search(mm, pos)
+            if found is None:
+                break
+            if matches >= max_matches or budget <= 0:
+                truncated = True
+                break
+            start, end = _line_bounds(mm, found.start())
+            line_number += _count_newlines(mm, counted_to, start)
+            counted_to = start
+
+            # Context before (backwards), then the match and context after (forwards)
+            before, cursor = [], start
+            for offset in range(1, context + 1):
+                if cursor == 0 or line_number - offset <= shown_until:
+                    break
+                prev_start = mm.rfind(b"\n", 0, cursor - 1) + 1
+                before.append((line_number - offset, _decode(mm[prev_start:cursor - 1]), False))
+                cursor = prev_start
+            block = list(reversed(before)) + [(line_number, _decode(mm[start:end]), True)]
+            cursor = end + 1
+            for offset in range(1, context + 1):
+                if cursor >= size:
+                    break
+                next_end = mm.find(b"\n", cursor)
+                next_end = size if next_end == -1 else next_end
+                block.append((line_number + offset, _decode(mm[cursor:next_end]), False))
+                cursor = next_end + 1
+
+            if blocks and block[0][0] <= shown_until + 1:
+                # Touches or overlaps the previous block (the match may be in its
+                # after-context): flag lines already shown, append only new ones
+                previous = blocks[-1]
+                first_shown = previous[0][0]
+                for number, text, is_match in block:
+                    if number <= shown_until:
+                        if is_match:
+                            previous[number - first_shown] = (number, text, True)
+                    else:
+                        previous.append((number, text, is_match))
+            else:
+                blocks.append(block)
+            budget -= sum(len(text) for number, text, _ in block if number > shown_until)
+            shown_until = max(shown_until, block[-1][0])
+            matches += 1
+            pos = end + 1
+    return {"size": size, "matches": matches, "truncated": truncated, "blocks": blocks}
+
+def format_lines(lines: list) -> str:
+    """'<n>: text' lines, the format the agent tools return."""
+    return "\n".join(f"{number}: {text}" for number, text in lines)
+
+def format_blocks(blocks: list) -> str:
+    """Search blocks as grep -n style text ('>' marks matching lines)."""
+    return "\n--\n".join(
+        "\n".join(f"{'>' if is_match else ' '}{number}: {text}" for number, text, is_match in block)
+        for block in blocks
+    )
@@ -0,0 +1,132 @@
+import os
+
+from context_index import CONTEXT_HEADER
+
+# Compact a conversation once its history is estimated above this many tokens
+HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "24000"))
+# Share of the budget kept as verbatim recent turns after a compaction
+RECENT_SHARE = 0.5
+# Upper bound (characters) of the rolling summary of older turns
+SUMMARY_CHARS = 6000
+
+SUMMARY_MARKER = "[CONVERSATION SUMMARY]"
+
+def _parts(content):
+    return getattr(content, "parts", None) or []
+
+def _text(part) -> str:
+    return getattr(part, "text", None) or ""
+
+def _call(part):
+    call = getattr(part, "function_call", None)
+    return call if call and getattr(call, "name", None) else None
+
+def _reply(part):
+    reply = getattr(part, "function_response", None)
+    return reply if reply and getattr(reply, "name", None) else None
+
+def _part_size(part) -> int:
+    call, reply = _call(part), _reply(part)
+    if call:
+        return len(call.name) + len(str(dict(call.args)))
+    if reply:
+        return len(reply.name) + len(str(reply.response))
+    return len(_text(part))
+
+def estimate_tokens(history) -> int:
+    """Rough token count (~4 characters per token) of a chat history."""
+    return sum(_part_size(part) for content in history for part in _parts(content)) // 4
+
+def _is_turn_start(content) -> bool:
+    # A new turn starts with a user message that is not a tool result
+    return getattr(content, "role", "") == "user" and any(_text(p) for p in _parts(content)) \
+        and not any(_reply(p) for p in _parts(content))
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit] + "…"
+
+def summarize(history, max_chars: int = SUMMARY_CHARS) -> str:
+    """One short line per message of the folded turns; earlier summaries carry over."""
+    lines = []
+    for content in history:
+        role = getattr(content, "role", "")
+        for part in _parts(content):
+            text, call, reply = _text(part), _call(part), _reply(part)
+            if text.startswith(SUMMARY_MARKER):
+                lines.extend(line for line in text.splitlines() if line.startswith("- "))
+            elif call:
+                lines.append(f"- Tool call: {call.name}({_clip(str(dict(call.args)), 120)})")
+            elif reply:
+                lines.append(f"- Tool result {reply.name}: {_clip(str(reply.response), 160)}")
+            elif text:
+                lines.append(f"- {'User' if role == 'user' else 'Agent'}: {_clip(text, 240)}")
+
+    # Keep the most recent lines when the summary itself grows too big
+    kept, size = [], 0
+    for line in reversed(lines):
+        size += len(line) + 1
+        if size > max_chars:
+            kept.append("- (older history omitted)")
+            break
+        kept.append(line)
+    return "\n".join(reversed(kept))
+
+def _is_context(part) -> bool:
+    # Workspace context text, or a runbook file (the only file parts sent)
+    return _text(part).startswith(CONTEXT_HEADER) or bool(getattr(getattr(part, "file_data", None), "file_uri", None))
+
+def strip_context(chat_session) -> bool:
+    """
+    Removes the workspace context and runbook file parts sent with each prompt
+    from the stored history: they are attached again to every turn, so keeping
+    them would only grow the conversation (and estimate_tokens cannot see the
+    size of a file part). Returns True if anything was removed.
+    """
+    history = list(chat_session.history)
+    if not any(_is_context(part) for content in history for part in _parts(content)):
+        return False
+    chat_session.history = [
+        {"role": content.role, "parts": [part for part in _parts(content) if not _is_context(part)]}
+        if any(_is_context(part) for part in _parts(content)) else content
+        for content in history
+    ]
+    return True
+
+def compact_history(chat_session, budget: int = HISTORY_TOKEN_BUDGET) -> dict:
+    """
+    Drops the per-turn workspace context and runbook files, then keeps the most recent turns
+    verbatim and folds older ones into a single summary message once the
+    history exceeds `budget` tokens. Only whole turns are folded, so function
+    calls always stay next to their responses.
+    Returns size metrics: tokens, messages, folded (messages folded this time).
+    """
+    strip_context(chat_session)
+    history = list(chat_session.history)
+    tokens = estimate_tokens(history)
+    metrics = {"tokens": tokens, "messages": len(history), "folded": 0}
+    if tokens <= budget:
+        return metrics
+
+    # Walk back over turn boundaries while the tail still fits the recent share
+    sizes = [estimate_tokens([content]) for content in history]
+    starts = [i for i, content in enumerate(history) if _is_turn_start(content)]
+    cut = None
+    for start in reversed(starts):
+        if start == 0 or sum(sizes[start:]) > budget * RECENT_SHARE:
+            break
+        cut = start
+    if cut is None:
+        # Even the last turn alone is too big: keep it, fold everything before it
+        cut = starts[-1] if starts else 0
+    if cut <= 0:
+        return metrics
+
+    folded, recent = history[:cut], history[cut:]
+    chat_session.history = [
+        {"role": "user", "parts": [{"text": f"{SUMMARY_MARKER}\nEarlier in this conversation:\n{summarize(folded, min(SUMMARY_CHARS, budget))}"}]},
+        {"role": "model", "parts": [{"text": "Understood. I will use this summary as context."}]},
+        *recent,
+    ]
+    history = list(chat_session.history)
+    return {"tokens": estimate_tokens(history), "messages": len(history), "folded": len(folded)}
@@ -0,0 +1,212 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+from db import connect, DB_FILE
+
+# Consecutive failed runs before an incident opens
+OPEN_AFTER = int(os.getenv("INCIDENT_OPEN_AFTER", "1"))
+# Consecutive healthy runs before an open incident resolves (hysteresis)
+RESOLVE_AFTER = int(os.getenv("INCIDENT_RESOLVE_AFTER", "3"))
+# A fingerprint failing again this soon after resolving reopens the old
+# incident instead of waking the agent (flapping monitors)
+REOPEN_WINDOW = int(os.getenv("INCIDENT_REOPEN_WINDOW", "900"))
+# Minimum seconds between two agent wake-ups for the same monitor
+MONITOR_COOLDOWN = int(os.getenv("INCIDENT_MONITOR_COOLDOWN", "300"))
+# Resolved incidents are deleted after this (seconds)
+INCIDENT_RETENTION = 30 * 24 * 3600
+PURGE_INTERVAL = 3600
+
+OPEN = "OPEN"
+RESOLVED = "RESOLVED"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS incidents (
+    id TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    monitor TEXT NOT NULL,
+    status TEXT NOT NULL,
+    opened_at REAL NOT NULL,
+    resolved_at REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_incidents_status ON incidents (status, opened_at);
+CREATE INDEX IF NOT EXISTS idx_incidents_fingerprint ON incidents (fingerprint, resolved_at);
+"""
+
+# Volatile parts of error messages: numbers, hex ids, quoted values
+_VOLATILE_RE = re.compile(r"0x[0-9a-f]+|\b[0-9a-f]{8,}\b|\d+(\.\d+)?|'[^']*'|\"[^\"]*\"")
+
+def error_class(message: str) -> str:
+    """Normalizes an error message so repeats of the same failure compare equal."""
+    text = _VOLATILE_RE.sub("#", message.lower())
+    return " ".join(text.split())[:120]
+
+def fingerprint(monitor: str, message: str) -> str:
+    return hashlib.sha1(f"{monitor}\0{error_class(message)}".encode()).hexdigest()[:12]
+
+class IncidentManager:
+    """
+    Turns per-run monitor failures into incidents. Failures are fingerprinted
+    by monitor and normalized error class; an incident opens after OPEN_AFTER
+    failed runs and resolves after RESOLVE_AFTER healthy ones. observe()
+    returns only incidents the agent has not been woken for yet, so repeats,
+    flapping and cooldowns never reach the LLM; the caller confirms each
+    wake-up with woken(), so a failed one is retried. Incidents are kept in SQLite
+    so every worker can list them and a new leader picks them up.
+    """
+
+    def __init__(self, path: str = DB_FILE):
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        self._conn.executescript(_SCHEMA)
+        self._fails = {}        # monitor -> consecutive failed runs
+        self._oks = {}          # monitor -> consecutive healthy runs
+        self._last_woken = {}   # monitor -> time of the last agent wake-up
+        self._last_purge = 0.0
+
+    # --- Storage ---
+    def _save(self, incident: dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO incidents (id, fingerprint, monitor, status, opened_at, resolved_at, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (incident["id"], incident["fingerprint"], incident["monitor"], incident["status"],
+                 incident["opened_at"], incident["resolved_at"], json.dumps(incident)),
+            )
+
+    def _query(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [json.loads(row["data"]) for row in rows]
+
+    def _open_for(self, monitor: str):
+        found = self._query("SELECT data FROM incidents WHERE status = ? AND monitor = ?", (OPEN, monitor))
+        return found[0] if found else None
+
+    def _recently_resolved(self, fp: str, now: float):
+        found = self._query(
+            "SELECT data FROM incidents WHERE fingerprint = ? AND status = ? AND resolved_at > ? "
+            "ORDER BY resolved_at DESC LIMIT 1",
+            (fp, RESOLVED, now - REOPEN_WINDOW),
+        )
+        return found[0] if found else None
+
+    def _resolve(self, incident: dict, now: float, reason: str = None):
+        incident.update(status=RESOLVED, resolved_at=now, resolution=reason)
+        self._save(incident)
+
+    # --- Evaluation ---
+    def observe(self, failures: dict) -> list:
+        """
+        Feeds the latest state of every monitor ({name: error message, or
+        None when healthy}). Returns the incidents that should wake the agent.
+        """
+        now = time.time()
+        to_wake = []
+        for monitor, message in failures.items():
+            incident = self._open_for(monitor)
+            if message is None:
+                self._fails[monitor] = 0
+                self._oks[monitor] = self._oks.get(monitor, 0) + 1
+                if incident and self._oks[monitor] >= RESOLVE_AFTER:
+                    self._resolve(incident, now)
+                continue
+
+            self._oks[monitor] = 0
+            self._fails[monitor] = self._fails.get(monitor, 0) + 1
+            fp = fingerprint(monitor, message)
+            if incident and incident["fingerprint"] == fp:
+                incident.update(last_seen=now, occurrences=incident["occurrences"] + 1, error=message)
+                self._save(incident)
+                continue
+            if self._fails[monitor] < OPEN_AFTER and not incident:
+                continue
+            if incident:
+                # Same monitor, different failure: the old incident is over
+                self._resolve(incident, now, reason=f"superseded by {fp}")
+
+            previous = self._recently_resolved(fp, now)
+            if previous:
+                # Flapping: reopen quietly, the agent already knows about it
+                previous.update(status=OPEN, resolved_at=None, resolution=None, last_seen=now, error=message,
+                                occurrences=previous["occurrences"] + 1, reopened=previous["reopened"] + 1)
+                self._save(previous)
+                continue
+
+            incident = {
+                "id": str(uuid.uuid4())[:8],
+                "fingerprint": fp,
+                "monitor": monitor,
+                "error": message,
+                "error_class": error_class(message),
+                "status": OPEN,
+                "opened_at": now,
+                "last_seen": now,
+                "resolved_at": None,
+                "resolution": None,
+                "occurrences": 1,
+                "reopened": 0,
+                "notified": False,
+            }
+            self._save(incident)
+
+        # Wake the agent for open incidents it has not seen, once their monitor is out of cooldown
+        for incident in self.open_incidents():
+            monitor = incident["monitor"]
+            if not incident["notified"] and now - self._last_woken.get(monitor, 0) >= MONITOR_COOLDOWN:
+                to_wake.append(incident)
+
+        if now - self._last_purge > PURGE_INTERVAL:
+            self.purge()
+        return to_wake
+
+    def woken(self, incidents: list, success: bool = True):
+        """
+        Records a wake-up attempt for incidents returned by observe(). Their
+        monitors enter cooldown either way; only a successful wake-up marks
+        them notified, so a failed one is retried after the cooldown.
+        """
+        now = time.time()
+        for incident in incidents:
+            self._last_woken[incident["monitor"]] = now
+            if success:
+                current = self._query("SELECT data FROM incidents WHERE id = ?", (incident["id"],))
+                if current:
+                    current[0]["notified"] = True
+                    self._save(current[0])
+
+    def prune(self, monitors):
+        """Resolves incidents of monitors that are no longer configured."""
+        monitors = set(monitors)
+        now = time.time()
+        for incident in self.open_incidents():
+            if incident["monitor"] not in monitors:
+                self._resolve(incident, now, reason="monitor removed")
+        for state in (self._fails, self._oks, self._last_woken):
+            for monitor in list(state):
+                if monitor not in monitors:
+                    del state[monitor]
+
+    def purge(self, retention: int = INCIDENT_RETENTION) -> int:
+        self._last_purge = time.time()
+        with self._lock:
+            return self._conn.execute(
+                "DELETE FROM incidents WHERE status = ? AND resolved_at < ?", (RESOLVED, time.time() - retention)
+            ).rowcount
+
+    # --- Queries ---
+    def open_incidents(self) -> list:
+        return self._query("SELECT data FROM incidents WHERE status = ? ORDER BY opened_at", (OPEN,))
+
+    def list(self, status: str = None, limit: int = 50) -> list:
+        limit = max(1, min(limit, 500))
+        if status:
+            return self._query(
+                "SELECT data FROM incidents WHERE status = ? ORDER BY opened_at DESC LIMIT ?", (status, limit)
+            )
+        return self._query("SELECT data FROM incidents ORDER BY opened_at DESC LIMIT ?", (limit,))
@@ -0,0 +1,317 @@
+import asyncio
+import json
+import logging
+import os
+import signal
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+
+logger = logging.getLogger("uvicorn")
+
+# Jobs running at once; the rest wait in QUEUED
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "2"))
+# Hard limit for one job (seconds); long fixes are fine, runaway ones are not
+JOB_TIMEOUT = int(os.getenv("JOB_TIMEOUT", "1800"))
+# Output kept per job (lines, and characters per line)
+MAX_OUTPUT_LINES = 2000
+MAX_LINE_CHARS = 4000
+# Finished jobs kept in memory for GET /jobs
+MAX_FINISHED_JOBS = 200
+# Events buffered per live stream subscriber
+STREAM_QUEUE_SIZE = 500
+# Seconds between SIGTERM and SIGKILL on cancel
+KILL_GRACE = 5
+# Output lines carried by a finished job's event (what other workers can show of it)
+FINAL_EVENT_TAIL = 200
+# Seconds between two status checks when streaming another worker's job
+REMOTE_POLL_INTERVAL = 1.0
+
+QUEUED = "QUEUED"
+RUNNING = "RUNNING"
+SUCCEEDED = "SUCCEEDED"
+FAILED = "FAILED"
+CANCELLED = "CANCELLED"
+TIMED_OUT = "TIMED_OUT"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED, TIMED_OUT)
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+class Job:
+    def __init__(self, stages: list, description: str, cleanup: str = None, on_finish=None):
+        self.id = str(uuid.uuid4())[:8]
+        self.stages = [list(args) for args in stages]
+        self.description = description
+        self.cleanup = cleanup          # file removed once the job ends
+        self.on_finish = on_finish      # callback(job) (or coroutine function) after the final status is set
+        self.status = QUEUED
+        self.created_at = _now()
+        self.started_at = None
+        self.finished_at = None
+        self.returncode = None
+        self.output = deque(maxlen=MAX_OUTPUT_LINES)
+        self.total_lines = 0
+        self.pgids = []
+        self.cancel_requested = False
+        self.subscribers = set()
+
+    def summary(self, tail: int = 0) -> dict:
+        data = {
+            "id": self.id,
+            "description": self.description,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "returncode": self.returncode,
+            "output_lines": self.total_lines,
+            "truncated": self.total_lines > len(self.output),
+        }
+        if tail:
+            data["output"] = "\n".join(list(self.output)[-tail:])
+        return data
+
+    def result_text(self) -> str:
+        """Final output as text (the retained tail if the job was very chatty)."""
+        prefix = f"[... {self.total_lines - len(self.output)} earlier lines dropped ...]\n" if self.total_lines > len(self.output) else ""
+        return prefix + "\n".join(self.output)
+
+class JobManager:
+    """
+    Runs approved commands/scripts as background subprocesses. Output is kept
+    in a bounded buffer and streamed live to subscribers; jobs can be
+    cancelled (every stage's process group is killed) and are limited in
+    concurrency and duration.
+    """
+
+    def __init__(self, concurrency: int = JOB_CONCURRENCY, timeout: int = JOB_TIMEOUT, publish=None):
+        self.timeout = timeout
+        self.publish = publish          # publish(event_type, data) for dashboard pushes
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._jobs = OrderedDict()
+
+    # --- Public API ---
+    def submit(self, stages: list, description: str, cleanup: str = None, on_finish=None) -> Job:
+        """Queues a job (an argv pipeline) and returns it immediately. Call from the event loop."""
+        job = Job(stages, description, cleanup, on_finish)
+        self._jobs[job.id] = job
+        self._prune()
+        asyncio.get_running_loop().create_task(self._run(job))
+        self._changed(job)
+        return job
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    def list(self) -> list:
+        return [job.summary() for job in reversed(self._jobs.values())]
+
+    def cancel(self, job_id: str) -> bool:
+        job = self._jobs.get(job_id)
+        if job is None or job.status in FINISHED:
+            return False
+        job.cancel_requested = True
+        if job.pgids:
+            self._signal(job, signal.SIGTERM)
+            asyncio.get_running_loop().call_later(KILL_GRACE, self._signal, job, signal.SIGKILL)
+        return True
+
+    async def stream(self, job: Job):
+        """SSE body: buffered output first, then live lines, then a final `done` event."""
+        queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+        job.subscribers.add(queue)
+        try:
+            for line in list(job.output):
+                yield self._line_event(line)
+            while job.status not in FINISHED or not queue.empty():
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if item is None:
+                    break
+                yield self._line_event(item)
+            yield f"event: done\ndata: {json.dumps(job.summary())}\n\n"
+        finally:
+            job.subscribers.discard(queue)
+
+    # --- Internals ---
+    @staticmethod
+    def _line_event(line: str) -> str:
+        return f"data: {line}\n\n"
+
+    def _changed(self, job: Job, tail: int = 0):
+        if self.publish:
+            self.publish("jobs", job.summary(tail=tail))
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def _signal(self, job: Job, sig):
+        if job.status != RUNNING:
+            return
+        for pgid in job.pgids:
+            try:
+                os.killpg(pgid, sig)
+            except ProcessLookupError:
+                pass
+
+    def _append(self, job: Job, line: str):
+        line = line[:MAX_LINE_CHARS]
+        job.output.append(line)
+        job.total_lines += 1
+        for queue in list(job.subscribers):
+            if queue.full():
+                queue.get_nowait()  # slow client: drop its oldest line
+            queue.put_nowait(line)
+
+    async def _spawn(self, job: Job):
+        """
+        Starts the pipeline, each stage in its own session/process group (so a
+        cancel also kills grandchildren). Every stage's stderr and the last
+        stage's stdout go to one pipe, like a terminal would show them.
+        """
+        out_read, out_write = os.pipe()
+        procs = []
+        stdin = asyncio.subprocess.DEVNULL
+        try:
+            for index, args in enumerate(job.stages):
+                last = index == len(job.stages) - 1
+                if not last:
+                    next_read, next_write = os.pipe()
+                try:
+                    proc = await asyncio.create_subprocess_exec(
+                        *args, stdin=stdin, stdout=out_write if last else next_write, stderr=out_write,
+                        start_new_session=True,
+                    )
+                finally:
+                    if stdin != asyncio.subprocess.DEVNULL:
+                        os.close(stdin)
+                        stdin = asyncio.subprocess.DEVNULL
+                    if not last:
+                        os.close(next_write)
+                procs.append(proc)
+                if not last:
+                    stdin = next_read
+        except Exception:
+            os.close(out_read)
+            if stdin != asyncio.subprocess.DEVNULL:
+                os.close(stdin)
+            for proc in procs:
+                try:
+                    proc.kill()
+                except ProcessLookupError:
+                    pass
+            raise
+        finally:
+            os.close(out_write)
+
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit=MAX_LINE_CHARS * 4)
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(out_read, "rb"))
+        return procs, reader
+
+    async def _pump(self, job: Job, procs: list, reader):
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:
+                # Line longer than the reader limit: take what is buffered
+                line = await reader.read(MAX_LINE_CHARS)
+            if not line:
+                break
+            self._append(job, line.decode("utf-8", errors="replace").rstrip("\n"))
+        for proc in procs:
+            await proc.wait()
+
+    async def _run(self, job: Job):
+        async with self._semaphore:
+            if job.cancel_requested:
+                job.status = CANCELLED
+            else:
+                job.status, job.started_at = RUNNING, _now()
+                self._changed(job)
+                started = time.monotonic()
+                try:
+                    procs, reader = await self._spawn(job)
+                    job.pgids = [proc.pid for proc in procs]
+                    try:
+                        await asyncio.wait_for(self._pump(job, procs, reader), timeout=self.timeout)
+                        job.returncode = procs[-1].returncode
+                        if job.cancel_requested:
+                            job.status = CANCELLED
+                        else:
+                            job.status = SUCCEEDED if job.returncode == 0 else FAILED
+                    except asyncio.TimeoutError:
+                        self._signal(job, signal.SIGKILL)
+                        self._append(job, f"[Job killed after {self.timeout}s timeout]")
+                        job.status = TIMED_OUT
+                except FileNotFoundError as e:
+                    self._append(job, f"Error: Command not found: {e.filename}")
+                    job.status = FAILED
+                except Exception as e:
+                    self._append(job, f"Error starting job: {e}")
+                    job.status = FAILED
+                logger.info(f"--- ⚙️ JOB {job.id} {job.status} in {time.monotonic() - started:.1f}s ---")
+
+            job.finished_at = _now()
+            if job.cleanup and os.path.exists(job.cleanup):
+                os.remove(job.cleanup)
+            for queue in list(job.subscribers):
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+            self._changed(job, tail=FINAL_EVENT_TAIL)
+            if job.on_finish:
+                try:
+                    result = job.on_finish(job)
+                    if asyncio.iscoroutine(result):
+                        await result
+                except Exception as e:
+                    logger.error(f"Job {job.id} completion callback failed: {e}")
+
+class RemoteJobs:
+    """
+    Jobs running in other worker processes, as seen through their "jobs"
+    events. Output is not relayed line by line: a stream of a remote job
+    follows its status and ends with the output tail of its final event.
+    """
+
+    def __init__(self, limit: int = MAX_FINISHED_JOBS):
+        self.limit = limit
+        self._jobs = OrderedDict()
+
+    def update(self, summary: dict):
+        self._jobs.pop(summary["id"], None)
+        self._jobs[summary["id"]] = summary
+        while len(self._jobs) > self.limit:
+            self._jobs.popitem(last=False)
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    def list(self) -> list:
+        return [{**job, "remote": True} for job in reversed(self._jobs.values())]
+
+    async def stream(self, job_id: str):
+        yield ": following a job of another worker\n\n"
+        status = None
+        while True:
+            job = self._jobs.get(job_id)
+            if job is None:
+                break
+            if job["status"] != status:
+                status = job["status"]
+                yield f"data: [{status}]\n\n"
+            if status in FINISHED:
+                for line in (job.get("output") or "").split("\n"):
+                    yield f"data: {line}\n\n"
+                break
+            await asyncio.sleep(REMOTE_POLL_INTERVAL)
+        summary = {key: value for key, value in (job or {}).items() if key != "output"}
+        yield f"event: done\ndata: {json.dumps(summary)}\n\n"
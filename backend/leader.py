@@ -0,0 +1,67 @@
+import os
+import socket
+import threading
+import time
+import uuid
+
+from db import connect, DB_FILE
+
+# A leader that stops renewing loses the lease after this many seconds
+LEASE_TTL = float(os.getenv("LEADER_LEASE_TTL", "15"))
+# How often the leader renews (and followers try to take over)
+RENEW_INTERVAL = LEASE_TTL / 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires_at REAL NOT NULL
+)
+"""
+
+class LeaderLease:
+    """
+    Leader election between local worker processes through a lease row in
+    SQLite. Whoever holds an unexpired lease is the leader; it keeps it by
+    renewing every RENEW_INTERVAL. If it dies, another worker takes over
+    within LEASE_TTL + RENEW_INTERVAL seconds.
+    """
+
+    def __init__(self, name: str, path: str = DB_FILE, ttl: float = LEASE_TTL):
+        self.name = name
+        self.ttl = ttl
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.is_leader = False
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        self._conn.execute(_SCHEMA)
+
+    def try_acquire(self) -> bool:
+        """Takes the lease if it is free or expired, renews it if we hold it. Returns leadership."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at "
+                "WHERE leases.holder = excluded.holder OR leases.expires_at < ?",
+                (self.name, self.holder, now + self.ttl, now),
+            )
+            row = self._conn.execute("SELECT holder FROM leases WHERE name = ?", (self.name,)).fetchone()
+        self.is_leader = row is not None and row["holder"] == self.holder
+        return self.is_leader
+
+    def release(self):
+        """Gives the lease up (on shutdown) so a follower takes over immediately."""
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (self.name, self.holder))
+        self.is_leader = False
+
+    def current(self) -> dict:
+        with self._lock:
+            row = self._conn.execute("SELECT holder, expires_at FROM leases WHERE name = ?", (self.name,)).fetchone()
+        return {
+            "name": self.name,
+            "holder": row["holder"] if row and row["expires_at"] > time.time() else None,
+            "self": self.holder,
+            "is_leader": self.is_leader,
+        }
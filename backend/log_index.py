@@ -0,0 +1,408 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from db import connect, DB_FILE
+
+logger = logging.getLogger("uvicorn")
+
+# Seconds between two passes over the followed files
+POLL_INTERVAL = float(os.getenv("LOG_POLL_INTERVAL", "2"))
+# Indexed lines are deleted after this many seconds
+LOG_RETENTION = int(os.getenv("LOG_RETENTION", str(24 * 3600)))
+PURGE_INTERVAL = 600
+# A file seen for the first time is indexed from this many bytes before its end
+INITIAL_BACKFILL_BYTES = 1024 * 1024
+# Most bytes read from one file per pass (a huge backlog is caught up over several passes)
+MAX_READ_PER_POLL = 8 * 1024 * 1024
+# Leading bytes remembered per file to notice it was truncated and rewritten
+HEAD_BYTES = 64
+# Longest line stored; longer lines are cut
+MAX_LINE_CHARS = 4000
+# Width of the per-level count buckets (seconds)
+BUCKET_SECONDS = 60
+MAX_RESULTS = 500
+
+# Severity order; a level filter matches that level and everything above it
+LEVELS = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
+_LEVEL_ALIASES = {"TRACE": "DEBUG", "WARN": "WARNING", "ERR": "ERROR", "FATAL": "CRITICAL", "SEVERE": "CRITICAL"}
+
+_ISO_RE = re.compile(r"(\d{4}-\d{2}-\d{2})[T ](\d{2}:\d{2}:\d{2})(\.\d+)?\s?(Z|[+-]\d{2}:?\d{2})?")
+_SYSLOG_RE = re.compile(r"^([A-Z][a-z]{2}) +(\d{1,2}) (\d{2}:\d{2}:\d{2})")
+_LEVEL_NAMES = "TRACE|DEBUG|INFO|WARNING|WARN|ERROR|ERR|CRITICAL|FATAL|SEVERE"
+# Where a level is recognized: "[ERROR]"/"<warn>", "level=error"/"level":"error", or an
+# upper-case token among the first few (after the timestamp/host); never inside words or URLs
+_BRACKETED_LEVEL_RE = re.compile(rf"[\[<]({_LEVEL_NAMES})[\]>]", re.IGNORECASE)
+_KEYED_LEVEL_RE = re.compile(rf"\b(?:level|severity)\"?\s*[=:]\s*\"?({_LEVEL_NAMES})\b", re.IGNORECASE)
+_LEADING_LEVEL_RE = re.compile(rf"^(?:\S+\s+){{0,5}}?({_LEVEL_NAMES})(?=[\s:,|\]-]|$)")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS log_lines (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    ts REAL NOT NULL,
+    level TEXT,
+    line TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_log_lines_ts ON log_lines (ts);
+CREATE INDEX IF NOT EXISTS idx_log_lines_level ON log_lines (level, ts);
+CREATE TABLE IF NOT EXISTS log_buckets (
+    source TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    level TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (source, bucket, level)
+);
+CREATE TABLE IF NOT EXISTS log_offsets (
+    path TEXT PRIMARY KEY,
+    inode INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+# Token index kept in sync with log_lines by triggers (when SQLite has FTS5)
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS log_fts USING fts5(line, content='log_lines', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS log_lines_ai AFTER INSERT ON log_lines BEGIN
+    INSERT INTO log_fts (rowid, line) VALUES (new.id, new.line);
+END;
+CREATE TRIGGER IF NOT EXISTS log_lines_ad AFTER DELETE ON log_lines BEGIN
+    INSERT INTO log_fts (log_fts, rowid, line) VALUES ('delete', old.id, old.line);
+END;
+"""
+
+def normalize_level(level: str):
+    if not level:
+        return None
+    level = level.upper()
+    level = _LEVEL_ALIASES.get(level, level)
+    return level if level in LEVELS else None
+
+def levels_at_or_above(level: str) -> list:
+    """Levels a minimum-severity filter accepts ([] for no filter). Raises ValueError for unknown levels."""
+    if not level:
+        return []
+    normalized = normalize_level(level)
+    if normalized is None:
+        raise ValueError(f"Unknown level '{level}' (known: {', '.join(LEVELS)})")
+    return LEVELS[LEVELS.index(normalized):]
+
+def parse_timestamp(line: str, now: float = None):
+    """Epoch seconds of an ISO-8601 or syslog timestamp near the start of the line, else None."""
+    head = line[:64]
+    match = _ISO_RE.search(head)
+    if match:
+        date, clock, fraction, zone = match.groups()
+        text = f"{date}T{clock}{fraction or ''}"
+        if zone:
+            text += "+00:00" if zone == "Z" else zone if ":" in zone else f"{zone[:3]}:{zone[3:]}"
+        try:
+            return datetime.fromisoformat(text).timestamp()
+        except ValueError:
+            return None
+    match = _SYSLOG_RE.match(head)
+    if match:
+        now = now or time.time()
+        year = datetime.fromtimestamp(now).year
+        try:
+            ts = datetime.strptime(f"{year} {match.group(1)} {match.group(2)} {match.group(3)}", "%Y %b %d %H:%M:%S").timestamp()
+        except ValueError:
+            return None
+        # Syslog has no year: a date in the future belongs to last year
+        if ts > now + 86400:
+            ts = datetime.strptime(f"{year - 1} {match.group(1)} {match.group(2)} {match.group(3)}",
+                                   "%Y %b %d %H:%M:%S").timestamp()
+        return ts
+    return None
+
+def parse_level(line: str):
+    head = line[:200]
+    match = _BRACKETED_LEVEL_RE.search(head) or _KEYED_LEVEL_RE.search(head) or _LEADING_LEVEL_RE.match(head)
+    return normalize_level(match.group(1)) if match else None
+
+def fts_query(query: str) -> str:
+    """Every whitespace-separated word must appear (quoted, so FTS syntax is not interpreted)."""
+    return " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+
+class _Followed:
+    """An open log file and the read position of its last complete line."""
+
+    def __init__(self, path: str, handle, inode: int, offset: int):
+        self.path = path
+        self.handle = handle
+        self.inode = inode
+        self.offset = offset
+        self.head = self.read_head()
+        self.last_ts = None      # continuation lines (tracebacks) inherit these
+        self.last_level = None
+
+    def read_head(self) -> bytes:
+        self.handle.seek(0)
+        return self.handle.read(HEAD_BYTES)
+
+    def truncated(self, size: int) -> bool:
+        """Shorter than what was read, or the start of the file changed (truncated, then rewritten)."""
+        if size < self.offset:
+            return True
+        head = self.read_head()
+        if not head.startswith(self.head):
+            return True
+        self.head = head
+        return False
+
+class LogIndex:
+    """
+    Follows the log files configured under "log_files" and indexes every new
+    line in SQLite: its timestamp and level, a full-text token index (FTS5)
+    and per-minute counts by level. Rotation (new inode) and truncation
+    (smaller size or changed first bytes) are detected; a rotated file is
+    drained before switching. Read positions are stored so a restart or a
+    new leader resumes where indexing stopped.
+    Queries like "ERROR lines matching X in the last 10 minutes" then read the
+    index instead of rescanning the files.
+    """
+
+    def __init__(self, get_sources, path: str = DB_FILE, interval: float = POLL_INTERVAL):
+        self.get_sources = get_sources   # callable -> [{"name", "path"}]
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        self._conn.executescript(_SCHEMA)
+        try:
+            self._conn.executescript(_FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            logger.warning("SQLite has no FTS5: log search falls back to LIKE scans")
+            self.fts = False
+        self._files = {}   # path -> _Followed
+        self._thread = None
+        self._stop = threading.Event()
+        self._last_purge = 0.0
+
+    # --- Follower thread ---
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            if not self._stop.is_set():
+                return
+            self._thread.join(timeout=10)   # a previous stop() is still winding down
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="log-index", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Log indexing error: {e}")
+            self._stop.wait(self.interval)
+        for followed in self._files.values():
+            followed.handle.close()
+        self._files.clear()
+
+    def poll(self) -> int:
+        """One pass over every configured file. Returns the number of lines indexed."""
+        sources = {source["path"]: source["name"] for source in self.get_sources()}
+        for path in list(self._files):
+            if path not in sources:
+                self._files.pop(path).handle.close()
+
+        indexed = 0
+        for path, name in sources.items():
+            try:
+                indexed += self._follow(path, name)
+            except OSError as e:
+                logger.warning(f"Log index: cannot read {path}: {e}")
+        if time.time() - self._last_purge > PURGE_INTERVAL:
+            self.purge()
+        return indexed
+
+    def _saved_offset(self, path: str, inode: int):
+        with self._lock:
+            row = self._conn.execute("SELECT inode, offset FROM log_offsets WHERE path = ?", (path,)).fetchone()
+        return row["offset"] if row and row["inode"] == inode else None
+
+    def _open(self, path: str, st, from_start: bool = False) -> _Followed:
+        handle = open(path, "rb")
+        offset = 0 if from_start else self._saved_offset(path, st.st_ino)
+        if offset is None or offset > st.st_size:
+            # New file: index a bit of recent history, starting on a line boundary
+            offset = max(0, st.st_size - INITIAL_BACKFILL_BYTES)
+            if offset:
+                handle.seek(offset)
+                offset += len(handle.readline())
+        return _Followed(path, handle, st.st_ino, offset)
+
+    def _follow(self, path: str, name: str) -> int:
+        followed = self._files.get(path)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            # Rotated away and not recreated yet: keep reading the old file, keep waiting
+            return self._read(followed, name) if followed else 0
+
+        if followed is None:
+            followed = self._files[path] = self._open(path, st)
+        elif followed.inode != st.st_ino:
+            indexed = self._drain(followed, name)
+            followed.handle.close()
+            logger.info(f"--- 📜 LOG ROTATED: {path} ---")
+            self._files[path] = self._open(path, st, from_start=True)
+            return indexed + self._read(self._files[path], name)
+        elif followed.truncated(st.st_size):
+            logger.info(f"--- 📜 LOG TRUNCATED: {path} ---")
+            followed.offset, followed.head = 0, followed.read_head()
+        return self._read(followed, name)
+
+    def _drain(self, followed: _Followed, name: str) -> int:
+        """Reads a rotated file to its end through the open handle, last partial line included."""
+        indexed, previous = 0, None
+        while followed.offset != previous:
+            previous = followed.offset
+            indexed += self._read(followed, name, final=True)
+        return indexed
+
+    def _read(self, followed: _Followed, name: str, final: bool = False) -> int:
+        followed.handle.seek(followed.offset)
+        data = followed.handle.read(MAX_READ_PER_POLL)
+        end = data.rfind(b"\n") + 1   # only complete lines; the rest is read again next pass
+        full = len(data) == MAX_READ_PER_POLL
+        if data and ((final and not full) or (full and not end)):
+            # End of a file nothing writes to anymore, or one line fills a whole read: take it all
+            if not data.endswith(b"\n"):
+                data += b"\n"
+            end = len(data)
+        if not end:
+            return 0
+        now = time.time()
+        rows = []
+        for raw in data[:end].split(b"\n")[:-1]:
+            line = raw.decode("utf-8", errors="replace").rstrip("\r")
+            if not line.strip():
+                continue
+            ts = parse_timestamp(line, now)
+            level = parse_level(line)
+            if ts is None:
+                # Continuation of the previous entry (e.g. a traceback)
+                ts = followed.last_ts or now
+                level = level or followed.last_level
+            followed.last_ts, followed.last_level = ts, level
+            rows.append((name, ts, level, line[:MAX_LINE_CHARS]))
+        followed.offset = min(followed.offset + end, followed.handle.tell())
+        self._store(followed, rows, now)
+        return len(rows)
+
+    def _store(self, followed: _Followed, rows: list, now: float):
+        buckets = Counter((name, int(ts // BUCKET_SECONDS * BUCKET_SECONDS), level or "NONE") for name, ts, level, _ in rows)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany("INSERT INTO log_lines (source, ts, level, line) VALUES (?, ?, ?, ?)", rows)
+                self._conn.executemany(
+                    "INSERT INTO log_buckets (source, bucket, level, count) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(source, bucket, level) DO UPDATE SET count = count + excluded.count",
+                    [(*key, count) for key, count in buckets.items()],
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO log_offsets (path, inode, offset, updated_at) VALUES (?, ?, ?, ?)",
+                    (followed.path, followed.inode, followed.offset, now),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def purge(self, retention: int = LOG_RETENTION) -> int:
+        self._last_purge = time.time()
+        cutoff = time.time() - retention
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM log_lines WHERE ts < ?", (cutoff,)).rowcount
+            self._conn.execute("DELETE FROM log_buckets WHERE bucket < ?", (cutoff,))
+        return deleted
+
+    # --- Queries ---
+    def search(self, query: str = None, level: str = None, since: float = 600, source: str = None,
+               limit: int = 50) -> list:
+        """
+        Newest indexed lines of the last `since` seconds, optionally containing
+        every word of `query`, at `level` or above, from one `source`.
+        Raises ValueError for an unknown level.
+        """
+        limit = max(1, min(int(limit), MAX_RESULTS))
+        start = time.time() - since
+        where, params = ["l.ts >= ?"], [start]
+        accepted = levels_at_or_above(level)
+        if accepted:
+            where.append(f"l.level IN ({','.join('?' * len(accepted))})")
+            params.extend(accepted)
+        if source:
+            where.append("l.source = ?")
+            params.append(source)
+
+        with self._lock:
+            if query and query.strip() and self.fts:
+                # Lines are inserted in time order, so rowids below the window's first id can be skipped
+                first = self._conn.execute("SELECT MIN(id) FROM log_lines WHERE ts >= ?", (start,)).fetchone()[0]
+                if first is None:
+                    return []
+                sql = (f"SELECT l.source, l.ts, l.level, l.line FROM log_fts JOIN log_lines l ON l.id = log_fts.rowid "
+                       f"WHERE log_fts MATCH ? AND log_fts.rowid >= ? AND {' AND '.join(where)} "
+                       f"ORDER BY l.id DESC LIMIT ?")
+                params = [fts_query(query), first] + params
+            else:
+                for word in (query or "").split():
+                    where.append("l.line LIKE ?")
+                    params.append(f"%{word}%")
+                sql = (f"SELECT l.source, l.ts, l.level, l.line FROM log_lines l WHERE {' AND '.join(where)} "
+                       f"ORDER BY l.id DESC LIMIT ?")
+            rows = self._conn.execute(sql, params + [limit]).fetchall()
+        return [dict(row) for row in rows]
+
+    def histogram(self, since: float = 3600, source: str = None, level: str = None) -> list:
+        """
+        Per-minute line counts by level: [{"bucket", "level", "count"}] (summed over
+        sources unless one is given), only `level` and above if given. Raises ValueError for an unknown level.
+        """
+        sql = "SELECT bucket, level, SUM(count) AS count FROM log_buckets WHERE bucket >= ?"
+        params = [int((time.time() - since) // BUCKET_SECONDS * BUCKET_SECONDS)]
+        accepted = levels_at_or_above(level)
+        if accepted:
+            sql += f" AND level IN ({','.join('?' * len(accepted))})"
+            params.extend(accepted)
+        if source:
+            sql += " AND source = ?"
+            params.append(source)
+        with self._lock:
+            rows = self._conn.execute(sql + " GROUP BY bucket, level ORDER BY bucket", params).fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self) -> dict:
+        with self._lock:
+            offsets = [dict(row) for row in self._conn.execute("SELECT path, offset, updated_at FROM log_offsets")]
+            counts = {row["source"]: row["lines"] for row in self._conn.execute(
+                "SELECT source, SUM(count) AS lines FROM log_buckets GROUP BY source")}
+        return {
+            "sources": [{**source, "lines": counts.get(source["name"], 0),
+                         "offset": next((o["offset"] for o in offsets if o["path"] == source["path"]), None)}
+                        for source in self.get_sources()],
+            "fts": self.fts,
+            "following": self._thread is not None and self._thread.is_alive(),
+            "retention_seconds": LOG_RETENTION,
+        }
+
+def format_lines(rows: list) -> str:
+    """Search results as 'time [source] LEVEL line' text, oldest first."""
+    return "\n".join(
+        f"{datetime.fromtimestamp(row['ts']).strftime('%Y-%m-%d %H:%M:%S')} [{row['source']}] "
+        f"{row['level'] or '-'} {row['line']}"
+        for row in reversed(rows)
+    )
@@ -1,23 +1,38 @@
 
 import os
+import time
 import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Request, Depends, File, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse, FileResponse, JSONResponse
+from fastapi.concurrency import run_in_threadpool
 import google.generativeai as genai
 from dotenv import load_dotenv
-import shutil
 
 # New imports for auth
-from datetime import datetime
 import hashlib
-import secrets
+import re
+import sys
 
 # IMPORTS FROM YOUR MODULES
-from tools import tools_list, send_discord_alert
-from state import PENDING_ACTIONS as approval_queue
-from monitoring import check_monitors, run_command
+from tools import tools_list, send_discord_alert, notify_file_change, NOTIFIER
+from state import APPROVALS, MONITOR_RESULTS, METRIC_HISTORY, EVENTS, INCIDENTS, RESOURCES, LOG_INDEX
+from timeseries import record_monitor_result
+from monitoring import DEFAULT_MONITOR_CONCURRENCY
+from scheduler import MonitorScheduler
+from config import get_config, get_monitors, load_config, save_config, compile_command, rule_errors
+from agent import stream_message, function_calls, run_tools, sse, AGENT_EXECUTOR
+from chat_sessions import ChatSessionPool, WATCHDOG_KEY, session_key
+from history import compact_history
+from context_index import WorkspaceIndex, Debouncer
+from runbooks import RunbookStore
+from jobs import JobManager, RemoteJobs, MAX_OUTPUT_LINES, FINISHED as JOB_FINISHED
+from approvals import DEFAULT_PAGE_SIZE, MAX_RESULT_CHARS, BOOT_ID, HEARTBEAT_INTERVAL as JOB_HEARTBEAT_INTERVAL
+from auth_sessions import SessionStore
+from rules import RuleEngine, metric_value
+from leader import LeaderLease, RENEW_INTERVAL as LEASE_RENEW_INTERVAL
+from file_slices import read_bytes, read_lines, tail_lines, search as search_file
 import json
 from pydantic import BaseModel
 
@@ -40,34 +55,11 @@ class FileUpdate(BaseModel):
 class ConfigUpdate(BaseModel):
     monitors: list
     discord_webhooks: list[str] = []
+    monitor_concurrency: int = DEFAULT_MONITOR_CONCURRENCY
+    log_files: list = []
 
-CONFIG_FILE = "config.json"
 MODEL_NAME = "gemini-2.5-flash-lite"
 
-def load_config():
-    if not os.path.exists(CONFIG_FILE):
-        return {"monitors": [], "discord_webhooks": []}
-    with open(CONFIG_FILE, "r") as f:
-        config = json.load(f)
-        
-        # MIGRATION: Handle old single webhook format
-        if "discord_webhook_url" in config and config["discord_webhook_url"]:
-            if "discord_webhooks" not in config:
-                config["discord_webhooks"] = [config["discord_webhook_url"]]
-            elif config["discord_webhook_url"] not in config["discord_webhooks"]:
-                config["discord_webhooks"].append(config["discord_webhook_url"])
-            del config["discord_webhook_url"]
-            
-        # Ensure key exists
-        if "discord_webhooks" not in config:
-            config["discord_webhooks"] = []
-            
-        return config
-
-def save_config(config):
-    with open(CONFIG_FILE, "w") as f:
-        json.dump(config, f, indent=4)
-
 
 import logging
 import traceback
@@ -78,41 +70,76 @@ logger = logging.getLogger("uvicorn")
 
 # --- 1. THE WATCHDOG (Background Task) ---
 # This is the "Dumb Script" you asked about. It runs cheap checks.
-alert_cooldown = False 
+# Only the leader worker runs it. Failures become fingerprinted incidents
+# (stored in SQLite, visible to every worker); the agent is woken only for new ones.
+scheduler = MonitorScheduler(get_config, store=MONITOR_RESULTS)
+leader_lease = LeaderLease("watchdog")
+# Compiled extraction/threshold rules are evaluated here (keeps samples for rate conditions)
+rule_engine = RuleEngine()
+
+def incident_prompt(new_incidents: list, open_incidents: list) -> str:
+    """One prompt for every incident opened in this batch."""
+    lines = [f"- [{i['id']}] {i['monitor']}: {i['error']}" for i in new_incidents]
+    prompt = f"CRITICAL ALERT: {len(new_incidents)} new incident(s) detected:\n" + "\n".join(lines)
+    new_ids = {i["id"] for i in new_incidents}
+    known = [f"- [{i['id']}] {i['monitor']}: {i['error']}" for i in open_incidents if i["id"] not in new_ids]
+    if known:
+        prompt += "\nStill open (already reported to you):\n" + "\n".join(known)
+    return prompt + "\nYou MUST investigate and fix this."
 
 async def autonomous_watchdog():
-    global alert_cooldown
     logger.info("--- 🐶 WATCHDOG: Monitoring ---")
     
-    while True:
-        try:
-            config = load_config()
-            monitors = config.get("monitors", [])
-            
-            # Run all monitors in a thread pool to avoid blocking the event loop
-            loop = asyncio.get_running_loop()
-            results = await loop.run_in_executor(None, check_monitors, monitors)
-            
-            # Simple logic: If any command returns an error (non-zero exit code usually implies error text in our wrapper)
-            # For now, we'll just log it. 
-            # In a real scenario, we might want to parse specific outputs.
-            # But here, let's look for explicit "Error" strings from our wrapper.
-            
-            issues = []
-            for name, output in results.items():
-                if output.startswith("Error"):
-                    issues.append(f"{name}: {output}")
-            
-            if issues:
-                if not alert_cooldown:
-                    logger.info(f"--- 🚨 WATCHDOG: ISSUES DETECTED: {issues} ---")
+    # Monitors run on their own schedules; we just consume their results
+    scheduler_task = asyncio.create_task(scheduler.run())
+    loop = asyncio.get_running_loop()
+    
+    try:
+        while True:
+            try:
+                batch = [await scheduler.results.get()]
+                # Drain everything that finished meanwhile so one evaluation covers the batch
+                while not scheduler.results.empty():
+                    batch.append(scheduler.results.get_nowait())
+                
+                # Extract each monitor's metric and check its conditions, all in one pass.
+                # Errors from our wrapper ("Error...") always count as failures.
+                now = time.time()
+                monitors = {m["name"]: m for m in get_monitors()}
+                evaluated = rule_engine.evaluate([(name, output, now) for name, output, _ in batch], monitors)
+                for name, output, duration in batch:
+                    record_monitor_result(METRIC_HISTORY, name, output, duration, now, value=evaluated[name][0])
+                # Push only the monitors that changed in this batch
+                EVENTS.publish("monitors", {name: output for name, output, _ in batch})
+                
+                # Each run counts once towards opening/resolving its monitor's incident
+                failures = {name: failure for name, (_, failure) in evaluated.items()}
+                # Forget monitors that were removed from config.json
+                active = scheduler.monitor_names
+                rule_engine.prune(active)
+                await asyncio.to_thread(INCIDENTS.prune, active)
+                new_incidents = await asyncio.to_thread(INCIDENTS.observe, failures)
+                
+                if new_incidents:
+                    for incident in new_incidents:
+                        EVENTS.publish("incidents", incident)
+                    logger.info(f"--- 🚨 WATCHDOG: NEW INCIDENTS: {[i['monitor'] for i in new_incidents]} ---")
                     logger.info("--- 🚨 ANOMALY DETECTED. WAKING AI AGENT... ---")
                     
-                    prompt = f"CRITICAL ALERT: The following monitoring checks failed: {issues}. You MUST investigate and fix this."
+                    prompt = incident_prompt(new_incidents, await asyncio.to_thread(INCIDENTS.open_incidents))
+                    context = await loop.run_in_executor(AGENT_EXECUTOR, workspace_index.context_for, prompt)
                     
+                    delivered = False
                     try:
-                        # We send a message to the chat session invisibly
-                        response = await loop.run_in_executor(None, chat_session.send_message, prompt)
+                        # We send a message to the watchdog's own chat session invisibly
+                        entry = chat_pool.get(WATCHDOG_KEY)
+                        async with entry.lock:
+                            session = chat_pool.session_for(entry)
+                            response = await loop.run_in_executor(AGENT_EXECUTOR, session.send_message, [context, prompt] if context else prompt)
+                            delivered = True
+                            await asyncio.to_thread(INCIDENTS.woken, new_incidents)
+                            # Recurring incidents must not grow the prompt forever
+                            entry.update_history(await loop.run_in_executor(AGENT_EXECUTOR, compact_history, session))
                         try:
                             logger.info(f"AI RESPONSE: {response.text}")
                         except:
@@ -120,26 +147,136 @@ async def autonomous_watchdog():
                     except Exception as ai_error:
                         logger.error(f"AI WAKEUP FAILED: {ai_error}")
                         logger.error(traceback.format_exc())
-                    
-                    alert_cooldown = True 
+                        if not delivered:
+                            # Not notified: reported again once the monitors are out of cooldown
+                            await asyncio.to_thread(INCIDENTS.woken, new_incidents, False)
+
+            except Exception as e:
+                logger.error(f"Watchdog Error: {e}")
+    finally:
+        scheduler_task.cancel()
+
+# How often the leader re-uploads expiring runbooks and restarts abandoned ingestions (seconds)
+RUNBOOK_REVIVE_INTERVAL = 60
+
+async def leadership_loop():
+    """
+    Runs the watchdog and the log indexer only while this worker holds the
+    leader lease. Followers feed the monitor results the leader publishes into
+    their own metric history.
+    """
+    watchdog_task = None
+    followed_until = time.time()
+    runbooks_revived_at = time.monotonic()
+    try:
+        while True:
+            try:
+                leader = await asyncio.to_thread(leader_lease.try_acquire)
+            except Exception as e:
+                logger.error(f"Leader lease error: {e}")
+                leader = False
+
+            if leader and watchdog_task is None:
+                # Re-uploads of expired runbooks happen on one worker only
+                await asyncio.to_thread(runbook_store.restore)
+                logger.info(f"--- 👑 LEADER ELECTED ({leader_lease.holder}): starting watchdog ---")
+                watchdog_task = asyncio.create_task(autonomous_watchdog())
+                # May wait for a previous indexer thread to wind down
+                await asyncio.to_thread(LOG_INDEX.start)
+            elif not leader and watchdog_task is not None:
+                logger.info("--- 👑 LEADERSHIP LOST: stopping watchdog ---")
+                watchdog_task.cancel()
+                watchdog_task = None
+                LOG_INDEX.stop()
+
+            if not leader:
+                try:
+                    monitors = {m["name"]: m for m in get_monitors()}
+                    for name, record in await asyncio.to_thread(MONITOR_RESULTS.updated_since, followed_until):
+                        record_monitor_result(METRIC_HISTORY, name, record["value"], record["duration"], record["timestamp"],
+                                              value=metric_value(monitors.get(name), record["value"]))
+                        followed_until = max(followed_until, record["timestamp"])
+                except Exception as e:
+                    logger.error(f"Result follow error: {e}")
             else:
-                if alert_cooldown:
-                    logger.info("--- ✅ WATCHDOG: System returned to normal ---")
-                    alert_cooldown = False
+                followed_until = time.time()
+                if time.monotonic() - runbooks_revived_at >= RUNBOOK_REVIVE_INTERVAL:
+                    # Expiring runbooks are re-uploaded here, never by the workers serving chats
+                    runbooks_revived_at = time.monotonic()
+                    try:
+                        await asyncio.to_thread(runbook_store.revive)
+                    except Exception as e:
+                        logger.error(f"Runbook revive error: {e}")
+                # Followers serve GET /monitors/schedule from this copy
+                EVENTS.publish("schedule", scheduler.stats(), clients=False)
+
+            await asyncio.sleep(LEASE_RENEW_INTERVAL)
+    finally:
+        if watchdog_task is not None:
+            watchdog_task.cancel()
+        LOG_INDEX.stop()
+        leader_lease.release()
+
+APPROVAL_ARCHIVE_INTERVAL = 3600
+SESSION_SWEEP_INTERVAL = 300
+
+async def session_sweep_loop():
+    """Drops expired logins."""
+    while True:
+        try:
+            await asyncio.to_thread(SESSIONS.sweep)
+        except Exception as e:
+            logger.error(f"Session sweep error: {e}")
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL)
 
+async def approval_archive_loop():
+    """Moves old executed/denied approvals out of the live table."""
+    while True:
+        try:
+            archived = await asyncio.to_thread(APPROVALS.archive)
+            if archived:
+                logger.info(f"--- 🗄️ ARCHIVED {archived} OLD APPROVAL REQUESTS ---")
         except Exception as e:
-            logger.error(f"Watchdog Error: {e}")
+            logger.error(f"Approval archiving error: {e}")
+        await asyncio.sleep(APPROVAL_ARCHIVE_INTERVAL)
 
-        await asyncio.sleep(10)
+async def approval_heartbeat_loop():
+    """
+    Keeps the approved requests whose job runs here fresh, and fails those
+    whose process stopped refreshing them (crash or restart mid-job).
+    """
+    while True:
+        try:
+            await asyncio.to_thread(APPROVALS.heartbeat)
+            for req in await asyncio.to_thread(APPROVALS.fail_orphaned):
+                logger.warning(f"--- ⚠️ APPROVED REQUEST {req['id']} WAS INTERRUPTED BY A RESTART: marked FAILED ---")
+                EVENTS.publish("approvals", req)
+        except Exception as e:
+            logger.error(f"Approval heartbeat error: {e}")
+        await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
 
 # --- 2. LIFESPAN MANAGER ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Load the loop when server starts
-    task = asyncio.create_task(autonomous_watchdog())
+    # Load the loops when server starts
+    EVENTS.bind(asyncio.get_running_loop())
+    # Attach the runbooks that are still live (the leader re-uploads the others)
+    asyncio.get_running_loop().run_in_executor(None, runbook_store.reload)
+    # Host snapshots for get_system_resources / GET /system-resources
+    RESOURCES.start()
+    tasks = [
+        asyncio.create_task(leadership_loop()),
+        asyncio.create_task(EVENTS.relay()),
+        asyncio.create_task(approval_archive_loop()),
+        # Approved jobs that died with a previous server process will never finish
+        asyncio.create_task(approval_heartbeat_loop()),
+        asyncio.create_task(session_sweep_loop()),
+    ]
     yield
-    # Kill the loop when server stops
-    task.cancel()
+    # Kill the loops when server stops
+    for task in tasks:
+        task.cancel()
+    RESOURCES.stop()
 
 # HELPER: Path Validation
 def validate_path(filename: str) -> str:
@@ -147,19 +284,19 @@ def validate_path(filename: str) -> str:
     Securely resolves the file path and ensures it is within the workspace.
     Prevents Path Traversal attacks (e.g. ../../etc/passwd).
     """
-    base_dir = os.path.abspath(WORKSPACE_DIR)
-    # Join and resolve the absolute path
-    file_path = os.path.abspath(os.path.join(base_dir, filename))
+    base_dir = os.path.realpath(WORKSPACE_DIR)
+    # Join and resolve the real path (absolute paths, ../ and symlinks included)
+    file_path = os.path.realpath(os.path.join(base_dir, filename))
     
-    # Check if the resolved path starts with the base directory
-    if not file_path.startswith(base_dir):
+    # Check if the resolved path stays inside the base directory
+    if os.path.commonpath([base_dir, file_path]) != base_dir:
         raise HTTPException(status_code=403, detail="Access denied: Path traversal detected.")
     
     return file_path
 
 # AUTH CONFIG
 AUTH_FILE = "auth.json"
-SESSIONS = {} # In-memory session store (token -> timestamp)
+SESSIONS = SessionStore() # Shared by all workers (SQLite), sliding expiry
 
 def load_auth_config():
     # 1. Check Environment Variable (Highest Priority)
@@ -189,19 +326,29 @@ def login(request: LoginRequest):
     hashed_password = hashlib.sha256(request.password.encode()).hexdigest()
     
     if hashed_password == auth_config["password_hash"]:
-        token = secrets.token_hex(16)
-        SESSIONS[token] = datetime.now()
-        return {"token": token}
+        return {"token": SESSIONS.create()}
     else:
         raise HTTPException(status_code=401, detail="Invalid password")
 
+@app.post("/logout")
+def logout(request: Request):
+    SESSIONS.revoke(request.headers.get("X-Auth-Token", ""))
+    return {"status": "logged out"}
+
+async def session_valid(token: str) -> bool:
+    """Session check for async code: cache hits stay on the loop, SQLite lookups go to a thread."""
+    valid = SESSIONS.cached(token)
+    if valid is None:
+        valid = await run_in_threadpool(SESSIONS.validate, token)
+    return valid
+
 async def verify_token(request: Request):
     # Allow login and public endpoints
-    if request.url.path in ["/login", "/docs", "/openapi.json", "/health", "/stream-test"]:
+    if request.url.path in ["/login", "/docs", "/openapi.json", "/health"]:
         return
     
     token = request.headers.get("X-Auth-Token")
-    if not token or token not in SESSIONS:
+    if not await session_valid(token):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
 # Add middleware manually or use Depends on each route. 
@@ -214,11 +361,15 @@ async def auth_middleware(request: Request, call_next):
     if request.method == "OPTIONS":
         return await call_next(request)
         
-    if request.url.path in ["/login", "/docs", "/openapi.json", "/health", "/stream-test"]:
+    if request.url.path in ["/login", "/docs", "/openapi.json", "/health"]:
         return await call_next(request)
 
     token = request.headers.get("X-Auth-Token")
-    if not token or token not in SESSIONS:
+    path = request.url.path
+    if not token and (path in ("/events", "/stream-test") or (path.startswith("/jobs/") and path.endswith("/stream"))):
+        # EventSource cannot send headers
+        token = request.query_params.get("token")
+    if not await session_valid(token):
         return JSONResponse(status_code=401, content={"detail": "Unauthorized"})
         
     response = await call_next(request)
@@ -273,6 +424,7 @@ CORE PROTOCOL (IMMUTABLE):
    - Do NOT try to run python code directly via terminal commands.
    - Draft the script, explain it, and call `propose_fix_script`.
    - **CRITICAL**: After calling this tool, you MUST respond to the user: "I have submitted a script proposal for your review. Please check the Approvals Tab."
+8. Prompts may start with RELEVANT WORKSPACE CONTEXT excerpts retrieved from the workspace files. Use `list_files` and `read_file` if you need more.
 """
 
     # 2. Load User Custom Instructions (if any)
@@ -287,27 +439,13 @@ CORE PROTOCOL (IMMUTABLE):
     with open(SYSTEM_INSTRUCTION_FILE, "r") as f:
         user_instruction = f.read()
 
-    # 3. Append all other files as context
-    context_str = "\n\n--- ADDITIONAL CONTEXT ---\n"
-    try:
-        if os.path.exists(WORKSPACE_DIR):
-            for filename in os.listdir(WORKSPACE_DIR):
-                if filename == "system_instruction.txt":
-                    continue
-                
-                file_path = os.path.join(WORKSPACE_DIR, filename)
-                if os.path.isfile(file_path):
-                    try:
-                        with open(file_path, "r") as f:
-                            content = f.read()
-                            context_str += f"\n--- FILE: {filename} ---\n{content}\n"
-                    except Exception:
-                        pass # Skip binary or unreadable files
-    except Exception as e:
-        print(f"Error loading context: {e}")
+    # 3. Other workspace files are NOT inlined here: the relevant chunks are
+    #    retrieved from workspace_index and attached to each prompt instead.
+    # Combine: Hardcoded Core + User Instructions
+    return HARDCODED_CORE_PROTOCOL + "\n\n" + user_instruction
 
-    # Combine: Hardcoded Core + User Instructions + Context
-    return HARDCODED_CORE_PROTOCOL + "\n\n" + user_instruction + context_str
+# Local full-text index over the other workspace files
+workspace_index = WorkspaceIndex(WORKSPACE_DIR)
 
 system_instruction = load_system_instruction()
 
@@ -320,8 +458,55 @@ model = genai.GenerativeModel(
 # Create a map for manual execution
 TOOL_MAP = {func.__name__: func for func in tools_list}
 
-chat_session = model.start_chat(enable_automatic_function_calling=False)
-current_runbook = None
+# One chat session per conversation (plus a dedicated one for the watchdog)
+chat_pool = ChatSessionPool(lambda history=None: model.start_chat(history=history, enable_automatic_function_calling=False))
+
+# Seconds to wait after the last file save before refreshing the agent's context
+CONTEXT_REFRESH_DELAY = 1.0
+
+def refresh_context(filenames: set):
+    """
+    Applies a burst of workspace edits: re-indexes only the changed files and,
+    if the user instructions changed, swaps in a new model. Existing
+    conversations keep their history and move to the new model on their next turn.
+    """
+    global system_instruction, model
+    workspace_index.refresh(filenames)
+    
+    if os.path.basename(SYSTEM_INSTRUCTION_FILE) in filenames:
+        new_instruction = load_system_instruction()
+        if new_instruction != system_instruction:
+            system_instruction = new_instruction
+            model = genai.GenerativeModel(
+                model_name=MODEL_NAME,
+                tools=tools_list,
+                system_instruction=system_instruction
+            )
+            chat_pool.rebind()
+    logger.info(f"--- 📚 CONTEXT REFRESHED: {sorted(filenames)} ---")
+
+context_refresher = Debouncer(CONTEXT_REFRESH_DELAY, refresh_context)
+# Runbooks attached to every prompt (deduplicated by content, shared by all workers in SQLite)
+runbook_store = RunbookStore(
+    WORKSPACE_DIR, on_change=lambda digest: EVENTS.publish("runbooks", {"id": digest}, clients=False)
+)
+# Approved commands/scripts run here, off the request path
+JOBS = JobManager(publish=EVENTS.publish)
+# Jobs started by other workers (their status and final output)
+REMOTE_JOBS = RemoteJobs()
+# Scheduler stats published by the leader: (received at, stats)
+leader_schedule = None
+
+def _remember_schedule(stats: dict):
+    global leader_schedule
+    leader_schedule = (time.time(), stats)
+
+# What other workers publish that this one must act on
+EVENTS.on("files", lambda data: context_refresher.trigger(data["filename"]))
+EVENTS.on("runbooks", lambda data: asyncio.get_running_loop().run_in_executor(None, runbook_store.reload))
+EVENTS.on("jobs", REMOTE_JOBS.update)
+EVENTS.on("job_cancel", lambda data: JOBS.cancel(data["id"]))
+EVENTS.on("schedule", _remember_schedule)
 
 # ... YOUR ENDPOINTS (Paste your existing endpoints below) ...
 
@@ -329,32 +514,164 @@ current_runbook = None
 def health_check():
     return {"status": "Online"}
 
+@app.get("/events")
+async def events():
+    """
+    Push channel for the dashboard (auth via ?token=). Named SSE events:
+    monitors ({name: output} of changed monitors), approvals (one request),
+    files ({action, filename, files}), jobs (one job summary),
+    incidents (one newly reported incident).
+    """
+    return StreamingResponse(EVENTS.stream(), media_type="text/event-stream")
+
 @app.get("/system-status")
-def api_system_status():
-    config = load_config()
-    return check_monitors(config.get("monitors", []))
+def api_system_status(detail: bool = False):
+    """Latest monitor results from the watchdog's store. Never forks monitors."""
+    config = get_config()
+    if detail:
+        return MONITOR_RESULTS.read(config.get("monitors", []))
+    return MONITOR_RESULTS.values(config.get("monitors", []))
+
+@app.get("/system-resources")
+def api_system_resources():
+    """Latest host snapshot from the background sampler (no sampling on the request path)."""
+    snapshot = RESOURCES.latest()
+    if snapshot is None:
+        raise HTTPException(status_code=503, detail="psutil library not installed")
+    return snapshot
+
+@app.get("/logs")
+def api_search_logs(query: str = None, level: str = None, minutes: float = 10, source: str = None, limit: int = 100):
+    """Indexed log lines of the last `minutes`, newest first (see log_index)."""
+    try:
+        return {"lines": LOG_INDEX.search(query, level, minutes * 60, source, limit)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/logs/stats")
+def api_log_stats(minutes: float = 60, source: str = None, level: str = None):
+    """Followed files, indexing state and per-minute counts by level (`level` and above if given)."""
+    try:
+        histogram = LOG_INDEX.histogram(minutes * 60, source, level)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {**LOG_INDEX.stats(), "histogram": histogram}
+
+@app.get("/metrics/history")
+def get_metric_history(series: str = None, minutes: float = 60, resolution: str = "auto"):
+    """
+    Metric history from the in-memory time-series store.
+    Without `series`, lists the available series names.
+    """
+    if not series:
+        return {"series": METRIC_HISTORY.names()}
+    try:
+        history = METRIC_HISTORY.query(series, minutes, resolution)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if history is None:
+        raise HTTPException(status_code=404, detail=f"Unknown series '{series}'")
+    return history
+
+@app.get("/chat/sessions")
+def get_chat_sessions():
+    """Live chat sessions (owners are hashed tokens) and their history sizes."""
+    return chat_pool.stats()
+
+@app.get("/context/index")
+def get_context_index(query: str = None):
+    """Workspace retrieval index size, or the chunks a query would retrieve."""
+    if query:
+        workspace_index.refresh()
+        return {"results": [{"file": f, "score": score, "text": text} for f, text, score in workspace_index.search(query)]}
+    return workspace_index.stats()
+
+@app.get("/notifications/stats")
+def get_notification_stats():
+    """Discord dispatcher counters (queued, sent, failed, dropped)."""
+    return NOTIFIER.stats()
+
+@app.get("/monitors/schedule")
+def get_monitor_schedule():
+    """Scheduler health: tick lag, missed deadlines and per-monitor timing (followers relay the leader's)."""
+    if leader_lease.is_leader:
+        return scheduler.stats()
+    if leader_schedule is None:
+        raise HTTPException(status_code=503, detail="No schedule received from the leader yet")
+    received_at, stats = leader_schedule
+    return {**stats, "from_leader": True, "age_seconds": round(time.time() - received_at, 1)}
+
+@app.get("/watchdog")
+def get_watchdog():
+    """Which worker runs the watchdog, and the open incidents (from any worker)."""
+    return {
+        "leader": leader_lease.current(),
+        "open_incidents": INCIDENTS.open_incidents(),
+    }
+
+@app.get("/incidents")
+def list_incidents(status: str = None, limit: int = 50):
+    """Recent incidents, newest first (?status=OPEN|RESOLVED)."""
+    return {"incidents": INCIDENTS.list(status=status.upper() if status else None, limit=limit)}
 
 @app.get("/config")
-def get_config():
+def read_config():
     return load_config()
 
 @app.post("/config")
 def update_config(config_data: ConfigUpdate):
-    save_config(config_data.dict())
+    # Settings the client did not send (or does not know about) keep their stored value
+    config = load_config()
+    config.update(config_data.dict(exclude_unset=True))
+    # A monitor with broken rules would run without its alert conditions: refuse it
+    errors = rule_errors(config)
+    if errors:
+        raise HTTPException(status_code=400, detail="Invalid rules: " + "; ".join(f"{name}: {error}" for name, error in errors.items()))
+    save_config(config)
     return {"status": "updated"}
 
 @app.get("/approvals")
-def get_approvals():
-    """Returns list of pending requests."""
-    return {"requests": list(approval_queue.values())}
+def get_approvals(status: str = None, limit: int = DEFAULT_PAGE_SIZE, offset: int = 0):
+    """One page of approval requests, newest first (e.g. ?status=PENDING)."""
+    requests, total = APPROVALS.list(status=status.upper() if status else None, limit=limit, offset=offset)
+    return {"requests": requests, "total": total, "limit": limit, "offset": offset}
+
+@app.get("/approvals/stats")
+def get_approval_stats():
+    """Request counts per status, plus how many were archived."""
+    return APPROVALS.stats()
 
 # Endpoint 2: Read a specific file (to show content in UI later)
 @app.get("/files/{filename}")
-def read_file_content(filename: str):
+def read_file_content(filename: str, offset: int = None, length: int = 4096, start_line: int = None,
+                      lines: int = 100, tail: int = None, search: str = None, context: int = 2,
+                      max_matches: int = 50, ignore_case: bool = False):
+    """
+    Whole file by default. Slices for large files (JSON): ?offset=&length= (bytes),
+    ?start_line=&lines=, ?tail=N, or ?search=<regex>&context=&max_matches=.
+    """
     file_path = validate_path(filename)
-    if os.path.exists(file_path):
-        return FileResponse(file_path)
-    return {"error": "File not found"}
+    if not os.path.exists(file_path):
+        return {"error": "File not found"}
+    if search is not None:
+        try:
+            result = search_file(file_path, search, context, max_matches, ignore_case)
+        except re.error as e:
+            raise HTTPException(status_code=400, detail=f"Invalid regex: {e}")
+        result["blocks"] = [
+            [{"line": number, "text": text, "match": is_match} for number, text, is_match in block]
+            for block in result["blocks"]
+        ]
+        return {"filename": filename, "mode": "search", **result}
+    if tail is not None:
+        return {"filename": filename, "mode": "tail", **tail_lines(file_path, tail)}
+    if start_line is not None:
+        result = read_lines(file_path, start_line, lines)
+        result["lines"] = [{"line": number, "text": text} for number, text in result["lines"]]
+        return {"filename": filename, "mode": "lines", **result}
+    if offset is not None:
+        return {"filename": filename, "mode": "bytes", **read_bytes(file_path, offset, length)}
+    return FileResponse(file_path)
 
 @app.post("/files/{filename}")
 def save_file_content(filename: str, file_update: FileUpdate):
@@ -383,17 +700,10 @@ def save_file_content(filename: str, file_update: FileUpdate):
         with open(file_path, "w") as f:
             f.write(file_update.content)
         
-        # If we updated ANY file, reload system instruction to include new context
-        # This ensures the agent is always up to date
-        global system_instruction, chat_session
-        system_instruction = load_system_instruction()
-        
-        model = genai.GenerativeModel(
-            model_name=MODEL_NAME,
-            tools=tools_list,
-            system_instruction=system_instruction
-        )
-        chat_session = model.start_chat(enable_automatic_function_calling=False)
+        # Refresh the agent's context shortly after the last save of a burst;
+        # conversations are kept (see refresh_context)
+        context_refresher.trigger(filename)
+        notify_file_change(filename, "saved")
 
         return {"status": "saved", "filename": filename}
     except Exception as e:
@@ -405,32 +715,55 @@ def delete_file(filename: str):
     try:
         if os.path.exists(file_path):
             os.remove(file_path)
+            context_refresher.trigger(filename)
+            notify_file_change(filename, "deleted")
             return {"status": "deleted", "filename": filename}
         return {"error": "File not found"}
     except Exception as e:
         return {"error": str(e)}
 
+def _write_text(path: str, content: str):
+    with open(path, "w") as f:
+        f.write(content)
+
+def _remove_if_exists(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+
 class ApprovalRequest(BaseModel):
     content: str = None # Optional edited content for scripts
 
 @app.post("/approvals/{request_id}/approve")
-def approve_request(request_id: str, body: ApprovalRequest = None):
-    """The Human clicks 'Approve'."""
-    if request_id not in approval_queue:
+async def approve_request(request_id: str, body: ApprovalRequest = None):
+    """
+    The Human clicks 'Approve'. The command/script is queued as a background
+    job; follow its output on /jobs/{job_id}/stream.
+    """
+    # The store is synchronous SQLite: kept off the event loop
+    req = await asyncio.to_thread(APPROVALS.get, request_id)
+    if req is None:
         return {"error": "Request not found"}
-    
-    req = approval_queue[request_id]
+    if req["status"] != "PENDING":
+        return {"error": f"Request already {req['status'].lower()}"}
+
+    async def on_finish(job):
+        done = await asyncio.to_thread(APPROVALS.update, request_id, status="EXECUTED", job_status=job.status,
+                                       result=job.result_text()[-MAX_RESULT_CHARS:])
+        if done:
+            EVENTS.publish("approvals", done)
     
     # EXECUTE THE LOGIC HERE
     if req["tool"] == "run_terminal_command":
         command = req.get("command")
         if not command:
             return {"error": "No command found in request"}
-            
-        # Use the secure run_command from monitoring.py which handles pipes safely
-        output = run_command(command)
-        req["status"] = "EXECUTED"
-        return {"status": "success", "result": output}
+
+        # Same pipe-safe parsing as the monitors (no shell)
+        try:
+            stages = compile_command(command)
+        except ValueError as e:
+            return {"error": f"Invalid command: {e}"}
+        description, cleanup = command, None
 
     elif req["tool"] == "execute_script":
         # 1. Get content (Edited > Original)
@@ -441,42 +774,40 @@ def approve_request(request_id: str, body: ApprovalRequest = None):
         if not script_content:
             return {"error": "No script content found"}
             
-        # 2. Save to temp file
+        # 2. Save to temp file (the job deletes it when it ends)
         filename = f"approved_script_{request_id}.py"
-        file_path = os.path.join("./agent_workspace", filename)
-        
+        file_path = os.path.join(WORKSPACE_DIR, filename)
         try:
-            with open(file_path, "w") as f:
-                f.write(script_content)
-                
-            # 3. Execute
-            import sys
-            import subprocess
-            
-            result = subprocess.run(
-                [sys.executable, file_path], 
-                capture_output=True, 
-                text=True, 
-                timeout=30
-            )
-            output = result.stdout + result.stderr
-            
-            # 4. Delete
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                
-            req["status"] = "EXECUTED"
-            return {"status": "success", "result": output}
-            
-        except Exception as e:
+            await asyncio.to_thread(_write_text, file_path, script_content)
+        except OSError as e:
             return {"error": f"Script execution failed: {e}"}
+        stages, description, cleanup = [[sys.executable, file_path]], filename, file_path
 
-    return {"error": "Unknown tool type"}
+    else:
+        return {"error": "Unknown tool type"}
+
+    # 3. Claim the request (only one approval can win), then execute in the background
+    # `worker` (this process's boot id) lets other processes tell jobs that died with it (see fail_orphaned)
+    req = await asyncio.to_thread(APPROVALS.update, request_id, expected_status="PENDING", status="APPROVED", worker=BOOT_ID)
+    if req is None:
+        if cleanup:
+            await asyncio.to_thread(_remove_if_exists, cleanup)
+        return {"error": "Request is no longer pending"}
+    job = JOBS.submit(stages, description, cleanup=cleanup, on_finish=on_finish)
+    req = await asyncio.to_thread(APPROVALS.update, request_id, job_id=job.id)
+    EVENTS.publish("approvals", req)
+    return {"status": "queued", "job_id": job.id}
 
 @app.post("/approvals/{request_id}/deny")
 def deny_request(request_id: str):
-    if request_id in approval_queue:
-        approval_queue[request_id]["status"] = "DENIED"
+    req = APPROVALS.get(request_id)
+    if req is None:
+        return {"error": "Request not found"}
+    denied = APPROVALS.update(request_id, expected_status="PENDING", status="DENIED")
+    if denied is None:
+        current = APPROVALS.get(request_id) or req
+        return {"error": f"Request already {current['status'].lower()}"}
+    EVENTS.publish("approvals", denied)
     return {"status": "denied"}
 
 class ExecuteScriptRequest(BaseModel):
@@ -484,48 +815,74 @@ class ExecuteScriptRequest(BaseModel):
     content: str
 
 @app.post("/execute-script")
-def execute_script(request: ExecuteScriptRequest):
+async def execute_script(request: ExecuteScriptRequest):
     """
     Executes a Python script after user review.
     1. Overwrites the file with the (potentially edited) content.
-    2. Executes it.
-    3. Deletes the file.
-    4. Returns output.
+    2. Queues it as a background job.
+    3. The job deletes the file when it ends.
+    4. Returns the job id (output on /jobs/{job_id}/stream).
     """
-    file_path = os.path.join("./agent_workspace", request.filename)
+    file_path = os.path.join(WORKSPACE_DIR, request.filename)
     
     # Security Check: Ensure it's in the workspace
-    if not os.path.abspath(file_path).startswith(os.path.abspath("./agent_workspace")):
+    if not os.path.abspath(file_path).startswith(os.path.abspath(WORKSPACE_DIR)):
          return {"error": "Access denied: Path traversal detected."}
 
     try:
         # 1. Save Content
         with open(file_path, "w") as f:
             f.write(request.content)
-            
-        # 2. Execute
-        # Use the same python environment
-        import sys
-        import subprocess
-        
-        result = subprocess.run(
-            [sys.executable, file_path], 
-            capture_output=True, 
-            text=True, 
-            timeout=30
-        )
-        
-        output = result.stdout + result.stderr
-        
-        # 3. Delete
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            
-        return {"status": "success", "output": output}
-        
-    except Exception as e:
+    except OSError as e:
         return {"error": f"Execution failed: {e}"}
 
+    # 2. Execute with the same python environment
+    job = JOBS.submit([[sys.executable, file_path]], request.filename, cleanup=file_path)
+    return {"status": "queued", "job_id": job.id}
+
+@app.get("/jobs")
+def list_jobs():
+    """Recent background jobs of this worker, then those of other workers, newest first."""
+    local = JOBS.list()
+    ids = {job["id"] for job in local}
+    return {"jobs": local + [job for job in REMOTE_JOBS.list() if job["id"] not in ids]}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str, tail: int = 200):
+    job = JOBS.get(job_id)
+    if job is None:
+        remote = REMOTE_JOBS.get(job_id)
+        if remote is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return {**remote, "remote": True}
+    return job.summary(tail=max(1, min(tail, MAX_OUTPUT_LINES)))
+
+@app.get("/jobs/{job_id}/stream")
+async def stream_job(job_id: str):
+    """
+    Live job output (auth via ?token=): one `data:` line per output line, then `event: done`.
+    Jobs of another worker stream their status changes, then their final output tail.
+    """
+    job = JOBS.get(job_id)
+    if job is None:
+        if REMOTE_JOBS.get(job_id) is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return StreamingResponse(REMOTE_JOBS.stream(job_id), media_type="text/event-stream")
+    return StreamingResponse(JOBS.stream(job), media_type="text/event-stream")
+
+@app.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    if JOBS.get(job_id) is None:
+        remote = REMOTE_JOBS.get(job_id)
+        if remote is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if remote["status"] in JOB_FINISHED:
+            return {"cancelled": False}
+        # The worker running it cancels it when the request reaches it
+        EVENTS.publish("job_cancel", {"id": job_id}, clients=False)
+        return {"cancelled": True, "forwarded": True}
+    return {"cancelled": JOBS.cancel(job_id)}
+
 # Endpoint 1: List files for the Sidebar
 @app.get("/files")
 def get_files():
@@ -540,92 +897,115 @@ def get_files():
 
 @app.post("/upload-runbook")
 async def upload_runbook(file: UploadFile = File(...)):
-    global current_runbook
-    file_path = f"./agent_workspace/{file.filename}"
-    with open(file_path, "wb+") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    uploaded_file = genai.upload_file(path=file_path, display_name="Company Runbook")
-    while uploaded_file.state.name == "PROCESSING":
-        await asyncio.sleep(1)
-        uploaded_file = genai.get_file(uploaded_file.name)
+    """
+    Registers a runbook and indexes it in the background.
+    Poll GET /runbooks/{id} for progress; re-uploading identical content reuses it.
+    """
+    data = await file.read()
+    loop = asyncio.get_running_loop()
+    record, deduplicated = await loop.run_in_executor(None, runbook_store.ingest, file.filename, data)
+    return {
+        "status": "indexed" if record["status"] == "ACTIVE" else "processing",
+        "id": record["id"],
+        "filename": record["filename"],
+        "deduplicated": deduplicated,
+    }
+
+@app.get("/runbooks")
+def list_runbooks():
+    return {"runbooks": runbook_store.list()}
+
+@app.get("/runbooks/{runbook_id}")
+def get_runbook(runbook_id: str):
+    record = runbook_store.get(runbook_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Runbook not found")
+    return record
+
+@app.delete("/runbooks/{runbook_id}")
+def delete_runbook(runbook_id: str):
+    if not runbook_store.delete(runbook_id):
+        raise HTTPException(status_code=404, detail="Runbook not found")
+    return {"status": "deleted", "id": runbook_id}
+
+async def agent_turn(chat_session, message_content):
+    """
+    Runs one agent turn on a chat session and yields SSE events: streamed
+    model text, tool logs, and tool round trips until the model answers.
+    """
+    # Loop until the model answers with text instead of a tool call
+    while True:
+        # 1. Stream the model output, forwarding tokens as they arrive
+        response = None
+        streamed_text = False
+        async for kind, value in stream_message(chat_session, message_content):
+            if kind == "text":
+                streamed_text = True
+                yield sse(value)
+            else:
+                response = value
+
+        calls = function_calls(response)
+        if not calls:
+            if not streamed_text:
+                # Fallback if no text (e.g. safety block)
+                yield sse("Everything is working fine.")
+            break
+
+        tool_calls = [(fc.name, dict(fc.args)) for fc in calls]
+        
+        # STREAM LOG: Thinking/Calling
+        names = ", ".join(f"`{name}`" for name, _ in tool_calls)
+        yield sse(f"[LOG] 🤖 Agent is thinking... Decided to call tool: {names}")
+        for tool_name, tool_args in tool_calls:
+            yield sse(f"[LOG] 🛠️ Executing: `{tool_name}` with args: `{json.dumps(tool_args)}`")
+        
+        # EXECUTE every call of this turn (independent tools in parallel)
+        results = await run_tools(TOOL_MAP, tool_calls)
+            
+        # STREAM LOG: Output
+        for (tool_name, _), result in zip(tool_calls, results):
+            yield sse(f"[LOG] 📝 Tool Output ({tool_name}): {str(result)[:300]}...")
         
-    current_runbook = uploaded_file
-    return {"status": "indexed", "filename": file.filename}
+        # SEND BACK TO MODEL
+        # All function responses go back in a single message
+        message_content = [
+            {
+                "function_response": {
+                    "name": tool_name,
+                    "response": {"result": result} 
+                }
+            }
+            for (tool_name, _), result in zip(tool_calls, results)
+        ]
 
 @app.get("/stream-test")
-async def stream_test(prompt: str):
-    global current_runbook
+async def stream_test(prompt: str, token: str = None, conversation_id: str = None):
+    # EventSource cannot send headers, so the conversation is identified by query params
+    # (the middleware already rejected tokens that are not a live session)
+    entry = chat_pool.get(session_key(token, conversation_id))
     
     async def event_generator():
         try:
-            message_content = [prompt]
-            if current_runbook:
-                message_content.append(current_runbook)
-
-            # 1. Send User Prompt
-            response = chat_session.send_message(message_content, stream=False)
-            
-            # 2. Loop until text
-            while True:
-                # Check for function call in the first part
-                part = response.candidates[0].content.parts[0]
-                
-                if part.function_call:
-                    fc = part.function_call
-                    tool_name = fc.name
-                    tool_args = dict(fc.args)
-                    
-                    # STREAM LOG: Thinking/Calling
-                    yield f"data: [LOG] 🤖 Agent is thinking... Decided to call tool: `{tool_name}`\n\n"
-                    await asyncio.sleep(0.05)
-                    yield f"data: [LOG] 🛠️ Executing: `{tool_name}` with args: `{json.dumps(tool_args)}`\n\n"
-                    await asyncio.sleep(0.05)
-                    
-                    # EXECUTE
-                    if tool_name in TOOL_MAP:
-                        try:
-                            # Call the function
-                            result = TOOL_MAP[tool_name](**tool_args)
-                        except Exception as e:
-                            result = f"Error executing tool: {e}"
-                    else:
-                        result = f"Error: Tool '{tool_name}' not found."
-                        
-                    # STREAM LOG: Output
-                    yield f"data: [LOG] 📝 Tool Output: {str(result)[:300]}...\n\n"
-                    await asyncio.sleep(0.05)
-                    
-                    # SEND BACK TO MODEL
-                    # Construct the function response part
-                    function_response_part = {
-                        "function_response": {
-                            "name": tool_name,
-                            "response": {"result": result} 
-                        }
-                    }
-                    
-                    response = chat_session.send_message(function_response_part, stream=False)
-                    
-                else:
-                    # Text Response (Final Answer)
-                    try:
-                        full_text = response.text
-                    except Exception:
-                        # Fallback if no text (e.g. safety block)
-                        full_text = "Everything is working fine."
-
-                    chunk_size = 10
-                    for i in range(0, len(full_text), chunk_size):
-                        chunk = full_text[i:i+chunk_size]
-                        clean_chunk = chunk.replace("\n", "\n") 
-                        yield f"data: {clean_chunk}\n\n"
-                        await asyncio.sleep(0.02)
-                    break
+            # Attach only the workspace chunks relevant to this prompt
+            loop = asyncio.get_running_loop()
+            context = await loop.run_in_executor(AGENT_EXECUTOR, workspace_index.context_for, prompt)
+            # Context (and the runbook files) go in their own parts so compact_history can drop them from the stored turn
+            message_content = [context, prompt] if context else [prompt]
+            message_content.extend(await loop.run_in_executor(AGENT_EXECUTOR, runbook_store.active_handles))
+
+            if entry.lock.locked():
+                yield sse("[LOG] ⏳ Waiting for the previous request in this conversation to finish...")
+            async with entry.lock:
+                session = chat_pool.session_for(entry)
+                async for event in agent_turn(session, message_content):
+                    yield event
+                # Fold old turns into a summary so per-turn latency stays flat
+                entry.update_history(await loop.run_in_executor(AGENT_EXECUTOR, compact_history, session))
 
         except Exception as e:
             print(f"Error: {e}")
-            yield f"data: [ERROR] {str(e)}\n\n"
+            yield sse(f"[ERROR] {str(e)}")
 
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
@@ -1,85 +1,425 @@
+import os
+import glob
+import signal
+import socket
+import selectors
 import subprocess
 import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
 
 logger = logging.getLogger("uvicorn")
 
 import shlex
 
-def run_command(command: str) -> str:
+# Per-monitor timeout (seconds) when a monitor does not set its own "timeout"
+DEFAULT_MONITOR_TIMEOUT = 10
+# Max monitors running at once when config.json has no "monitor_concurrency"
+DEFAULT_MONITOR_CONCURRENCY = int(os.getenv("MONITOR_CONCURRENCY", "8"))
+
+# Output kept per stream; beyond it only the first and last halves are retained
+MAX_CAPTURE_BYTES = 64 * 1024
+# Seconds to wait for killed processes to be reaped
+KILL_WAIT = 2
+
+class _Capture:
+    """Bounded capture of one stream: keeps the first and last `limit // 2` bytes."""
+
+    def __init__(self, limit: int = MAX_CAPTURE_BYTES):
+        self.half = limit // 2
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.dropped = 0
+
+    def feed(self, data: bytes):
+        room = self.half - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if data:
+            self.tail += data
+            excess = len(self.tail) - self.half
+            if excess > 0:
+                del self.tail[:excess]
+                self.dropped += excess
+
+    def text(self) -> str:
+        head = self.head.decode("utf-8", errors="replace")
+        tail = self.tail.decode("utf-8", errors="replace")
+        if self.dropped:
+            return f"{head}\n[... {self.dropped} bytes truncated ...]\n{tail}"
+        return head + tail
+
+def _kill_group(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def run_pipeline(stages: list, timeout: float = DEFAULT_MONITOR_TIMEOUT, max_bytes: int = MAX_CAPTURE_BYTES) -> dict:
+    """
+    Runs an argv pipeline without a shell. Every stage's stderr and the last
+    stage's stdout are drained together through one selector (no thread per
+    stream, so a chatty stage can never fill its pipe and stall the pipeline),
+    each capped at `max_bytes` with head/tail retention. Each stage runs in its
+    own process group; on timeout every group is killed, grandchildren included.
+    Returns {"stdout", "stderr": [per stage], "stages": [{"command",
+    "returncode", "duration"}], "timed_out"}. Raises FileNotFoundError if a
+    stage's program does not exist.
+    """
+    deadline = time.monotonic() + timeout
+    selector = selectors.DefaultSelector()
+    procs, started, finished = [], [], []
+    stdout = _Capture(max_bytes)
+    stderr = [_Capture(max_bytes) for _ in stages]
+    timed_out = completed = False
+    try:
+        stdin = subprocess.DEVNULL
+        for index, args in enumerate(stages):
+            last = index == len(stages) - 1
+            try:
+                proc = subprocess.Popen(
+                    args, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                    start_new_session=True,
+                )
+            finally:
+                # The child holds its own copy; ours must go so the writer sees SIGPIPE/EOF
+                if stdin is not subprocess.DEVNULL:
+                    stdin.close()
+            procs.append(proc)
+            started.append(time.monotonic())
+            finished.append(None)
+            selector.register(proc.stderr, selectors.EVENT_READ, (stderr[index], index))
+            if last:
+                selector.register(proc.stdout, selectors.EVENT_READ, (stdout, None))
+            else:
+                stdin = proc.stdout
+
+        # 1. Drain every stream until all are closed (or the deadline passes)
+        while selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                timed_out = True
+                break
+            for key, _ in selector.select(remaining):
+                data = os.read(key.fd, 65536)
+                capture, index = key.data
+                if data:
+                    capture.feed(data)
+                    continue
+                selector.unregister(key.fileobj)
+                key.fileobj.close()
+                if index is not None:
+                    # stderr closes when the stage exits: close enough for its duration
+                    finished[index] = time.monotonic()
+
+        # 2. Reap the stages
+        for index, proc in enumerate(procs):
+            if timed_out:
+                break
+            try:
+                proc.wait(timeout=max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                timed_out = True
+            else:
+                finished[index] = finished[index] or time.monotonic()
+        completed = True
+    finally:
+        if timed_out or not completed:
+            for proc in procs:
+                _kill_group(proc)
+        for proc in procs:
+            try:
+                proc.wait(timeout=KILL_WAIT)
+            except subprocess.TimeoutExpired:
+                pass
+        for key in list(selector.get_map().values()):
+            key.fileobj.close()
+        selector.close()
+
+    now = time.monotonic()
+    return {
+        "stdout": stdout.text(),
+        "stderr": [capture.text() for capture in stderr],
+        "stages": [
+            {
+                "command": args[0],
+                "returncode": proc.returncode,
+                "duration": round((finished[index] or now) - started[index], 3),
+            }
+            for index, (args, proc) in enumerate(zip(stages, procs))
+        ],
+        "timed_out": timed_out,
+    }
+
+def run_command(command, timeout: float = DEFAULT_MONITOR_TIMEOUT, details: dict = None) -> str:
     """
     Executes a shell command securely without shell=True.
-    Supports pipes (|) by chaining subprocesses.
+    Supports pipes (|) by chaining subprocesses (see run_pipeline).
+    `command` is either a command string or an argv pipeline that was
+    already parsed once (see config.compile_command). If `details` is given,
+    it receives the per-stage exit codes and durations under "stages".
     """
     try:
-        # 1. Split by pipe if present
-        parts = command.split('|')
-        
-        # 2. Prepare the first process
-        # shlex.split parses arguments safely (e.g. handles quotes)
-        args = shlex.split(parts[0].strip())
-        
-        if not args:
+        if isinstance(command, str):
+            # shlex.split parses arguments safely (e.g. handles quotes)
+            stages = [shlex.split(part.strip()) for part in command.split('|')]
+        else:
+            stages = [list(args) for args in command]
+        stages = [args for args in stages if args]
+        if not stages:
             return "Error: Empty command"
 
-        # Keep track of all processes to wait for them
-        procs = []
-        
-        # Start first process
-        last_proc = subprocess.Popen(
-            args, 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        procs.append(last_proc)
-        
-        # 3. Chain subsequent processes
-        for part in parts[1:]:
-            args = shlex.split(part.strip())
-            if not args:
-                continue
-                
-            # Start next process, connecting input to previous output
-            proc = subprocess.Popen(
-                args,
-                stdin=last_proc.stdout,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            # Allow previous process to receive SIGPIPE if next exits
-            last_proc.stdout.close() 
-            last_proc = proc
-            procs.append(last_proc)
-            
-        # 4. Get final output
-        stdout, stderr = last_proc.communicate(timeout=10)
-        
-        # Wait for all previous processes to ensure no zombies
-        for p in procs[:-1]:
-            p.wait()
-        
-        if last_proc.returncode != 0:
-            return f"Error (Exit Code {last_proc.returncode}): {stderr.strip()}"
-            
-        return stdout.strip()
-
-    except subprocess.TimeoutExpired:
-        last_proc.kill()
-        return "Error: Command timed out."
+        result = run_pipeline(stages, timeout)
     except FileNotFoundError:
         return "Error: Command not found."
     except Exception as e:
         return f"Error executing command: {str(e)}"
 
-def check_monitors(monitors: list) -> dict:
-    """Iterates through configured monitors and runs them."""
-    results = {}
-    for monitor in monitors:
-        name = monitor.get("name")
-        command = monitor.get("command")
-        if name and command:
-            logger.info(f"Running monitor: {name} -> {command}")
-            output = run_command(command)
-            results[name] = output
-    return results
+    if details is not None:
+        details["stages"] = result["stages"]
+    if result["timed_out"]:
+        return "Error: Command timed out."
+
+    # Like a shell without pipefail: the last stage decides (grep finding nothing mid-pipe is fine)
+    returncode = result["stages"][-1]["returncode"]
+    if returncode != 0:
+        message = result["stderr"][-1].strip() or "; ".join(e.strip() for e in result["stderr"] if e.strip())
+        return f"Error (Exit Code {returncode}): {message}"
+    return result["stdout"].strip()
+
+# --- Native monitor types ---
+# Monitors with a "type" run one of these in-process instead of forking a
+# command pipeline. Each check gets the monitor's config and its timeout and
+# returns output in the same shape as a command ("Error..." on failure).
+MONITOR_TYPES = {}
+# Monitor name -> thread of a native check that outlived its timeout
+_hung_checks = {}
+_hung_lock = threading.Lock()
+
+def monitor_type(name: str, required: tuple = (), one_of: tuple = ()):
+    """
+    Registers a native monitor type. `required` lists its mandatory config
+    keys, `one_of` keys of which at least one must be set.
+    """
+    def register(check):
+        check.required = required
+        check.one_of = one_of
+        MONITOR_TYPES[name] = check
+        return check
+    return register
+
+def _run_check(check, kind: str, monitor: dict, timeout: float) -> str:
+    """
+    Runs a native check on its own daemon thread and gives up after `timeout`:
+    a syscall stuck on a dead mount cannot hold a scheduler thread. A hung
+    check is not started again for the same monitor until it returns.
+    """
+    name = monitor.get("name", kind)
+    with _hung_lock:
+        hung = _hung_checks.get(name)
+        if hung is not None:
+            if hung.is_alive():
+                return f"Error: {kind} check still hung from a previous run"
+            del _hung_checks[name]
+
+    result = {}
+    def target():
+        try:
+            result["output"] = check(monitor, timeout)
+        except Exception as e:
+            result["output"] = f"Error: {kind} check failed: {e}"
+
+    thread = threading.Thread(target=target, name=f"check-{name}", daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        with _hung_lock:
+            _hung_checks[name] = thread
+        return f"Error: {kind} check timed out after {timeout:g}s"
+    return result["output"]
+
+# /proc/net/tcp "st" column
+TCP_STATES = {
+    "01": "ESTABLISHED", "02": "SYN_SENT", "03": "SYN_RECV", "04": "FIN_WAIT1",
+    "05": "FIN_WAIT2", "06": "TIME_WAIT", "07": "CLOSE", "08": "CLOSE_WAIT",
+    "09": "LAST_ACK", "0A": "LISTEN", "0B": "CLOSING",
+}
+
+@monitor_type("disk_usage")
+def check_disk_usage(monitor: dict, timeout: float) -> str:
+    """Usage of the filesystem holding "path" (default /), computed like df."""
+    path = monitor.get("path", "/")
+    st = os.statvfs(path)
+    total = st.f_blocks * st.f_frsize
+    free = st.f_bavail * st.f_frsize
+    used = (st.f_blocks - st.f_bfree) * st.f_frsize
+    percent = -(-used * 100 // (used + free)) if used + free else 0
+    return f"{path} {percent}% used ({free / 1024**3:.1f}G free of {total / 1024**3:.1f}G)"
+
+@monitor_type("tcp_connections")
+def check_tcp_connections(monitor: dict, timeout: float) -> str:
+    """
+    Counts TCP sockets in "state" (default ESTABLISHED, or "ALL" for a
+    breakdown) from /proc/net/tcp and tcp6, optionally only on local "port".
+    """
+    state = str(monitor.get("state", "ESTABLISHED")).upper()
+    port = monitor.get("port")
+    port_hex = f":{int(port):04X}" if port is not None else None
+    counts = Counter()
+    found = False
+    for path in ("/proc/net/tcp", "/proc/net/tcp6"):
+        try:
+            with open(path, "r") as f:
+                next(f, None)  # header
+                for line in f:
+                    fields = line.split(None, 4)
+                    if len(fields) < 4 or (port_hex and not fields[1].endswith(port_hex)):
+                        continue
+                    counts[fields[3]] += 1
+            found = True
+        except FileNotFoundError:
+            continue
+    if not found:
+        return "Error: /proc/net/tcp is not available on this host"
+    if state == "ALL":
+        breakdown = ", ".join(f"{TCP_STATES.get(code, code)}={n}" for code, n in counts.most_common())
+        return f"{sum(counts.values())} ({breakdown})"
+    codes = [code for code, label in TCP_STATES.items() if label == state]
+    if not codes:
+        return f"Error: unknown TCP state '{state}'"
+    return str(counts[codes[0]])
+
+@monitor_type("load_average")
+def check_load_average(monitor: dict, timeout: float) -> str:
+    """1, 5 or 15 minute load average ("period"), per CPU if "per_cpu" is set."""
+    periods = {1: 0, 5: 1, 15: 2}
+    period = int(monitor.get("period", 1))
+    if period not in periods:
+        return f"Error: load_average period must be 1, 5 or 15, got {period}"
+    load = os.getloadavg()[periods[period]]
+    if monitor.get("per_cpu"):
+        load /= os.cpu_count() or 1
+    return f"{load:.2f}"
+
+@monitor_type("process_alive", one_of=("process", "pidfile"))
+def check_process_alive(monitor: dict, timeout: float) -> str:
+    """Checks that a process named "process" runs, or that the pid in "pidfile" is alive."""
+    pidfile = monitor.get("pidfile")
+    if pidfile:
+        try:
+            with open(pidfile, "r") as f:
+                pid = int(f.read().strip())
+            os.kill(pid, 0)
+        except (OSError, ValueError) as e:
+            return f"Error: process from {pidfile} is not running ({e})"
+        return f"running (pid {pid})"
+
+    process = monitor.get("process")
+    if not process:
+        return "Error: process_alive needs \"process\" or \"pidfile\""
+    pids = []
+    for comm_path in glob.glob("/proc/[0-9]*/comm"):
+        try:
+            with open(comm_path, "r") as f:
+                # comm is truncated to 15 characters by the kernel
+                if f.read().strip() == process[:15]:
+                    pids.append(int(comm_path.split("/")[2]))
+        except (OSError, ValueError):
+            continue
+    if not pids:
+        return f"Error: process '{process}' is not running"
+    return f"running ({len(pids)} processes, pids: {', '.join(map(str, sorted(pids)[:10]))})"
+
+@monitor_type("port_open", required=("port",))
+def check_port_open(monitor: dict, timeout: float) -> str:
+    """Opens a TCP connection to "host" (default 127.0.0.1) on "port"."""
+    host = monitor.get("host", "127.0.0.1")
+    port = int(monitor["port"])
+    started = time.monotonic()
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            pass
+    except OSError as e:
+        return f"Error: {host}:{port} is not accepting connections ({e})"
+    return f"open ({(time.monotonic() - started) * 1000:.1f} ms)"
+
+@monitor_type("file_age", required=("path",))
+def check_file_age(monitor: dict, timeout: float) -> str:
+    """Seconds since "path" was last modified (e.g. a backup or heartbeat file)."""
+    path = monitor["path"]
+    try:
+        age = time.time() - os.stat(path).st_mtime
+    except FileNotFoundError:
+        return f"Error: file not found: {path}"
+    return f"{max(0.0, age):.0f}"
+
+def is_runnable(monitor: dict) -> bool:
+    """A monitor needs a name and either a native "type" or a "command"."""
+    return bool(monitor.get("name") and (monitor.get("type") or monitor.get("command")))
+
+def describe_monitor(monitor: dict) -> str:
+    return f"type {monitor['type']}" if monitor.get("type") else monitor.get("command", "")
+
+def run_monitor(monitor: dict, timeout: float = None, details: dict = None) -> str:
+    """
+    Runs one monitor: its native check if it has a "type", else its command
+    pipeline (whose per-stage results go into `details`, see run_command).
+    """
+    timeout = monitor_timeout(monitor) if timeout is None else timeout
+    kind = monitor.get("type")
+    if not kind:
+        return run_command(monitor.get("pipeline") or monitor["command"], timeout, details)
+    check = MONITOR_TYPES.get(kind)
+    if check is None:
+        return f"Error: Unknown monitor type '{kind}'"
+    return _run_check(check, kind, monitor, timeout)
+
+def monitor_timeout(monitor: dict) -> float:
+    """Returns the timeout (seconds) configured for a monitor."""
+    try:
+        return float(monitor.get("timeout", DEFAULT_MONITOR_TIMEOUT))
+    except (TypeError, ValueError):
+        return DEFAULT_MONITOR_TIMEOUT
+
+def check_monitors(monitors: list, max_concurrency: int = None) -> dict:
+    """
+    Runs the configured monitors concurrently on a bounded thread pool.
+    Each monitor may set its own "timeout" (seconds). A tick takes roughly as
+    long as the slowest monitor; anything still running when the tick deadline
+    passes is reported as timed out, so callers always get a partial result.
+    """
+    runnable = [m for m in monitors if is_runnable(m)]
+    if not runnable:
+        return {}
+
+    workers = max(1, min(max_concurrency or DEFAULT_MONITOR_CONCURRENCY, len(runnable)))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="monitor")
+    futures = {}
+    try:
+        for monitor in runnable:
+            name = monitor["name"]
+            logger.info(f"Running monitor: {name} -> {describe_monitor(monitor)}")
+            futures[name] = executor.submit(run_monitor, monitor)
+
+        # Queued monitors only start once a slot frees up, so the tick deadline
+        # covers every "wave" of the pool plus a little grace for process cleanup.
+        waves = -(-len(runnable) // workers)
+        deadline = max(monitor_timeout(m) for m in runnable) * waves + 1
+        wait(futures.values(), timeout=deadline)
+
+        results = {}
+        for name, future in futures.items():
+            if future.done():
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    results[name] = f"Error executing command: {str(e)}"
+            else:
+                results[name] = "Error: Monitor timed out."
+        return results
+    finally:
+        # Never block the tick on stragglers; queued monitors are dropped
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,132 @@
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger("uvicorn")
+
+# Seconds to wait for more notifications before sending, so bursts become one digest
+COALESCE_WINDOW = 2.0
+REQUEST_TIMEOUT = 5
+MAX_ATTEMPTS = 4
+# Pending notifications beyond this are dropped (the agent must never block on Discord)
+MAX_QUEUED = 1000
+# Discord rejects messages longer than this
+DISCORD_MESSAGE_LIMIT = 2000
+
+def split_message(content: str, limit: int = DISCORD_MESSAGE_LIMIT) -> list:
+    """Splits a message into Discord-sized pieces, preferring line breaks."""
+    pieces = []
+    while len(content) > limit:
+        cut = content.rfind("\n", 0, limit)
+        cut = cut if cut > 0 else limit
+        pieces.append(content[:cut])
+        content = content[cut:].lstrip("\n")
+    if content:
+        pieces.append(content)
+    return pieces
+
+class DiscordNotifier:
+    """
+    Background Discord dispatcher. notify() only enqueues; a worker thread
+    coalesces bursts into digest messages per webhook and posts them over a
+    pooled keep-alive session, retrying with 429 retry_after / backoff.
+    """
+
+    def __init__(self, get_webhooks):
+        self.get_webhooks = get_webhooks
+        self._queue = queue.Queue(maxsize=MAX_QUEUED)
+        self._lock = threading.Lock()
+        self._worker = None
+        self._session = requests.Session()
+        self._session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def notify(self, content: str, webhooks: list = None) -> int:
+        """
+        Queues a message for every webhook (default: all configured ones).
+        Returns the number of webhooks it was queued for.
+        """
+        targets = list(webhooks) if webhooks is not None else self.get_webhooks()
+        if not targets:
+            return 0
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((tuple(targets), content))
+        except queue.Full:
+            self.dropped += 1
+            logger.warning("Discord notification queue full, dropping message")
+            return 0
+        return len(targets)
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="discord-notifier", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + COALESCE_WINDOW
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            # Group per webhook, keeping arrival order
+            per_webhook = OrderedDict()
+            for targets, content in batch:
+                for webhook in targets:
+                    per_webhook.setdefault(webhook, []).append(content)
+
+            for webhook, messages in per_webhook.items():
+                if len(messages) == 1:
+                    body = messages[0]
+                else:
+                    body = f"📋 **OPS-GUARDIAN DIGEST** ({len(messages)} notifications)\n\n" + "\n\n---\n\n".join(messages)
+                for piece in split_message(body):
+                    self._post(webhook, piece)
+
+    def _post(self, webhook: str, content: str):
+        delay = 1.0
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                response = self._session.post(webhook, json={"content": content}, timeout=REQUEST_TIMEOUT)
+                if response.status_code < 300:
+                    self.sent += 1
+                    return
+                if response.status_code == 429:
+                    # Discord tells us exactly how long to back off
+                    try:
+                        wait = float(response.json().get("retry_after", delay))
+                    except ValueError:
+                        wait = float(response.headers.get("Retry-After", delay))
+                    time.sleep(wait)
+                    continue
+                if response.status_code < 500:
+                    logger.error(f"Discord webhook rejected message ({response.status_code}): {response.text[:200]}")
+                    break
+            except requests.RequestException as e:
+                logger.warning(f"Discord webhook attempt {attempt} failed: {e}")
+            time.sleep(delay)
+            delay *= 2
+        self.failed += 1
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "sent": self.sent,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
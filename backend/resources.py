@@ -0,0 +1,229 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("uvicorn")
+
+# Seconds between two snapshots
+SAMPLE_INTERVAL = float(os.getenv("RESOURCE_SAMPLE_INTERVAL", "5"))
+# Processes listed per ranking (by CPU and by resident memory)
+TOP_PROCESSES = 5
+# Pseudo/readonly filesystems not worth reporting
+IGNORED_FSTYPES = {"squashfs", "iso9660", "devtmpfs", "proc", "sysfs", "cgroup", "cgroup2"}
+
+MB = 1024 ** 2
+GB = 1024 ** 3
+
+def _rate(current: float, previous: float, elapsed: float) -> float:
+    return round(max(0.0, current - previous) / elapsed, 1) if elapsed > 0 else 0.0
+
+class ResourceSampler:
+    """
+    Background thread that keeps a rolling snapshot of the host: per-core CPU,
+    memory, every mounted disk, disk/network I/O rates and the top processes.
+    Readers get the latest snapshot immediately instead of sampling (and
+    sleeping) themselves. Each snapshot is also fed into the metric history.
+    """
+
+    def __init__(self, history=None, interval: float = SAMPLE_INTERVAL, top_n: int = TOP_PROCESSES):
+        self.history = history
+        self.interval = interval
+        self.top_n = top_n
+        self._lock = threading.Lock()
+        self._sample_lock = threading.Lock()   # one sample at a time (I/O rates need ordered samples)
+        self._thread = None
+        self._stop = threading.Event()
+        self._snapshot = None
+        self._previous_io = None   # (monotonic time, disk counters, net counters)
+        try:
+            import psutil
+            self._psutil = psutil
+        except ImportError:
+            self._psutil = None
+
+    @property
+    def available(self) -> bool:
+        return self._psutil is not None
+
+    def start(self):
+        if not self.available:
+            logger.warning("psutil not installed: system resource sampling disabled")
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def latest(self):
+        """The most recent snapshot (sampled on the spot if the thread has not produced one yet)."""
+        if not self.available:
+            return None
+        with self._lock:
+            snapshot = self._snapshot
+        return snapshot or self.sample()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error(f"Resource sampling error: {e}")
+            self._stop.wait(self.interval)
+
+    # --- Sampling ---
+    def sample(self) -> dict:
+        with self._sample_lock:
+            return self._sample()
+
+    def _sample(self) -> dict:
+        psutil = self._psutil
+        now, mono = time.time(), time.monotonic()
+
+        memory = psutil.virtual_memory()
+        swap = psutil.swap_memory()
+        per_core = psutil.cpu_percent(interval=None, percpu=True)
+        snapshot = {
+            "timestamp": now,
+            "cpu": {
+                "percent": round(sum(per_core) / len(per_core), 1) if per_core else 0.0,
+                "per_core": per_core,
+                "load_average": list(os.getloadavg()) if hasattr(os, "getloadavg") else None,
+            },
+            "memory": {
+                "percent": memory.percent,
+                "used_mb": memory.used // MB,
+                "available_mb": memory.available // MB,
+                "total_mb": memory.total // MB,
+                "swap_percent": swap.percent,
+            },
+            "disks": self._disks(),
+        }
+        snapshot.update(self._io_rates(mono))
+        snapshot["processes"] = self._top_processes()
+
+        with self._lock:
+            self._snapshot = snapshot
+        self._record(snapshot)
+        return snapshot
+
+    def _disks(self) -> list:
+        disks, seen = [], set()
+        for partition in self._psutil.disk_partitions(all=False):
+            if partition.fstype in IGNORED_FSTYPES or partition.device in seen:
+                continue
+            seen.add(partition.device)
+            try:
+                usage = self._psutil.disk_usage(partition.mountpoint)
+            except OSError:
+                continue
+            disks.append({
+                "mountpoint": partition.mountpoint,
+                "device": partition.device,
+                "fstype": partition.fstype,
+                "percent": usage.percent,
+                "free_gb": round(usage.free / GB, 1),
+                "total_gb": round(usage.total / GB, 1),
+            })
+        if not disks:
+            # Containers often expose no partition list: report the root filesystem
+            usage = self._psutil.disk_usage("/")
+            disks.append({"mountpoint": "/", "device": None, "fstype": None, "percent": usage.percent,
+                          "free_gb": round(usage.free / GB, 1), "total_gb": round(usage.total / GB, 1)})
+        return disks
+
+    def _io_rates(self, mono: float) -> dict:
+        try:
+            disk = self._psutil.disk_io_counters()
+        except Exception:
+            disk = None
+        net = self._psutil.net_io_counters()
+        previous, self._previous_io = self._previous_io, (mono, disk, net)
+        if previous is None:
+            return {"disk_io": None, "network": None}
+
+        elapsed = mono - previous[0]
+        disk_io = None
+        if disk and previous[1]:
+            old = previous[1]
+            disk_io = {
+                "read_bytes_per_sec": _rate(disk.read_bytes, old.read_bytes, elapsed),
+                "write_bytes_per_sec": _rate(disk.write_bytes, old.write_bytes, elapsed),
+                "read_ops_per_sec": _rate(disk.read_count, old.read_count, elapsed),
+                "write_ops_per_sec": _rate(disk.write_count, old.write_count, elapsed),
+            }
+        old = previous[2]
+        network = {
+            "recv_bytes_per_sec": _rate(net.bytes_recv, old.bytes_recv, elapsed),
+            "sent_bytes_per_sec": _rate(net.bytes_sent, old.bytes_sent, elapsed),
+            "recv_packets_per_sec": _rate(net.packets_recv, old.packets_recv, elapsed),
+            "sent_packets_per_sec": _rate(net.packets_sent, old.packets_sent, elapsed),
+            "errors_per_sec": _rate(net.errin + net.errout, old.errin + old.errout, elapsed),
+        }
+        return {"disk_io": disk_io, "network": network}
+
+    def _top_processes(self) -> dict:
+        processes = []
+        # process_iter() caches Process objects, so cpu_percent is measured since the previous sample
+        for proc in self._psutil.process_iter(["pid", "name", "cpu_percent", "memory_info"]):
+            info = proc.info
+            if info.get("memory_info") is None:
+                continue
+            processes.append({
+                "pid": info["pid"],
+                "name": info["name"],
+                "cpu_percent": info["cpu_percent"] or 0.0,
+                "rss_mb": round(info["memory_info"].rss / MB, 1),
+            })
+        return {
+            "by_cpu": sorted(processes, key=lambda p: p["cpu_percent"], reverse=True)[:self.top_n],
+            "by_memory": sorted(processes, key=lambda p: p["rss_mb"], reverse=True)[:self.top_n],
+            "count": len(processes),
+        }
+
+    def _record(self, snapshot: dict):
+        if self.history is None:
+            return
+        now = snapshot["timestamp"]
+        self.history.record("system.cpu_percent", snapshot["cpu"]["percent"], now)
+        self.history.record("system.memory_percent", snapshot["memory"]["percent"], now)
+        for disk in snapshot["disks"]:
+            if disk["mountpoint"] == "/":
+                self.history.record("system.disk_percent", disk["percent"], now)
+        if snapshot["network"]:
+            self.history.record("system.net_recv_bytes_per_sec", snapshot["network"]["recv_bytes_per_sec"], now)
+            self.history.record("system.net_sent_bytes_per_sec", snapshot["network"]["sent_bytes_per_sec"], now)
+        if snapshot["disk_io"]:
+            self.history.record("system.disk_read_bytes_per_sec", snapshot["disk_io"]["read_bytes_per_sec"], now)
+            self.history.record("system.disk_write_bytes_per_sec", snapshot["disk_io"]["write_bytes_per_sec"], now)
+
+def format_snapshot(snapshot: dict) -> str:
+    """Human/LLM-readable summary of a snapshot."""
+    cpu, memory = snapshot["cpu"], snapshot["memory"]
+    lines = [f"CPU Usage: {cpu['percent']}% (per core: {', '.join(f'{p}%' for p in cpu['per_core'])})"]
+    if cpu["load_average"]:
+        lines.append(f"Load Average: {' / '.join(f'{load:.2f}' for load in cpu['load_average'])}")
+    lines.append(
+        f"Memory Usage: {memory['percent']}% (Used: {memory['used_mb']}MB / Total: {memory['total_mb']}MB, "
+        f"Swap: {memory['swap_percent']}%)"
+    )
+    for disk in snapshot["disks"]:
+        lines.append(f"Disk Usage {disk['mountpoint']}: {disk['percent']}% (Free: {disk['free_gb']}GB)")
+    if snapshot["disk_io"]:
+        io = snapshot["disk_io"]
+        lines.append(f"Disk I/O: read {io['read_bytes_per_sec'] / MB:.2f}MB/s, write {io['write_bytes_per_sec'] / MB:.2f}MB/s")
+    if snapshot["network"]:
+        net = snapshot["network"]
+        lines.append(f"Network: in {net['recv_bytes_per_sec'] / MB:.2f}MB/s, out {net['sent_bytes_per_sec'] / MB:.2f}MB/s, "
+                     f"errors {net['errors_per_sec']}/s")
+    processes = snapshot["processes"]
+    lines.append("Top CPU: " + ", ".join(f"{p['name']}[{p['pid']}] {p['cpu_percent']}%" for p in processes["by_cpu"]))
+    lines.append("Top Memory: " + ", ".join(f"{p['name']}[{p['pid']}] {p['rss_mb']}MB" for p in processes["by_memory"]))
+    age = time.time() - snapshot["timestamp"]
+    lines.append(f"(sampled {age:.0f}s ago)")
+    return "\n".join(lines)
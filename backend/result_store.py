@@ -0,0 +1,127 @@
+import threading
+import time
+from datetime import datetime
+
+from db import connect, DB_FILE
+from monitoring import check_monitors, is_runnable, monitor_timeout
+from scheduler import monitor_interval
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS monitor_results (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    status TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    duration REAL
+);
+CREATE INDEX IF NOT EXISTS idx_monitor_results_timestamp ON monitor_results (timestamp);
+"""
+
+def max_result_age(monitor: dict) -> float:
+    """A result is stale once the monitor has missed two runs (plus its timeout)."""
+    return 2 * monitor_interval(monitor) + monitor_timeout(monitor)
+
+class ResultStore:
+    """
+    Latest result per monitor, published by the watchdog's scheduler.
+    Readers (dashboard, agent tools) get the cached value instead of forking
+    the monitor pipelines again. Results are kept in SQLite so every worker
+    process reads what the leader's watchdog published.
+    """
+
+    def __init__(self, path: str = DB_FILE):
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        self._conn.executescript(_SCHEMA)
+
+    def publish(self, name: str, value: str, duration: float = None):
+        record = {
+            "value": value,
+            "status": "ERROR" if value.startswith("Error") else "OK",
+            "timestamp": time.time(),
+            "duration": round(duration, 3) if duration is not None else None,
+        }
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO monitor_results (name, value, status, timestamp, duration) VALUES (?, ?, ?, ?, ?)",
+                (name, record["value"], record["status"], record["timestamp"], record["duration"]),
+            )
+        return record
+
+    @staticmethod
+    def _record(row) -> dict:
+        return {key: row[key] for key in ("value", "status", "timestamp", "duration")}
+
+    def get(self, name: str):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM monitor_results WHERE name = ?", (name,)).fetchone()
+        return self._record(row) if row else None
+
+    def get_all(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM monitor_results").fetchall()
+        return {row["name"]: self._record(row) for row in rows}
+
+    def updated_since(self, timestamp: float) -> list:
+        """(name, record) pairs published after `timestamp`, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM monitor_results WHERE timestamp > ? ORDER BY timestamp", (timestamp,)
+            ).fetchall()
+        return [(row["name"], self._record(row)) for row in rows]
+
+    def prune(self, names):
+        """Drops results of monitors that are no longer configured."""
+        names = set(names)
+        with self._lock:
+            stored = [row["name"] for row in self._conn.execute("SELECT name FROM monitor_results").fetchall()]
+            for name in stored:
+                if name not in names:
+                    self._conn.execute("DELETE FROM monitor_results WHERE name = ?", (name,))
+
+    def read(self, monitors: list, refresh_stale: bool = False, max_concurrency: int = None) -> dict:
+        """
+        Returns {name: record} for the given monitors. Each record carries
+        value, status, timestamp, duration, age and a `stale` flag. Missing or
+        stale results are only re-executed when `refresh_stale` is set.
+        """
+        now = time.time()
+        stored = self.get_all()
+        records = {}
+        outdated = []
+        for monitor in monitors:
+            name = monitor.get("name")
+            if not is_runnable(monitor):
+                continue
+            record = stored.get(name)
+            if record is None or now - record["timestamp"] > max_result_age(monitor):
+                outdated.append(monitor)
+            records[name] = record
+
+        if refresh_stale and outdated:
+            started = time.monotonic()
+            fresh = check_monitors(outdated, max_concurrency)
+            duration = time.monotonic() - started
+            for name, value in fresh.items():
+                records[name] = self.publish(name, value, duration)
+            outdated = []
+
+        stale_names = {m["name"] for m in outdated}
+        now = time.time()
+        result = {}
+        for name, record in records.items():
+            if record is None:
+                result[name] = {"value": None, "status": "PENDING", "timestamp": None,
+                                "duration": None, "age": None, "stale": True}
+                continue
+            result[name] = {
+                **record,
+                "timestamp": datetime.fromtimestamp(record["timestamp"]).isoformat(timespec="seconds"),
+                "age": round(now - record["timestamp"], 1),
+                "stale": name in stale_names,
+            }
+        return result
+
+    def values(self, monitors: list, refresh_stale: bool = False, max_concurrency: int = None) -> dict:
+        """Same as read() but flattened to {name: value}, the legacy output shape."""
+        return {name: record["value"] for name, record in self.read(monitors, refresh_stale, max_concurrency).items()}
@@ -0,0 +1,186 @@
+import json
+import operator
+import re
+
+from timeseries import numeric_value
+
+OPERATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+# Default unit for rate conditions: change per minute
+DEFAULT_RATE_PER = 60
+
+_NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?")
+
+def _to_number(value):
+    if isinstance(value, bool):
+        return float(value)
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        match = _NUMBER_RE.search(value.replace(",", ""))
+        if match:
+            return float(match.group(0))
+    return None
+
+def _json_path(path: str) -> list:
+    """Splits "data.items.0.value" into ["data", "items", 0, "value"]."""
+    return [int(part) if part.lstrip("-").isdigit() else part for part in path.split(".") if part]
+
+class Condition:
+    def __init__(self, spec: dict):
+        if not isinstance(spec, dict):
+            raise ValueError(f"condition must be an object, got {spec!r}")
+        self.kind = spec.get("type", "threshold")
+        if self.kind not in ("threshold", "rate"):
+            raise ValueError(f"unknown condition type '{self.kind}'")
+        self.op = spec.get("op", ">")
+        if self.op not in OPERATORS:
+            raise ValueError(f"unknown operator '{self.op}'")
+        self.compare = OPERATORS[self.op]
+        self.value = _to_number(spec.get("value"))
+        if self.value is None:
+            raise ValueError("condition needs a numeric 'value'")
+        self.per = _to_number(spec.get("per", DEFAULT_RATE_PER))
+        if self.per is None or self.per <= 0:
+            raise ValueError(f"'per' must be a positive number of seconds, got {spec.get('per')!r}")
+        self.message = spec.get("message")
+
+    def check(self, value: float, rate: float):
+        """Violation message, or None if the condition holds."""
+        subject = value if self.kind == "threshold" else rate
+        if subject is None or not self.compare(subject, self.value):
+            return None
+        if self.message:
+            return self.message
+        if self.kind == "rate":
+            return f"rate {subject:+.2f}/{self.per:g}s {self.op} {self.value:g}"
+        return f"value {subject:g} {self.op} {self.value:g}"
+
+class MonitorRules:
+    """
+    A monitor's extraction rule plus its conditions, compiled once from
+    config.json. Extraction types: "number" (plain number / first percentage),
+    "regex" (a capture group) and "json" (a dotted path into JSON output).
+    """
+
+    def __init__(self, extract, conditions):
+        extract = extract or {"type": "number"}
+        if isinstance(extract, str):
+            extract = {"type": extract}
+        if not isinstance(extract, dict):
+            raise ValueError(f"'extract' must be a type name or an object, got {extract!r}")
+        self.kind = extract.get("type", "number")
+        if self.kind == "regex":
+            try:
+                self.pattern = re.compile(extract["pattern"])
+            except (KeyError, TypeError, re.error) as e:
+                raise ValueError(f"bad regex extraction: {e}")
+            self.group = extract.get("group", 1 if self.pattern.groups else 0)
+            if isinstance(self.group, bool) or not isinstance(self.group, (int, str)):
+                raise ValueError(f"regex 'group' must be a group number or name, got {self.group!r}")
+            if isinstance(self.group, int) and not 0 <= self.group <= self.pattern.groups:
+                raise ValueError(f"regex has {self.pattern.groups} group(s), 'group' {self.group} does not exist")
+            if isinstance(self.group, str) and self.group not in self.pattern.groupindex:
+                raise ValueError(f"regex has no group named '{self.group}'")
+        elif self.kind == "json":
+            if not isinstance(extract.get("path"), str) or not extract["path"]:
+                raise ValueError("json extraction needs a 'path'")
+            self.path = _json_path(extract["path"])
+        elif self.kind != "number":
+            raise ValueError(f"unknown extraction type '{self.kind}'")
+        if not isinstance(conditions or [], list):
+            raise ValueError("'conditions' must be a list")
+        self.conditions = [Condition(spec) for spec in conditions or []]
+
+    def extract(self, output: str):
+        """The monitor's metric from its output, or None if it cannot be found."""
+        if self.kind == "number":
+            return numeric_value(output)
+        if self.kind == "regex":
+            match = self.pattern.search(output)
+            return _to_number(match.group(self.group)) if match else None
+        try:
+            value = json.loads(output)
+            for key in self.path:
+                value = value[key]
+        except (ValueError, KeyError, IndexError, TypeError):
+            return None
+        return _to_number(value)
+
+def compile_rules(monitor: dict):
+    """MonitorRules for a monitor that declares "extract"/"conditions", else None. Raises ValueError."""
+    if "extract" not in monitor and "conditions" not in monitor:
+        return None
+    try:
+        return MonitorRules(monitor.get("extract"), monitor.get("conditions"))
+    except (TypeError, AttributeError) as e:
+        # Malformed JSON shapes (null, lists, ...) must not escape as anything but a config error
+        raise ValueError(f"malformed rule: {e}")
+
+def metric_value(monitor: dict, output: str):
+    """The number a monitor's output stands for (its extraction rule, else best effort)."""
+    if not output or output.startswith("Error"):
+        return None
+    rules = (monitor or {}).get("rules")
+    if not rules:
+        return numeric_value(output)
+    try:
+        return rules.extract(output)
+    except Exception:
+        return None
+
+class RuleEngine:
+    """
+    Evaluates every result of a watchdog batch against its monitor's compiled
+    rules. Keeps the previous sample per monitor for rate-of-change conditions.
+    """
+
+    def __init__(self):
+        self._last = {}   # monitor -> (timestamp, value)
+
+    def evaluate(self, batch: list, monitors: dict) -> dict:
+        """
+        `batch` holds (name, output, timestamp) tuples, `monitors` maps names to
+        compiled monitors. Returns {name: (value, failure message or None)}.
+        """
+        results = {}
+        for name, output, timestamp in batch:
+            try:
+                results[name] = self._evaluate(name, output, timestamp, monitors.get(name) or {})
+            except Exception as e:
+                # A broken rule fails its own monitor, never the whole batch
+                results[name] = (None, f"Violation: rule evaluation failed: {e}")
+        return results
+
+    def _evaluate(self, name: str, output: str, timestamp: float, monitor: dict) -> tuple:
+        if output.startswith("Error"):
+            return None, output
+        rules = monitor.get("rules")
+        if rules is None:
+            return numeric_value(output), None
+
+        value = metric_value(monitor, output)
+        if value is None:
+            return None, f"Violation: cannot extract the metric ({rules.kind}) from the output"
+        rate = None
+        previous = self._last.get(name)
+        if previous and timestamp > previous[0]:
+            rate = (value - previous[1]) / (timestamp - previous[0])
+        self._last[name] = (timestamp, value)
+
+        for condition in rules.conditions:
+            message = condition.check(value, rate * condition.per if rate is not None else None)
+            if message:
+                return value, f"Violation: {message}"
+        return value, None
+
+    def prune(self, names):
+        for name in list(self._last):
+            if name not in names:
+                del self._last[name]
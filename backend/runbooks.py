@@ -0,0 +1,327 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import google.generativeai as genai
+
+from db import connect, DB_FILE
+
+logger = logging.getLogger("uvicorn")
+
+# Cache file of earlier versions, imported into SQLite once
+LEGACY_CACHE_FILE = "runbooks.json"
+# Seconds between two status polls while Gemini processes an upload
+POLL_INTERVAL = 1.0
+# Re-upload a little before Gemini expires the file (files live ~48h)
+EXPIRY_MARGIN = 600
+# An ingestion not heard from for this long was abandoned (its worker died); the leader restarts it
+STALE_AFTER = 900
+
+# Ingestion statuses
+PENDING = "PENDING"
+UPLOADING = "UPLOADING"
+PROCESSING = "PROCESSING"
+ACTIVE = "ACTIVE"
+FAILED = "FAILED"
+IN_PROGRESS = (PENDING, UPLOADING, PROCESSING)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runbooks (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_runbooks_status ON runbooks (status);
+"""
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+class RunbookStore:
+    """
+    Runbook ingestion pipeline. Uploads are deduplicated by the SHA-256 of
+    their content and pushed to Gemini on a background thread. Records live
+    in SQLite, one row per runbook, so every worker sees the same runbooks
+    and concurrent ingestions never overwrite each other. Gemini file handles
+    are kept in memory per worker: reload() attaches the live ones whenever
+    `on_change` reports an update. Only the leader re-uploads (restore() and
+    revive()); other workers never upload anything but their own new ingestions.
+    """
+
+    def __init__(self, workspace_dir: str, path: str = DB_FILE, on_change=None,
+                 legacy_file: str = LEGACY_CACHE_FILE):
+        self.workspace_dir = workspace_dir
+        self.on_change = on_change   # callback(digest) after every stored change
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="runbook")
+        self._handles = {}     # hash -> genai File object (in memory)
+        self._conn = connect(path)
+        self._conn.executescript(_SCHEMA)
+        self._import_legacy(legacy_file)
+
+    # --- Persistence ---
+    def _import_legacy(self, legacy_file: str):
+        if not legacy_file or not os.path.exists(legacy_file):
+            return
+        try:
+            with open(legacy_file, "r") as f:
+                runbooks = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Runbooks: cannot read {legacy_file}: {e}")
+            return
+        with self._lock:
+            for digest, record in runbooks.items():
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO runbooks (id, status, updated_at, data) VALUES (?, ?, ?, ?)",
+                    (digest, record["status"], 0.0, json.dumps(record)),
+                )
+        try:
+            os.replace(legacy_file, f"{legacy_file}.imported")
+        except OSError:
+            pass  # another worker imported it first
+        logger.info(f"--- 📘 RUNBOOKS IMPORTED FROM {legacy_file}: {len(runbooks)} ---")
+
+    def _rows(self, where: str = "", params: tuple = ()) -> list:
+        """(record, updated_at epoch) pairs."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT data, updated_at FROM runbooks {where} ORDER BY rowid", params
+            ).fetchall()
+        return [(json.loads(row["data"]), row["updated_at"]) for row in rows]
+
+    def _changed(self, digest: str):
+        if self.on_change:
+            try:
+                self.on_change(digest)
+            except Exception as e:
+                logger.error(f"Runbook change notification failed: {e}")
+
+    def _update(self, digest: str, when=None, **fields):
+        """
+        Merges `fields` into one runbook and returns it, or None if it does not
+        exist (or `when(record, updated_at)` is false: compare-and-set claims).
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT data, updated_at FROM runbooks WHERE id = ?", (digest,)).fetchone()
+                record = json.loads(row["data"]) if row else None
+                if record is None or (when and not when(record, row["updated_at"])):
+                    self._conn.execute("ROLLBACK")
+                    return None
+                record.update(fields, updated_at=_now())
+                self._conn.execute(
+                    "UPDATE runbooks SET status = ?, updated_at = ?, data = ? WHERE id = ?",
+                    (record["status"], time.time(), json.dumps(record), digest),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        self._changed(digest)
+        return record
+
+    def _touch(self, digest: str):
+        """Heartbeat of a running ingestion (keeps the leader from taking it over)."""
+        with self._lock:
+            self._conn.execute("UPDATE runbooks SET updated_at = ? WHERE id = ?", (time.time(), digest))
+
+    # --- Ingestion ---
+    def ingest(self, filename: str, data: bytes) -> tuple:
+        """
+        Registers an upload and starts processing it in the background.
+        Returns (record, deduplicated). Identical content reuses the existing
+        runbook instead of uploading it again.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT data FROM runbooks WHERE id = ?", (digest,)).fetchone()
+                existing = json.loads(row["data"]) if row else None
+                if existing and (existing["status"] in IN_PROGRESS or self._is_live(existing)):
+                    self._conn.execute("ROLLBACK")
+                    return existing, True
+
+                # Stored under its digest: a later upload with the same name must not replace these bytes
+                path = os.path.join(self.workspace_dir, f"{digest[:16]}_{os.path.basename(filename)}")
+                with open(path, "wb") as f:
+                    f.write(data)
+                record = {
+                    "id": digest,
+                    "filename": os.path.basename(filename),
+                    "path": path,
+                    "status": PENDING,
+                    "file_name": None,
+                    "expires_at": None,
+                    "error": None,
+                    "created_at": _now(),
+                    "updated_at": _now(),
+                }
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO runbooks (id, status, updated_at, data) VALUES (?, ?, ?, ?)",
+                    (digest, PENDING, time.time(), json.dumps(record)),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        self._changed(digest)
+        self._executor.submit(self._process, digest)
+        return record, False
+
+    def _is_live(self, record: dict) -> bool:
+        return record["status"] == ACTIVE and (
+            not record.get("expires_at") or record["expires_at"] - EXPIRY_MARGIN > time.time()
+        )
+
+    def _process(self, digest: str):
+        """Uploads one runbook and waits for Gemini to finish processing it (worker thread)."""
+        record = self._update(digest, status=UPLOADING, error=None)
+        if record is None:
+            return  # deleted meanwhile
+        try:
+            uploaded = genai.upload_file(path=record["path"], display_name=record["filename"])
+            self._update(digest, status=PROCESSING, file_name=uploaded.name)
+            while uploaded.state.name == "PROCESSING":
+                time.sleep(POLL_INTERVAL)
+                uploaded = genai.get_file(uploaded.name)
+                self._touch(digest)
+
+            if uploaded.state.name != "ACTIVE":
+                raise RuntimeError(f"Gemini processing ended in state {uploaded.state.name}")
+
+            expiration = getattr(uploaded, "expiration_time", None)
+            if self._update(digest, status=ACTIVE, expires_at=expiration.timestamp() if expiration else None):
+                with self._lock:
+                    self._handles[digest] = uploaded
+            logger.info(f"--- 📘 RUNBOOK INDEXED: {record['filename']} ({uploaded.name}) ---")
+        except Exception as e:
+            logger.error(f"Runbook ingestion failed for {record['filename']}: {e}")
+            self._update(digest, status=FAILED, error=str(e))
+
+    def _reupload(self, digest: str):
+        record = self.get(digest)
+        if record is None:
+            return
+        if os.path.exists(record["path"]):
+            self._process(digest)
+        else:
+            self._update(digest, status=FAILED, error="Runbook file missing from workspace")
+
+    def _restore(self, record: dict):
+        """Re-attaches a stored handle, re-uploading the runbook if Gemini no longer has it."""
+        try:
+            handle = genai.get_file(record["file_name"])
+            if handle.state.name == "ACTIVE":
+                with self._lock:
+                    self._handles[record["id"]] = handle
+                return
+        except Exception as e:
+            logger.info(f"Runbook handle for {record['filename']} is gone ({e}), re-uploading")
+        # Claimed only if nobody changed it meanwhile
+        if self._update(record["id"], when=lambda r, _: r["status"] == ACTIVE and r.get("file_name") == record["file_name"],
+                        status=PENDING):
+            self._reupload(record["id"])
+
+    def restore(self):
+        """Leader only, on election: verifies every live handle and revives the rest in the background."""
+        for record, _ in self._rows("WHERE status = ?", (ACTIVE,)):
+            if self._is_live(record) and record.get("file_name"):
+                self._executor.submit(self._restore, record)
+        self.revive()
+
+    def revive(self) -> int:
+        """
+        Leader only: re-uploads runbooks about to expire on Gemini's side and
+        restarts ingestions abandoned by a worker that died. Each one is
+        claimed with a compare-and-set so it is uploaded once. Returns the count.
+        """
+        now = time.time()
+
+        def expiring(record, updated_at):
+            return record["status"] == ACTIVE and not self._is_live(record)
+
+        def abandoned(record, updated_at):
+            return record["status"] in IN_PROGRESS and updated_at < now - STALE_AFTER
+
+        revived = 0
+        for record, updated_at in self._rows("WHERE status != ?", (FAILED,)):
+            for claimable in (expiring, abandoned):
+                if claimable(record, updated_at) and self._update(record["id"], when=claimable, status=PENDING):
+                    with self._lock:
+                        self._handles.pop(record["id"], None)
+                    self._executor.submit(self._reupload, record["id"])
+                    revived += 1
+                    break
+        return revived
+
+    def reload(self):
+        """
+        Syncs this worker's handles with the stored runbooks: drops handles of
+        removed or replaced ones and attaches the live ones it lacks.
+        Never uploads anything itself.
+        """
+        live = {record["id"]: record for record, _ in self._rows("WHERE status = ?", (ACTIVE,))
+                if self._is_live(record) and record.get("file_name")}
+        with self._lock:
+            for digest in list(self._handles):
+                record = live.get(digest)
+                if record is None or record["file_name"] != self._handles[digest].name:
+                    del self._handles[digest]
+            missing = [(digest, record["file_name"]) for digest, record in live.items() if digest not in self._handles]
+        for digest, file_name in missing:
+            try:
+                handle = genai.get_file(file_name)
+            except Exception as e:
+                logger.info(f"Runbook handle {file_name} not available yet: {e}")
+                continue
+            if handle.state.name == "ACTIVE":
+                with self._lock:
+                    self._handles[digest] = handle
+
+    # --- Queries ---
+    def active_handles(self) -> list:
+        """
+        File handles of every live runbook, to attach to prompts. Expiring
+        ones are left out; the leader re-uploads them (revive()).
+        """
+        records = [record for record, _ in self._rows("WHERE status = ?", (ACTIVE,)) if self._is_live(record)]
+        with self._lock:
+            return [self._handles[record["id"]] for record in records
+                    if record["id"] in self._handles and self._handles[record["id"]].name == record.get("file_name")]
+
+    def list(self) -> list:
+        return [record for record, _ in self._rows()]
+
+    def get(self, digest: str):
+        rows = self._rows("WHERE id = ?", (digest,))
+        return rows[0][0] if rows else None
+
+    def delete(self, digest: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM runbooks WHERE id = ?", (digest,)).fetchone()
+            if row is None:
+                return False
+            self._conn.execute("DELETE FROM runbooks WHERE id = ?", (digest,))
+            self._handles.pop(digest, None)
+        record = json.loads(row["data"])
+        self._changed(digest)
+        try:
+            os.remove(record["path"])
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.info(f"Could not delete runbook copy {record['path']}: {e}")
+        if record.get("file_name"):
+            try:
+                genai.delete_file(record["file_name"])
+            except Exception as e:
+                logger.info(f"Could not delete Gemini file {record['file_name']}: {e}")
+        return True
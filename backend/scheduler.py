@@ -0,0 +1,212 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from monitoring import run_monitor, is_runnable, monitor_timeout, DEFAULT_MONITOR_CONCURRENCY
+
+logger = logging.getLogger("uvicorn")
+
+# Defaults for monitors that don't declare their own schedule
+DEFAULT_MONITOR_INTERVAL = 10
+DEFAULT_MONITOR_JITTER = 0
+# How often the scheduler re-reads config.json even when nothing is due
+SYNC_INTERVAL = 1.0
+
+def _float_setting(monitor: dict, key: str, default: float) -> float:
+    try:
+        return max(0.0, float(monitor.get(key, default)))
+    except (TypeError, ValueError):
+        return default
+
+def monitor_interval(monitor: dict) -> float:
+    """Seconds between two runs of a monitor (never below 1s)."""
+    return max(1.0, _float_setting(monitor, "interval", DEFAULT_MONITOR_INTERVAL))
+
+def monitor_jitter(monitor: dict) -> float:
+    """Max random delay (seconds) added to each scheduled run of a monitor."""
+    return _float_setting(monitor, "jitter", DEFAULT_MONITOR_JITTER)
+
+def _timed_run(monitor):
+    started = time.monotonic()
+    details = {}
+    output = run_monitor(monitor, details=details)
+    return started, output, time.monotonic() - started, details.get("stages")
+
+class MonitorScheduler:
+    """
+    Priority-queue (heap) scheduler for the configured monitors.
+
+    Every monitor runs on its own "interval", delayed by up to "jitter" seconds,
+    and is killed after its own "timeout". New monitors get a random phase inside
+    their interval so hundreds of checks spread out instead of bursting together.
+    Finished runs are published to `store` (if given) and put on `results`
+    as (name, output, duration) tuples.
+    """
+
+    def __init__(self, get_config, store=None):
+        self.get_config = get_config
+        self.store = store
+        self.results = asyncio.Queue()
+        self._heap = []            # (due, seq, name)
+        self._seq = itertools.count()
+        self._monitors = {}        # name -> monitor config
+        self._due = {}             # name -> due time of its live heap entry
+        self._running = set()
+        self._stats = {}           # name -> per-monitor counters
+        self._pruned = None        # monitor names the store was last pruned to
+        self._executor = None
+        self._concurrency = None
+        self.missed_deadlines = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.avg_lag = 0.0
+
+    # --- Schedule bookkeeping ---
+    def _push(self, name: str, due: float):
+        self._due[name] = due
+        heapq.heappush(self._heap, (due, next(self._seq), name))
+
+    def _configure(self, concurrency):
+        concurrency = max(1, int(concurrency or DEFAULT_MONITOR_CONCURRENCY))
+        if concurrency != self._concurrency:
+            if self._executor:
+                self._executor.shutdown(wait=False)
+            self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="monitor")
+            self._concurrency = concurrency
+
+    def sync(self, monitors: list):
+        """Reconciles the schedule with the monitors currently in config.json."""
+        configured = {m["name"]: m for m in monitors if is_runnable(m)}
+        now = time.monotonic()
+
+        for name in list(self._monitors):
+            if name not in configured:
+                # Stale heap entries are skipped lazily when popped
+                del self._monitors[name]
+                self._due.pop(name, None)
+                self._stats.pop(name, None)
+
+        for name, monitor in configured.items():
+            previous = self._monitors.get(name)
+            self._monitors[name] = monitor
+            if previous is None:
+                self._stats[name] = {"runs": 0, "missed": 0, "last_lag": 0.0, "last_duration": None, "last_stages": None, "last_run": None}
+                if name not in self._running:
+                    self._push(name, now + random.uniform(0, monitor_interval(monitor)))
+            elif monitor_interval(previous) != monitor_interval(monitor) and name in self._due:
+                # Interval shortened/lengthened: don't wait out the old period
+                self._push(name, min(self._due[name], now + monitor_interval(monitor)))
+
+    def _record_lag(self, lag: float):
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        self.avg_lag = lag if not self.avg_lag else 0.9 * self.avg_lag + 0.1 * lag
+
+    # --- Execution ---
+    async def _run_one(self, name: str, monitor: dict, due: float):
+        loop = asyncio.get_running_loop()
+        try:
+            started, output, duration, stages = await loop.run_in_executor(
+                self._executor, _timed_run, monitor
+            )
+        except Exception as e:
+            started, output, duration, stages = time.monotonic(), f"Error executing command: {str(e)}", 0.0, None
+        finally:
+            self._running.discard(name)
+
+        lag = max(0.0, started - due)
+        self._record_lag(lag)
+        stats = self._stats.get(name)
+        if stats is not None:
+            stats["runs"] += 1
+            stats["last_lag"] = round(lag, 3)
+            stats["last_duration"] = round(duration, 3)
+            # Per-stage exit codes and durations of command pipelines
+            stats["last_stages"] = stages
+            stats["last_run"] = datetime.now().isoformat(timespec="seconds")
+
+        if self.store:
+            # SQLite write: kept off the loop (another writer may hold the lock)
+            try:
+                await asyncio.to_thread(self.store.publish, name, output, duration)
+            except Exception as e:
+                logger.error(f"--- 🚨 SCHEDULER: could not store the result of '{name}': {e} ---")
+        await self.results.put((name, output, duration))
+
+        # Reschedule from the planned due time so the cadence doesn't drift
+        current = self._monitors.get(name)
+        if current is None:
+            return
+        interval = monitor_interval(current)
+        next_due = due + interval
+        now = time.monotonic()
+        if next_due < now:
+            missed = int((now - next_due) // interval) + 1
+            self.missed_deadlines += missed
+            if stats is not None:
+                stats["missed"] += missed
+            logger.warning(f"--- ⏱️ SCHEDULER: '{name}' missed {missed} deadline(s) (lag {lag:.2f}s, took {duration:.2f}s) ---")
+            next_due = now
+        self._push(name, next_due + random.uniform(0, monitor_jitter(current)))
+
+    async def run(self):
+        """Main loop: sleeps until the next monitor is due and dispatches it."""
+        while True:
+            try:
+                config = self.get_config()
+                self._configure(config.get("monitor_concurrency"))
+                self.sync(config.get("monitors", []))
+                names = set(self._monitors)
+                if self.store and names != self._pruned:
+                    # Only when the configured monitor set changed
+                    await asyncio.to_thread(self.store.prune, names)
+                    self._pruned = names
+            except Exception as e:
+                logger.error(f"Scheduler config error: {e}")
+
+            now = time.monotonic()
+            while self._heap and self._heap[0][0] <= now:
+                due, _, name = heapq.heappop(self._heap)
+                if self._due.get(name) != due:
+                    continue  # superseded or removed
+                del self._due[name]
+                self._running.add(name)
+                asyncio.create_task(self._run_one(name, self._monitors[name], due))
+
+            next_due = self._heap[0][0] if self._heap else now + SYNC_INTERVAL
+            await asyncio.sleep(min(max(next_due - time.monotonic(), 0), SYNC_INTERVAL))
+
+    @property
+    def monitor_names(self) -> set:
+        return set(self._monitors)
+
+    def stats(self) -> dict:
+        """Scheduler health: tick lag, missed deadlines and per-monitor timing."""
+        now = time.monotonic()
+        return {
+            "concurrency": self._concurrency,
+            "running": sorted(self._running),
+            "missed_deadlines": self.missed_deadlines,
+            "tick_lag": {
+                "last": round(self.last_lag, 3),
+                "avg": round(self.avg_lag, 3),
+                "max": round(self.max_lag, 3),
+            },
+            "monitors": {
+                name: {
+                    **stats,
+                    "interval": monitor_interval(self._monitors[name]),
+                    "jitter": monitor_jitter(self._monitors[name]),
+                    "timeout": monitor_timeout(self._monitors[name]),
+                    # Set when its rules failed to compile (it runs with no conditions)
+                    "rules_error": self._monitors[name].get("rules_error"),
+                    "next_run_in": round(self._due[name] - now, 3) if name in self._due else None,
+                }
+                for name, stats in self._stats.items()
+            },
+        }
@@ -1,2 +1,23 @@
-# Shared memory storage
-PENDING_ACTIONS = {}
+from result_store import ResultStore
+from timeseries import TimeSeriesStore
+from events import EventBroker
+from approvals import ApprovalStore
+from incidents import IncidentManager
+from resources import ResourceSampler
+from log_index import LogIndex
+from config import get_log_files
+
+# Approval queue (SQLite, survives restarts)
+APPROVALS = ApprovalStore()
+# Latest monitor results, published by the watchdog
+MONITOR_RESULTS = ResultStore()
+# Bounded history of monitor values and system resources
+METRIC_HISTORY = TimeSeriesStore()
+# Rolling host snapshot (CPU, memory, disks, I/O, top processes), sampled in the background
+RESOURCES = ResourceSampler(METRIC_HISTORY)
+# Push channel for dashboard updates (GET /events), relayed between workers
+EVENTS = EventBroker()
+# Watchdog incidents (fingerprinted failures), readable by every worker
+INCIDENTS = IncidentManager()
+# Followed log files, indexed by time, level and token (written by the leader only)
+LOG_INDEX = LogIndex(get_log_files)
@@ -0,0 +1,161 @@
+import re
+import threading
+import time
+from array import array
+
+# Fixed capacities keep memory flat however long the process runs:
+# raw ~2h at a 10s cadence, 1m rollups for 24h, 1h rollups for 30 days.
+RAW_CAPACITY = 720
+MINUTE_CAPACITY = 1440
+HOUR_CAPACITY = 720
+# Hard cap on the number of series (each one is a few tens of KB)
+MAX_SERIES = 500
+
+RESOLUTIONS = ("raw", "1m", "1h")
+
+_PERCENT_RE = re.compile(r"(-?\d+(?:\.\d+)?)%")
+
+def numeric_value(output: str):
+    """Best-effort number from a monitor's output: a plain number or the first percentage."""
+    if not output or output.startswith("Error"):
+        return None
+    try:
+        return float(output.strip())
+    except ValueError:
+        pass
+    match = _PERCENT_RE.search(output)
+    return float(match.group(1)) if match else None
+
+class Ring:
+    """Fixed-size ring buffer of samples stored column-wise in array('d')."""
+
+    def __init__(self, capacity: int, columns: int = 1):
+        self.capacity = capacity
+        self.timestamps = array("d", bytes(8 * capacity))
+        self.columns = [array("d", bytes(8 * capacity)) for _ in range(columns)]
+        self.start = 0
+        self.count = 0
+
+    def append(self, timestamp: float, *values: float):
+        index = (self.start + self.count) % self.capacity
+        if self.count == self.capacity:
+            self.start = (self.start + 1) % self.capacity
+        else:
+            self.count += 1
+        self.timestamps[index] = timestamp
+        for column, value in zip(self.columns, values):
+            column[index] = value
+
+    def rows(self, since: float = 0.0):
+        """Yields (timestamp, *values) oldest first, skipping rows before `since`."""
+        for i in range(self.count):
+            index = (self.start + i) % self.capacity
+            timestamp = self.timestamps[index]
+            if timestamp >= since:
+                yield (timestamp, *(column[index] for column in self.columns))
+
+class _Rollup:
+    """Aggregates samples into fixed-width buckets (avg/min/max) stored in a Ring."""
+
+    def __init__(self, width: int, capacity: int):
+        self.width = width
+        self.ring = Ring(capacity, columns=3)
+        self.bucket = None
+        self.total = self.low = self.high = 0.0
+        self.samples = 0
+
+    def add(self, timestamp: float, value: float):
+        bucket = timestamp - timestamp % self.width
+        if bucket != self.bucket:
+            self.flush()
+            self.bucket = bucket
+            self.total, self.low, self.high, self.samples = 0.0, value, value, 0
+        self.total += value
+        self.low = min(self.low, value)
+        self.high = max(self.high, value)
+        self.samples += 1
+
+    def flush(self):
+        if self.bucket is not None and self.samples:
+            self.ring.append(self.bucket, self.total / self.samples, self.low, self.high)
+            self.samples = 0
+
+    def rows(self, since: float = 0.0):
+        yield from self.ring.rows(since)
+        # Include the still-open bucket so recent data is visible immediately
+        if self.bucket is not None and self.samples and self.bucket >= since:
+            yield (self.bucket, self.total / self.samples, self.low, self.high)
+
+class Series:
+    def __init__(self):
+        self.raw = Ring(RAW_CAPACITY)
+        self.minute = _Rollup(60, MINUTE_CAPACITY)
+        self.hour = _Rollup(3600, HOUR_CAPACITY)
+        self.updated = 0.0
+
+    def add(self, timestamp: float, value: float):
+        self.raw.append(timestamp, value)
+        self.minute.add(timestamp, value)
+        self.hour.add(timestamp, value)
+        self.updated = timestamp
+
+class TimeSeriesStore:
+    """
+    Memory-bounded metric history. Every series keeps raw samples plus 1m and
+    1h rollups in preallocated ring buffers; the least recently updated series
+    is evicted once MAX_SERIES is reached.
+    """
+
+    def __init__(self, max_series: int = MAX_SERIES):
+        self.max_series = max_series
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def record(self, name: str, value: float, timestamp: float = None):
+        if value is None:
+            return
+        timestamp = timestamp or time.time()
+        with self._lock:
+            series = self._series.get(name)
+            if series is None:
+                if len(self._series) >= self.max_series:
+                    oldest = min(self._series, key=lambda key: self._series[key].updated)
+                    del self._series[oldest]
+                series = self._series[name] = Series()
+            series.add(timestamp, float(value))
+
+    def names(self) -> list:
+        with self._lock:
+            return sorted(self._series)
+
+    def query(self, name: str, minutes: float = 60, resolution: str = "auto") -> dict:
+        """
+        Returns the points of a series over the last `minutes`.
+        resolution: raw, 1m, 1h or auto (picked from the window length).
+        Raw points are [ts, value]; rollup points are [ts, avg, min, max].
+        """
+        if resolution == "auto":
+            resolution = "raw" if minutes <= 60 else "1m" if minutes <= 1440 else "1h"
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution '{resolution}'. Use one of: auto, {', '.join(RESOLUTIONS)}")
+
+        since = time.time() - minutes * 60
+        with self._lock:
+            series = self._series.get(name)
+            if series is None:
+                return None
+            source = {"raw": series.raw, "1m": series.minute, "1h": series.hour}[resolution]
+            points = [[round(v, 4) for v in row] for row in source.rows(since)]
+        return {"series": name, "resolution": resolution, "minutes": minutes, "points": points}
+
+def record_monitor_result(store: TimeSeriesStore, name: str, output: str, duration: float = None,
+                          timestamp: float = None, value: float = None):
+    """
+    Feeds one monitor result into the history (value, up/down and duration).
+    `value` is the extracted metric; without it the output is parsed best-effort.
+    """
+    now = timestamp or time.time()
+    store.record(f"monitor.{name}.up", 0.0 if output.startswith("Error") else 1.0, now)
+    store.record(f"monitor.{name}.value", numeric_value(output) if value is None else value, now)
+    if duration is not None:
+        store.record(f"monitor.{name}.duration", duration, now)
@@ -2,26 +2,15 @@ import os
 import requests
 import uuid
 from datetime import datetime
-from monitoring import check_monitors
 import json
-
-def load_config():
-    if not os.path.exists("config.json"):
-        return {"monitors": []}
-    with open("config.json", "r") as f:
-        return json.load(f)
+import re
+from config import get_config
+from notifications import DiscordNotifier
+from file_slices import MAX_SLICE_BYTES, read_bytes, read_lines, tail_lines, search, format_lines, format_blocks
 
 def get_discord_webhooks():
-    config = load_config()
-    # Support both new list and old string (via migration logic in main.py, but here we read raw json if we called load_config from tools.py which duplicates logic. 
-    # Ideally tools.py should import load_config from main.py or share it. 
-    # But tools.py has its own load_config. Let's update tools.py's load_config or just handle it here.)
-    
-    webhooks = config.get("discord_webhooks", [])
-    
-    # Fallback for old config if not migrated yet (though main.py migrates on load, tools.py reads file directly)
-    if not webhooks and config.get("discord_webhook_url"):
-        webhooks = [config.get("discord_webhook_url")]
+    # config.py already migrated the old single "discord_webhook_url" format
+    webhooks = list(get_config().get("discord_webhooks", []))
         
     # Env var fallback
     env_webhook = os.getenv("DISCORD_WEBHOOK_URL")
@@ -30,11 +19,22 @@ def get_discord_webhooks():
         
     return webhooks
 
+# Discord messages are queued and delivered by a background worker
+NOTIFIER = DiscordNotifier(get_discord_webhooks)
+
 # Define the "Sandbox" directory where the agent is allowed to play.
 # This prevents the AI from overwriting your entire Mac.
 WORK_DIR = "./agent_workspace"
 os.makedirs(WORK_DIR, exist_ok=True)
 
+def notify_file_change(filename: str, action: str):
+    """Pushes a workspace change to connected dashboards."""
+    try:
+        files = os.listdir(WORK_DIR)
+    except OSError:
+        files = []
+    EVENTS.publish("files", {"action": action, "filename": filename, "files": files})
+
 def list_files():
     """Lists all files in the agent's workspace."""
     try:
@@ -42,17 +42,120 @@ def list_files():
     except Exception as e:
         return f"Error listing files: {str(e)}"
 
+def _workspace_path(filename: str):
+    """Real path of a workspace file, or None if it resolves outside the workspace (absolute path, ../, symlink)."""
+    base = os.path.realpath(WORK_DIR)
+    path = os.path.realpath(os.path.join(base, filename))
+    return path if os.path.commonpath([base, path]) == base else None
+
 def read_file(filename: str):
-    """Reads the content of a file in the workspace."""
-    filepath = os.path.join(WORK_DIR, filename)
+    """
+    Reads the content of a file in the workspace. Large files are cut at 256KB:
+    use tail_file, read_file_lines or search_file to look at the rest.
+    """
+    filepath = _workspace_path(filename)
+    if filepath is None:
+        return "Error: Access denied: path is outside the workspace."
+    if not os.path.exists(filepath):
+        return "Error: File does not exist."
+    try:
+        size = os.path.getsize(filepath)
+        if size <= MAX_SLICE_BYTES:
+            with open(filepath, "r") as f:
+                return f.read()
+        head = read_bytes(filepath, 0, MAX_SLICE_BYTES)
+        return (f"{head['text']}\n\n[File truncated: showing {head['length']} of {size} bytes. "
+                f"Use tail_file, read_file_lines or search_file for the rest.]")
+    except Exception as e:
+        return f"Error reading file: {str(e)}"
+
+def read_file_lines(filename: str, start_line: int = 1, num_lines: int = 100):
+    """
+    Reads a range of lines from a workspace file without loading the whole file.
+    Args:
+        filename: File in the workspace.
+        start_line: First line to return (1-based).
+        num_lines: How many lines to return (max 2000).
+    """
+    filepath = _workspace_path(filename)
+    if filepath is None:
+        return "Error: Access denied: path is outside the workspace."
     if not os.path.exists(filepath):
         return "Error: File does not exist."
     try:
-        with open(filepath, "r") as f:
-            return f.read()
+        result = read_lines(filepath, int(start_line), int(num_lines))
+        if not result["lines"]:
+            return f"No lines from line {start_line} ({filename} is {result['size']} bytes)."
+        more = "" if result["eof"] else f"\n[More lines follow; continue at line {result['lines'][-1][0] + 1}]"
+        return format_lines(result["lines"]) + more
     except Exception as e:
         return f"Error reading file: {str(e)}"
 
+def read_file_bytes(filename: str, offset: int = 0, length: int = 4096):
+    """
+    Reads a byte range from a workspace file (useful for binary-ish or single-line files).
+    Args:
+        filename: File in the workspace.
+        offset: First byte to read; negative values count from the end of the file.
+        length: Number of bytes to read (max 256KB).
+    """
+    filepath = _workspace_path(filename)
+    if filepath is None:
+        return "Error: Access denied: path is outside the workspace."
+    if not os.path.exists(filepath):
+        return "Error: File does not exist."
+    try:
+        result = read_bytes(filepath, int(offset), int(length))
+        return f"[bytes {result['offset']}-{result['offset'] + result['length']} of {result['size']}]\n{result['text']}"
+    except Exception as e:
+        return f"Error reading file: {str(e)}"
+
+def tail_file(filename: str, lines: int = 50):
+    """
+    Returns the last lines of a workspace file (like `tail -n`), reading backwards
+    from the end so even very large logs are cheap.
+    Args:
+        filename: File in the workspace.
+        lines: How many lines to return (max 2000).
+    """
+    filepath = _workspace_path(filename)
+    if filepath is None:
+        return "Error: Access denied: path is outside the workspace."
+    if not os.path.exists(filepath):
+        return "Error: File does not exist."
+    try:
+        result = tail_lines(filepath, int(lines))
+        return "\n".join(result["lines"]) if result["lines"] else f"{filename} is empty."
+    except Exception as e:
+        return f"Error reading file: {str(e)}"
+
+def search_file(filename: str, pattern: str, context_lines: int = 2, max_matches: int = 50, ignore_case: bool = False):
+    """
+    Searches a workspace file for a regular expression (like `grep -n -C`).
+    Matching lines are prefixed with '>' and their line number.
+    Args:
+        filename: File in the workspace.
+        pattern: Python regular expression, matched line by line.
+        context_lines: Lines of context shown before and after each match (max 20).
+        max_matches: Maximum matching lines to return (max 200).
+        ignore_case: Case-insensitive search.
+    """
+    filepath = _workspace_path(filename)
+    if filepath is None:
+        return "Error: Access denied: path is outside the workspace."
+    if not os.path.exists(filepath):
+        return "Error: File does not exist."
+    try:
+        result = search(filepath, pattern, int(context_lines), int(max_matches), bool(ignore_case))
+    except re.error as e:
+        return f"Error: invalid regular expression: {e}"
+    except Exception as e:
+        return f"Error searching file: {str(e)}"
+    if not result["matches"]:
+        return f"No matches for /{pattern}/ in {filename}."
+    more = "\n[More matches not shown; narrow the pattern]" if result["truncated"] else ""
+    return f"{result['matches']} matching line(s):\n" + format_blocks(result["blocks"]) + more
+
 def write_file(filename: str, content: str):
     """Writes content to a file in the workspace. Overwrites if exists."""
     if filename == "system_instruction.txt":
@@ -62,26 +165,33 @@ def write_file(filename: str, content: str):
     try:
         with open(filepath, "w") as f:
             f.write(content)
+        notify_file_change(filename, "saved")
         return f"Successfully wrote to {filename}"
     except Exception as e:
         return f"Error writing file: {str(e)}"
 
+from state import APPROVALS, MONITOR_RESULTS, METRIC_HISTORY, EVENTS, RESOURCES, LOG_INDEX # <--- Import from shared file
+from log_index import format_lines as format_log_lines
+from resources import format_snapshot
+
 def check_payment_gateway_metrics():
     """Fetches real-time metrics from the System. Takes no arguments."""
-    config = load_config()
-    results = check_monitors(config.get("monitors", []))
+    config = get_config()
+    # Served from the watchdog's results; only stale monitors are re-run
+    results = MONITOR_RESULTS.values(config.get("monitors", []), refresh_stale=True,
+                                     max_concurrency=config.get("monitor_concurrency"))
     return f"METRICS REPORT: {str(results)}"
 
-from state import PENDING_ACTIONS # <--- Import from shared file
-
 
 
 # A specialized tool for OpsGuardian to verify things
 def check_system_status():
     """Checks system health using configured monitors. Takes no arguments."""
-    config = load_config()
-    results = check_monitors(config.get("monitors", []))
-    return f"SYSTEM STATUS: {str(results)}"
+    config = get_config()
+    results = MONITOR_RESULTS.read(config.get("monitors", []), refresh_stale=True,
+                                   max_concurrency=config.get("monitor_concurrency"))
+    summary = {name: f"{r['value']} ({r['status']}, {r['age']}s ago)" for name, r in results.items()}
+    return f"SYSTEM STATUS: {str(summary)}"
 
 def send_discord_alert(summary: str):
     """Sends a critical alert to the DevOps team via Discord."""
@@ -89,18 +199,13 @@ def send_discord_alert(summary: str):
     # MAGIC LINK: We add ?action=review to the URL
     dashboard_url = f"{os.getenv('FRONTEND_URL')}/?action=review_incident"
     
-    data = {
-        "content": f"🚨 **OPS-GUARDIAN ALERT** 🚨\n{summary}\n\n[CLICK TO AUTHORIZE RESTART]({dashboard_url})"
-    }
+    content = f"🚨 **OPS-GUARDIAN ALERT** 🚨\n{summary}\n\n[CLICK TO AUTHORIZE RESTART]({dashboard_url})"
     try:
-        webhook = os.getenv("DISCORD_WEBHOOK_URL")
-        if webhook:
-            try:
-                requests.post(webhook, json=data)
-                return "Alert sent to Discord webhook."
-            except Exception as e:
-                return f"Failed to send to webhook: {e}"
-        return "Discord Webhook not configured (DISCORD_WEBHOOK_URL missing)."
+        # Delivered in the background to every configured webhook
+        queued = NOTIFIER.notify(content)
+        if queued:
+            return f"Alert queued for delivery to {queued} Discord webhook(s)."
+        return "Discord Webhook not configured (add one in Settings or set DISCORD_WEBHOOK_URL)."
     except Exception as e:
         return f"Failed to send alert: {e}"
 
@@ -138,26 +243,19 @@ def run_terminal_command(command: str):
     
     request_id = str(uuid.uuid4())[:8]
     
-    PENDING_ACTIONS[request_id] = {
+    request = APPROVALS.add({
         "id": request_id,
         "tool": "run_terminal_command",
         "status": "PENDING",
         "timestamp": datetime.now().strftime("%H:%M:%S"),
         "description": f"Execute Command: {command}",
         "command": command # Store the command to execute later
-    }
+    })
+    EVENTS.publish("approvals", request)
     
     # Notify Discord
     dashboard_url = f"{os.getenv('FRONTEND_URL')}/?tab=approvals"
-    discord_payload = {
-        "content": f"🛡️ **PERMISSION REQUIRED**\nAI Agent wants to run: `{command}`\n\n[OPEN APPROVALS DASHBOARD]({dashboard_url})"
-    }
-    try:
-        webhooks = get_discord_webhooks()
-        for webhook in webhooks:
-            requests.post(webhook, json=discord_payload)
-    except:
-        pass
+    NOTIFIER.notify(f"🛡️ **PERMISSION REQUIRED**\nAI Agent wants to run: `{command}`\n\n[OPEN APPROVALS DASHBOARD]({dashboard_url})")
 
     return f"ACTION PAUSED [AWAITING_APPROVAL]. Command '{command}' requires admin approval. Request ID: {request_id}. Notify the user to check the Approvals Tab."
 
@@ -172,6 +270,7 @@ def delete_file(filename: str):
     try:
         if os.path.exists(filepath):
             os.remove(filepath)
+            notify_file_change(filename, "deleted")
             return f"Successfully deleted {filename}"
         return "Error: File does not exist."
     except Exception as e:
@@ -179,25 +278,70 @@ def delete_file(filename: str):
 
 def get_system_resources():
     """
-    Returns current system resource usage (CPU, RAM, Disk).
+    Returns current system resource usage: per-core CPU, load, memory, every
+    mounted disk, disk/network I/O rates and the top processes by CPU and memory.
     Takes no arguments.
     """
     try:
-        import psutil
-        cpu_percent = psutil.cpu_percent(interval=1)
-        memory = psutil.virtual_memory()
-        disk = psutil.disk_usage('/')
-        
-        return (
-            f"CPU Usage: {cpu_percent}%\n"
-            f"Memory Usage: {memory.percent}% (Used: {memory.used // (1024**2)}MB / Total: {memory.total // (1024**2)}MB)\n"
-            f"Disk Usage: {disk.percent}% (Free: {disk.free // (1024**3)}GB)"
-        )
-    except ImportError:
-        return "Error: psutil library not installed."
+        snapshot = RESOURCES.latest()
+        if snapshot is None:
+            return "Error: psutil library not installed."
+        return format_snapshot(snapshot)
     except Exception as e:
         return f"Error fetching resources: {str(e)}"
 
+def get_metric_history(series: str, minutes: int = 60):
+    """
+    Returns the recent trend of a metric without re-running any command.
+    Arguments:
+    - series: Metric name, e.g. "monitor.Active Connections.value", "monitor.Disk Usage.up",
+      "system.cpu_percent", "system.memory_percent". Use an unknown name to list all series.
+    - minutes: How far back to look (default: 60). Longer windows return 1m/1h averages.
+    """
+    history = METRIC_HISTORY.query(series, minutes)
+    if history is None:
+        return f"Unknown series '{series}'. Available series: {METRIC_HISTORY.names()}"
+
+    points = history["points"]
+    if not points:
+        return f"No data for '{series}' in the last {minutes} minutes."
+
+    values = [p[1] for p in points]
+    # Keep the answer small: at most ~30 evenly spaced points
+    step = max(1, len(points) // 30)
+    sampled = points[::step]
+    if sampled[-1] is not points[-1]:
+        sampled.append(points[-1])
+    trend = ", ".join(f"{datetime.fromtimestamp(p[0]).strftime('%H:%M:%S')}={p[1]:g}" for p in sampled)
+
+    return (
+        f"{series} over the last {minutes} min ({history['resolution']}, {len(points)} points)\n"
+        f"Last: {values[-1]:g} | Min: {min(values):g} | Max: {max(values):g} | Avg: {sum(values) / len(values):.2f}\n"
+        f"Trend: {trend}"
+    )
+
+def search_logs(query: str = "", level: str = "", minutes: int = 10, source: str = "", limit: int = 50):
+    """
+    Searches the indexed log files (config "log_files") without scanning them.
+    Prefer this over grep/cat through run_terminal_command.
+    Arguments:
+    - query: Words that must all appear in the line, e.g. "timeout payment". Empty matches every line.
+    - level: Minimum severity: DEBUG, INFO, WARNING, ERROR or CRITICAL. Empty for any.
+    - minutes: How far back to look (default: 10).
+    - source: Only this log (its configured name). Empty for all logs.
+    - limit: Maximum lines returned, newest first (default: 50, max 500).
+    """
+    try:
+        rows = LOG_INDEX.search(query or None, level or None, float(minutes) * 60, source or None, int(limit))
+    except ValueError as e:
+        return f"Error: {str(e)}"
+    except Exception as e:
+        return f"Error searching logs: {str(e)}"
+    if not rows:
+        sources = ", ".join(s["name"] for s in LOG_INDEX.get_sources()) or "none configured"
+        return f"No matching log lines in the last {minutes} minutes (indexed logs: {sources})."
+    return f"{len(rows)} matching line(s), newest {limit} at most:\n" + format_log_lines(rows)
+
 def make_http_request(url: str, method: str = "GET"):
     """
     Makes an HTTP request to a specific URL.
@@ -227,26 +371,19 @@ def propose_fix_script(script_content: str, description: str):
     """
     request_id = str(uuid.uuid4())[:8]
     
-    PENDING_ACTIONS[request_id] = {
+    request = APPROVALS.add({
         "id": request_id,
         "tool": "execute_script",
         "status": "PENDING",
         "timestamp": datetime.now().strftime("%H:%M:%S"),
         "description": f"Run Script: {description}",
         "content": script_content # Store content for review
-    }
+    })
+    EVENTS.publish("approvals", request)
     
     # Notify Discord
     dashboard_url = f"{os.getenv('FRONTEND_URL')}/?tab=approvals"
-    discord_payload = {
-        "content": f"🐍 **SCRIPT PROPOSAL**\nAI Agent wants to run a Python script.\nReason: {description}\n\n[OPEN APPROVALS DASHBOARD]({dashboard_url})"
-    }
-    try:
-        webhooks = get_discord_webhooks()
-        for webhook in webhooks:
-            requests.post(webhook, json=discord_payload)
-    except:
-        pass
+    NOTIFIER.notify(f"🐍 **SCRIPT PROPOSAL**\nAI Agent wants to run a Python script.\nReason: {description}\n\n[OPEN APPROVALS DASHBOARD]({dashboard_url})")
 
     return f"ACTION PAUSED [AWAITING_APPROVAL]. Script proposed. Request ID: {request_id}. Notify the user to check the Approvals Tab to review and run the script."
 
@@ -254,6 +391,10 @@ def propose_fix_script(script_content: str, description: str):
 tools_list = [
     list_files, 
     read_file, 
+    read_file_lines,
+    read_file_bytes,
+    tail_file,
+    search_file,
     write_file, 
     delete_file,
     check_payment_gateway_metrics, 
@@ -261,6 +402,8 @@ tools_list = [
     send_discord_alert,
     run_terminal_command,
     get_system_resources,
+    get_metric_history,
+    search_logs,
     make_http_request,
     propose_fix_script
 ]
\ No newline at end of file
@@ -48,10 +48,20 @@ export default function Dashboard() {
   const [scriptRequestId, setScriptRequestId] = useState(""); // Track Request ID
   const [scriptContent, setScriptContent] = useState("");
 
+  // One agent conversation per browser tab
+  const conversationId = useRef("");
+
   useEffect(() => {
     setMounted(true);
     const storedToken = localStorage.getItem("token");
     if (storedToken) setToken(storedToken);
+
+    let storedConversation = sessionStorage.getItem("conversationId");
+    if (!storedConversation) {
+      storedConversation = crypto.randomUUID();
+      sessionStorage.setItem("conversationId", storedConversation);
+    }
+    conversationId.current = storedConversation;
   }, []);
 
 
@@ -148,30 +158,65 @@ export default function Dashboard() {
   const fetchApprovals = useCallback(async () => {
     if (!token) return;
     try {
-      const res = await authFetch("/approvals");
+      const res = await authFetch("/approvals?status=PENDING&limit=200");
       if (res.ok) {
         const data = await res.json();
-        const pending = data.requests.filter((r: { status: string }) => r.status === "PENDING");
-        setPendingRequests(pending);
+        setPendingRequests(data.requests);
       }
     } catch (e) { }
   }, [authFetch, token]);
 
+  // Approved commands/scripts run as background jobs: tail their output into the logs
+  const followJob = useCallback((jobId: string) => {
+    if (!token) return;
+    setLogs((prev) => [...prev, `> SYSTEM: Job ${jobId} started.`]);
+    const stream = new EventSource(`${API_URL}/jobs/${jobId}/stream?token=${encodeURIComponent(token)}`);
+    stream.onmessage = (e) => {
+      setLogs((prev) => [...prev, e.data]);
+    };
+    stream.addEventListener("done", (e) => {
+      const job = JSON.parse((e as MessageEvent).data);
+      setLogs((prev) => [...prev, `> SYSTEM: Job ${jobId} ${job.status} (exit code ${job.returncode ?? "n/a"}).`]);
+      stream.close();
+    });
+    stream.onerror = () => {
+      stream.close();
+    };
+  }, [token]);
+
   useEffect(() => {
     if (!token) return;
 
-    fetchFiles();
-    fetchMetrics();
-    fetchApprovals();
+    // One push channel instead of polling. Resync everything on every (re)connect.
+    const events = new EventSource(`${API_URL}/events?token=${encodeURIComponent(token)}`);
 
-    const interval = setInterval(() => {
+    events.onopen = () => {
       fetchFiles();
       fetchMetrics();
       fetchApprovals();
-    }, 2000);
+    };
+
+    events.addEventListener("monitors", (e) => {
+      const changed = JSON.parse((e as MessageEvent).data);
+      // eslint-disable-next-line @typescript-eslint/no-explicit-any
+      setMetrics((prev: any) => ({ ...(prev || {}), ...changed }));
+    });
+
+    events.addEventListener("approvals", (e) => {
+      const request = JSON.parse((e as MessageEvent).data);
+      setPendingRequests((prev) => {
+        const others = prev.filter((r) => r.id !== request.id);
+        return request.status === "PENDING" ? [...others, request] : others;
+      });
+    });
+
+    events.addEventListener("files", (e) => {
+      const data = JSON.parse((e as MessageEvent).data);
+      setFiles(data.files || []);
+    });
 
-    return () => clearInterval(interval);
-  }, [token, fetchFiles, fetchMetrics, fetchApprovals]);
+    return () => events.close();
+  }, [token, API_URL, fetchFiles, fetchMetrics, fetchApprovals]);
 
   useEffect(() => {
     const params = new URLSearchParams(window.location.search);
@@ -261,9 +306,12 @@ export default function Dashboard() {
     // RESET THE BUFFER FOR NEW COMMAND
     responseBuffer.current = "";
 
-    const eventSource = new EventSource(
-      `${API_URL}/stream-test?prompt=${encodeURIComponent(commandToSend)}`
-    );
+    const params = new URLSearchParams({
+      prompt: commandToSend,
+      token: token || "",
+      conversation_id: conversationId.current,
+    });
+    const eventSource = new EventSource(`${API_URL}/stream-test?${params}`);
 
     eventSource.onmessage = (event) => {
       const cleanData = event.data;
@@ -443,7 +491,7 @@ export default function Dashboard() {
           </div>
 
         </div>
-        <RunbookUpload />
+        <RunbookUpload authFetch={authFetch} />
       </div>
 
       {/* CENTER PANEL */}
@@ -655,7 +703,9 @@ export default function Dashboard() {
                     <div className="flex gap-2">
                       <button
                         onClick={async () => {
-                          await authFetch(`/approvals/${req.id}/approve`, { method: "POST" });
+                          const res = await authFetch(`/approvals/${req.id}/approve`, { method: "POST" });
+                          const data = await res.json();
+                          if (data.job_id) followJob(data.job_id);
                           fetchApprovals(); // Refresh list
                         }}
                         className="flex-1 bg-green-700 hover:bg-green-600 text-white text-xs py-1 rounded font-bold"
@@ -797,7 +847,8 @@ export default function Dashboard() {
 
             if (res.ok) {
               const data = await res.json();
-              setLogs(prev => [...prev, `> SYSTEM: Script executed. Output:\n${data.result}`]);
+              if (data.error) throw new Error(data.error);
+              followJob(data.job_id);
               fetchApprovals(); // Clear the request from list
             } else {
               const data = await res.json();
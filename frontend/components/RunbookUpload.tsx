@@ -1,9 +1,25 @@
 "use client";
 import { useState } from "react";
-import { Upload, CheckCircle, Loader2 } from "lucide-react";
-
-export default function RunbookUpload() {
-  const [status, setStatus] = useState<"idle" | "uploading" | "done">("idle");
+import { Upload, CheckCircle, Loader2, XCircle } from "lucide-react";
+
+interface RunbookUploadProps {
+  authFetch: (url: string, options?: RequestInit) => Promise<Response>;
+}
+
+export default function RunbookUpload({ authFetch }: RunbookUploadProps) {
+  const [status, setStatus] = useState<"idle" | "uploading" | "done" | "failed">("idle");
+
+  // Ingestion runs in the background on the server: poll its status until it settles
+  const waitForRunbook = async (id: string) => {
+    while (true) {
+      await new Promise((resolve) => setTimeout(resolve, 2000));
+      const res = await authFetch(`/runbooks/${id}`);
+      if (!res.ok) throw new Error("Runbook status unavailable");
+      const data = await res.json();
+      if (data.status === "ACTIVE") return;
+      if (data.status === "FAILED") throw new Error(data.error || "Indexing failed");
+    }
+  };
 
   const handleUpload = async (e: React.ChangeEvent<HTMLInputElement>) => {
     if (!e.target.files?.[0]) return;
@@ -12,17 +28,18 @@ export default function RunbookUpload() {
     const formData = new FormData();
     formData.append("file", e.target.files[0]);
 
-    const API_URL = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
-
     try {
-      await fetch(`${API_URL}/upload-runbook`, {
+      const res = await authFetch("/upload-runbook", {
         method: "POST",
         body: formData,
       });
+      if (!res.ok) throw new Error("Upload failed");
+      const data = await res.json();
+      if (data.status !== "indexed") await waitForRunbook(data.id);
       setStatus("done");
     } catch (err) {
       console.error(err);
-      setStatus("idle");
+      setStatus("failed");
     }
   };
 
@@ -36,7 +53,8 @@ export default function RunbookUpload() {
         {status === "idle" && <><Upload size={16} className="text-green-600 group-hover:text-green-400" /> <span className="text-green-500">UPLOAD RUNBOOK</span></>}
         {status === "uploading" && <><Loader2 size={16} className="animate-spin text-green-400" /> <span className="text-green-400">INDEXING...</span></>}
         {status === "done" && <><CheckCircle size={16} className="text-green-400" /> <span className="text-green-400 font-bold">ACTIVE</span></>}
+        {status === "failed" && <><XCircle size={16} className="text-red-500" /> <span className="text-red-500">FAILED - RETRY</span></>}
       </label>
     </div>
   );
-}
\ No newline at end of file
+}
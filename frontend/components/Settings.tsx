@@ -7,7 +7,7 @@ interface SettingsProps {
 }
 
 export default function Settings({ authFetch }: SettingsProps) {
-    const [config, setConfig] = useState<{ monitors: { name: string; command: string }[]; discord_webhooks: string[] }>({ monitors: [], discord_webhooks: [] });
+    const [config, setConfig] = useState<{ monitors: { name: string; command?: string; type?: string }[]; discord_webhooks: string[]; log_files?: (string | { path: string; name?: string })[] }>({ monitors: [], discord_webhooks: [] });
     const [loading, setLoading] = useState(true);
     const [saving, setSaving] = useState(false);
     const { showToast } = useToast();
@@ -33,7 +33,12 @@ export default function Settings({ authFetch }: SettingsProps) {
                 headers: { "Content-Type": "application/json" },
                 body: JSON.stringify(config),
             });
-            if (!res.ok) throw new Error("Failed to save");
+            if (!res.ok) {
+                // 400: e.g. a monitor's rules do not compile
+                const body = await res.json().catch(() => null);
+                showToast(body?.detail || "Failed to save configuration.", "error");
+                return;
+            }
             showToast("Configuration saved!", "success");
         } catch (err) {
             console.error("Failed to save config", err);
@@ -128,7 +133,7 @@ export default function Settings({ authFetch }: SettingsProps) {
                 </div>
 
                 <div className="space-y-4">
-                    {config.monitors.map((monitor: { name: string; command: string }, index: number) => (
+                    {config.monitors.map((monitor: { name: string; command?: string; type?: string }, index: number) => (
                         <div key={index} className="flex gap-4 items-start bg-black/40 p-3 rounded border border-green-900/30">
                             <div className="flex-1">
                                 <label className="block text-xs text-green-700 mb-1">Name</label>
@@ -140,13 +145,25 @@ export default function Settings({ authFetch }: SettingsProps) {
                                 />
                             </div>
                             <div className="flex-[2]">
-                                <label className="block text-xs text-green-700 mb-1">Command</label>
-                                <input
-                                    type="text"
-                                    value={monitor.command}
-                                    onChange={(e) => updateMonitor(index, "command", e.target.value)}
-                                    className="w-full bg-black border border-green-900 rounded p-1 text-sm text-green-400 font-mono"
-                                />
+                                {monitor.type ? (
+                                    <>
+                                        {/* Native checks are configured in config.json */}
+                                        <label className="block text-xs text-green-700 mb-1">Native Check</label>
+                                        <div className="w-full bg-black border border-green-900/50 rounded p-1 text-sm text-green-600 font-mono">
+                                            {monitor.type}
+                                        </div>
+                                    </>
+                                ) : (
+                                    <>
+                                        <label className="block text-xs text-green-700 mb-1">Command</label>
+                                        <input
+                                            type="text"
+                                            value={monitor.command}
+                                            onChange={(e) => updateMonitor(index, "command", e.target.value)}
+                                            className="w-full bg-black border border-green-900 rounded p-1 text-sm text-green-400 font-mono"
+                                        />
+                                    </>
+                                )}
                             </div>
                             <button
                                 onClick={() => removeMonitor(index)}